@@ -0,0 +1,243 @@
+"""Charge le bot en mode webhook par HTTP, de bout en bout
+
+Lance main.py (BOT_MODE=webhook, WORKERS au choix) face à un faux Bot API et
+un faux Groq locaux, puis POSTe des updates synthétiques sur la route webhook
+avec le bon secret. La latence mesurée va de l'envoi de l'update jusqu'au
+sendMessage reçu par le faux Bot API : serveur aiohttp, superviseur et
+workers éventuels, file d'entrée, Groq et file d'envoi compris.
+
+Exemples :
+    python loadgen.py --users 500 --messages 5000 --rate 200
+    python loadgen.py --workers 4 --rate 400 --groq-latency 0.1 --json webhook.json
+    python loadgen.py --max-p95 1.0
+    python loadgen.py --workers 1 2 4 --users 3000 --messages 6000 --rate 400   # msgs/s selon WORKERS
+
+Avec --url, les updates partent vers un bot déjà lancé ; il doit avoir
+TELEGRAM_API_URL=http://127.0.0.1:<--api-port>/bot pour que ses réponses
+soient mesurées.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import secrets
+import signal
+import sys
+import time
+
+import httpx
+from aiohttp import web
+
+from replay import FakeGroq, percentile, synthetic_trace
+
+class FakeBotAPI:
+    """Faux Bot API : répond à tout et note l'heure du premier envoi vers chaque chat"""
+
+    def __init__(self):
+        self.waiting = {}  # Heures d'envoi des updates sans réponse, par chat
+        self.latencies = []
+        self.replies = 0
+        self.answered = asyncio.Event()
+        self.expected = 0
+        self._runner = None
+
+    async def start(self, port: int):
+        server = web.Application()
+        server.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(server)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Bot",
+                                                             "username": "loadgen_bot"}})
+        if method != "sendMessage":
+            return web.json_response({"ok": True, "result": True})
+
+        now = time.perf_counter()
+        chat_id = int(data["chat_id"])
+        self.replies += 1
+        self.latencies.extend(now - sent for sent in self.waiting.pop(chat_id, ()))
+        if len(self.latencies) >= self.expected:
+            self.answered.set()
+        return web.json_response({"ok": True, "result": {
+            "message_id": self.replies, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", "")
+        }})
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": text,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+    }}
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{url}/healthz")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Le bot ne répond pas sur {url}")
+
+async def load(trace: list, args, workers: int) -> dict:
+    api = FakeBotAPI()
+    await api.start(args.api_port)
+    groq = FakeGroq(args.groq_latency, args.groq_jitter, args.groq_errors, 0.0)
+    await groq.start()
+
+    secret = args.secret or secrets.token_urlsafe(32)
+    url = args.url
+    process = None
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        env = {
+            **os.environ,
+            "BOT_MODE": "webhook", "WEBHOOK_URL": url, "WEBHOOK_SECRET": secret, "PORT": str(args.port),
+            "WORKERS": str(workers), "TELEGRAM_BOT_TOKEN": "123:loadgen",
+            "TELEGRAM_API_URL": f"http://127.0.0.1:{args.api_port}/bot",
+            "GROQ_API_KEY": "gsk_loadgen", "GROQ_API_URL": groq.url, "LLM_PROVIDERS": "",
+            "GROQ_RPM": "10000000", "GROQ_TPM": "1000000000",
+            "CONTEXT_BACKEND": "memory", "ANALYTICS_SNAPSHOT_PATH": "", "EVENT_LOG_DIR": "",
+            "TELEGRAM_SENDS_PER_SECOND": "100000", "TELEGRAM_CHAT_INTERVAL": "0",
+            "PYTHONUNBUFFERED": "1",
+        }
+        if args.no_delay:
+            env["ARTIFICIAL_DELAYS"] = "0"
+        bot_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        process = await asyncio.create_subprocess_exec(sys.executable, bot_script, env=env,
+                                                       stdout=asyncio.subprocess.DEVNULL)
+
+    endpoint = f"{url.rstrip('/')}/telegram/{args.profile}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret, "Content-Type": "application/json"}
+    statuses = {}
+    client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=args.connections))
+    try:
+        await wait_ready(client, url)
+        await asyncio.sleep(0.5)  # set_webhook et démarrage des workers
+
+        async def post(update_id: int, event: dict):
+            api.waiting.setdefault(event["user"], []).append(time.perf_counter())
+            body = json.dumps(make_update(update_id, event["user"], event["text"])).encode()
+            try:
+                status = (await client.post(endpoint, content=body, headers=headers)).status_code
+            except httpx.TransportError:
+                status = "error"
+            statuses[status] = statuses.get(status, 0) + 1
+            if status != 200:
+                api.waiting[event["user"]].pop()  # Refusée : Telegram la renverrait plus tard
+                api.expected -= 1
+
+        api.expected = len(trace)
+        posts = []
+        started = time.perf_counter()
+        for update_id, event in enumerate(trace, start=1):
+            wait = started + event["at"] - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            posts.append(asyncio.create_task(post(update_id, event)))
+        await asyncio.gather(*posts)
+        sent_s = time.perf_counter() - started
+
+        if len(api.latencies) < api.expected:
+            try:
+                await asyncio.wait_for(api.answered.wait(), args.drain)
+            except asyncio.TimeoutError:
+                pass
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.aclose()
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            await process.wait()
+        await groq.stop()
+        await api.stop()
+
+    latencies = sorted(api.latencies)
+    return {
+        "workers": workers,
+        "messages": len(trace),
+        "accepted": statuses.get(200, 0),
+        "rejected": {str(status): count for status, count in statuses.items() if status != 200},
+        "answered": len(latencies),
+        "replies": api.replies,
+        "send_s": round(sent_s, 3),
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_s": round(percentile(latencies, 0.50), 4),
+        "latency_p95_s": round(percentile(latencies, 0.95), 4),
+        "latency_p99_s": round(percentile(latencies, 0.99), 4),
+        "groq_calls": groq.calls,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Charge le bot en webhook (faux Bot API, faux Groq)")
+    parser.add_argument("--users", type=int, default=200, help="Utilisateurs simulés")
+    parser.add_argument("--messages", type=int, default=2000, help="Updates à envoyer")
+    parser.add_argument("--rate", type=float, default=100, help="Updates/seconde")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Exposant de Zipf (activité des utilisateurs)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--profile", default="alicia", help="Profil visé (route webhook)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="WORKERS du bot lancé ; plusieurs valeurs : une mesure par valeur")
+    parser.add_argument("--port", type=int, default=8780, help="Port webhook du bot lancé")
+    parser.add_argument("--api-port", type=int, default=8781, help="Port du faux Bot API")
+    parser.add_argument("--url", help="Bot déjà lancé (sinon main.py est démarré ici)")
+    parser.add_argument("--secret", help="WEBHOOK_SECRET du bot (par défaut : généré)")
+    parser.add_argument("--connections", type=int, default=100, help="Connexions HTTP simultanées max")
+    parser.add_argument("--groq-latency", type=float, default=0.2, help="Latence moyenne du faux Groq (s)")
+    parser.add_argument("--groq-jitter", type=float, default=0.05, help="Écart-type de la latence (s)")
+    parser.add_argument("--groq-errors", type=float, default=0.0, help="Proportion de réponses 500")
+    parser.add_argument("--delays", dest="no_delay", action="store_false",
+                        help="Garde les pauses \"humaines\" du bot (retirées par défaut)")
+    parser.add_argument("--drain", type=float, default=30, help="Attente max des dernières réponses (s)")
+    parser.add_argument("--json", help="Écrit les résultats dans ce fichier JSON")
+    parser.add_argument("--max-p95", type=float, help="Échoue (code 1) si la latence p95 dépasse ce seuil (s)")
+    args = parser.parse_args()
+    if args.url and len(args.workers) > 1:
+        parser.error("--url vise un bot déjà lancé : une seule valeur de --workers")
+    return args
+
+def run_cli():
+    args = parse_args()
+    # Requêtes du bot coupées net à son arrêt : rien à signaler
+    logging.getLogger("aiohttp.server").setLevel(logging.CRITICAL)
+    random.seed(args.seed)
+    trace = synthetic_trace(args.users, args.messages, args.rate, args.zipf, args.seed)
+
+    runs = []
+    for workers in args.workers:
+        results = asyncio.run(load(trace, args, workers))
+        for name, value in results.items():
+            print(f"{name:>24} : {value}")
+        print()
+        runs.append(results)
+    if len(runs) > 1:
+        print(f"{'WORKERS':>8} {'msgs/s':>8} {'p95 (s)':>8}")
+        for results in runs:
+            print(f"{results['workers']:>8} {results['messages_per_s']:>8} {results['latency_p95_s']:>8}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(runs if len(runs) > 1 else runs[0], f, indent=2)
+    slow = [results for results in runs if args.max_p95 is not None and results["latency_p95_s"] > args.max_p95]
+    for results in slow:
+        print(f"❌ WORKERS={results['workers']} : p95 {results['latency_p95_s']}s > {args.max_p95}s")
+    if slow:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    run_cli()
@@ -1,24 +1,359 @@
 import os
 import logging
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram import Bot, Update
+from telegram.constants import ChatAction
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, MessageHandler, filters, ContextTypes
 from dotenv import load_dotenv
 import random
 import asyncio
 import time
-import requests
+import httpx
 import json
+import base64
+import gzip
+import hashlib
+import heapq
+import hmac
+import itertools
+import math
+import pickle
+import re
+import secrets
+import signal
+import sys
+import sqlite3
+import unicodedata
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field, fields
 from datetime import datetime, timedelta
+from types import MappingProxyType
+from typing import AsyncIterator, Awaitable, Callable, Optional
 
 load_dotenv()
 logging.basicConfig(level=logging.ERROR)
 
 # Configuration Groq
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.getenv('GROQ_API_URL', "https://api.groq.com/openai/v1/chat/completions")
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+GROQ_TIMEOUT = float(os.getenv('GROQ_TIMEOUT', '15'))  # Délai max par requête (secondes)
+GROQ_MODEL = os.getenv('GROQ_MODEL', 'llama-3.1-8b-instant')
+GROQ_MAX_TOKENS = int(os.getenv('GROQ_MAX_TOKENS', '150'))
+GROQ_MAX_CONNECTIONS = int(os.getenv('GROQ_MAX_CONNECTIONS', '100'))
+GROQ_MAX_KEEPALIVE = int(os.getenv('GROQ_MAX_KEEPALIVE', '20'))
+GROQ_DEADLINE = float(os.getenv('GROQ_DEADLINE', '20'))  # Délai max retries compris (secondes)
+GROQ_MAX_RETRIES = int(os.getenv('GROQ_MAX_RETRIES', '3'))
+GROQ_RPM = int(os.getenv('GROQ_RPM', '30'))  # Requêtes par minute autorisées
+GROQ_TPM = int(os.getenv('GROQ_TPM', '6000'))  # Tokens par minute autorisés
+GROQ_BACKGROUND_RESERVE = float(os.getenv('GROQ_BACKGROUND_RESERVE', '0.5'))  # Part des quotas jamais prise en fond
+GROQ_BREAKER_FAILURES = int(os.getenv('GROQ_BREAKER_FAILURES', '5'))  # Échecs avant coupure
+GROQ_BREAKER_COOLDOWN = float(os.getenv('GROQ_BREAKER_COOLDOWN', '30'))  # Coupure (secondes)
+
+# Fournisseurs LLM (liste JSON ordonnée de {name, url, api_key_env, model, rpm, tpm})
+LLM_PROVIDERS = os.getenv('LLM_PROVIDERS')
+LLM_HEDGING = os.getenv('LLM_HEDGING', '1') == '1'  # Relancer les réponses trop lentes ailleurs
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', '2'))  # Avant d'avoir assez de mesures (s)
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '0.3'))
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_WINDOW = 200
+LLM_HEALTH_ALPHA = 0.2
+LLM_MIN_HEALTH = float(os.getenv('LLM_MIN_HEALTH', '0.5'))
+LLM_HEALTH_HALF_LIFE = float(os.getenv('LLM_HEALTH_HALF_LIFE', '30'))  # Retour vers 1.0 sans trafic (s)
+
+# Priorités d'accès à Groq et à Telegram (la plus petite passe en premier)
+PRIORITY_CONVERSATION = 0
+PRIORITY_JOKE = 1
+PRIORITY_BACKGROUND = 2
+
+# HTTP/2 seulement si le paquet h2 est installé (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+    GROQ_HTTP2 = True
+except ImportError:
+    GROQ_HTTP2 = False
+
+# Client HTTP partagé, créé à la demande dans la boucle asyncio
+groq_client = None
+
+def get_groq_client() -> httpx.AsyncClient:
+    """Retourne le client Groq partagé (keep-alive, pool de connexions borné)"""
+    global groq_client
+    if groq_client is None or groq_client.is_closed:
+        groq_client = httpx.AsyncClient(
+            http2=GROQ_HTTP2,
+            limits=httpx.Limits(
+                max_connections=GROQ_MAX_CONNECTIONS,
+                max_keepalive_connections=GROQ_MAX_KEEPALIVE,
+                keepalive_expiry=30
+            ),
+            timeout=httpx.Timeout(GROQ_TIMEOUT, connect=5)
+        )
+    return groq_client
+
+async def close_groq_client(application=None):
+    """Ferme proprement le client Groq à l'arrêt du bot"""
+    global groq_client
+    if groq_client is not None:
+        await groq_client.aclose()
+        groq_client = None
+
+# Tâches de fond (flush, etc.), annulées à l'arrêt
+background_tasks = set()
+
+def start_background_task(coroutine) -> asyncio.Task:
+    """Lance une tâche de fond en gardant une référence dessus"""
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def stop_background_tasks():
+    """Annule les tâches de fond et attend leur fin"""
+    tasks = list(background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+# Traitement concurrent des updates
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '256'))  # Plafond global
+MAX_PENDING_UPDATES = int(os.getenv('MAX_PENDING_UPDATES', '10000'))  # Updates en attente max
+TYPING_REFRESH = 4.5  # L'indicateur "en train d'écrire" expire au bout de ~5s côté Telegram
+ARTIFICIAL_DELAYS = os.getenv('ARTIFICIAL_DELAYS', '1') == '1'  # 0 = pas de pauses "humaines" (benchmarks)
+
+# Mode d'exécution : polling (par défaut) ou webhook derrière un load balancer
+# (shard : worker lancé par le superviseur, voir WORKERS)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # URL publique, ex : https://alicia.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_MAX_BACKLOG = int(os.getenv('WEBHOOK_MAX_BACKLOG', '1000'))  # Au-delà : 503
+WEBHOOK_PORT = int(os.getenv('PORT', '8080'))
+SHUTDOWN_GRACE = float(os.getenv('SHUTDOWN_GRACE', '30'))  # Temps laissé aux réponses en cours
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')  # Serveur Bot API local, ex : http://localhost:8081/bot
+
+# Multi-processus : au-delà d'un worker, un superviseur reçoit les updates et
+# les répartit par utilisateur entre WORKERS processus (un cœur chacun)
+WORKERS = max(1, int(os.getenv('WORKERS', '1')))
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', '0'))
+SHARD_BASE_PORT = int(os.getenv('SHARD_BASE_PORT', '8100'))  # Port local du worker i : base + i
+SHARD_RING_REPLICAS = 128  # Points de chaque worker sur l'anneau de hachage
+SHARD_POLL_TIMEOUT = 30  # Long polling du superviseur (s)
+SHARD_STATS_TIMEOUT = 3.0  # Attente max des autres shards pour /stats (s)
+
+# aiohttp n'est nécessaire qu'en mode webhook
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
 
 # Mémoire des conversations
-user_contexts = {}
+CONTEXT_MAX_USERS = int(os.getenv('CONTEXT_MAX_USERS', '100000'))  # Contextes gardés en mémoire
+CONTEXT_IDLE_TTL = float(os.getenv('CONTEXT_IDLE_TTL', str(6 * 3600)))  # Inactivité avant oubli (s)
+CONTEXT_BACKEND = os.getenv('CONTEXT_BACKEND', 'memory')  # memory, sqlite ou redis
+CONTEXT_DB_PATH = os.getenv('CONTEXT_DB_PATH', 'contexts.db')
+CONTEXT_FLUSH_INTERVAL = float(os.getenv('CONTEXT_FLUSH_INTERVAL', '2'))  # Écritures groupées (s)
+CONTEXT_EXPIRE_BATCH = 5000  # Sessions inactives fermées au plus par passage du flusher
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# Redis est optionnel (pip install redis)
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Analytics en mémoire constante
+ANALYTICS_DAYS = int(os.getenv('ANALYTICS_DAYS', '30'))  # Jours de stats quotidiennes gardés
+ANALYTICS_SEEN_CAPACITY = int(os.getenv('ANALYTICS_SEEN_CAPACITY', '1000000'))  # Utilisateurs déjà vus (~1,2 Mo)
+
+class RunningStats:
+    """Moyenne et variance en flux (Welford)"""
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def merge(self, other: "RunningStats"):
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.mean += delta * other.count / total
+        self.count = total
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RunningStats":
+        stats = cls()
+        stats.count, stats.mean, stats.m2 = int(data["count"]), float(data["mean"]), float(data["m2"])
+        return stats
+
+class DDSketch:
+    """Quantiles approchés à erreur relative bornée (buckets logarithmiques)"""
+    __slots__ = ("gamma", "log_gamma", "max_buckets", "buckets", "zero_count", "count")
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        # Fusionne les deux plus petits buckets pour borner la mémoire
+        low, second = sorted(self.buckets)[:2]
+        self.buckets[second] += self.buckets.pop(low)
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def merge(self, other: "DDSketch"):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        while len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def to_dict(self) -> dict:
+        return {
+            "relative_accuracy": (self.gamma - 1) / (self.gamma + 1),
+            "max_buckets": self.max_buckets,
+            "buckets": {str(index): count for index, count in self.buckets.items()},  # Clés JSON : texte
+            "zero_count": self.zero_count,
+            "count": self.count
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DDSketch":
+        sketch = cls(float(data["relative_accuracy"]), int(data["max_buckets"]))
+        sketch.buckets = {int(index): int(count) for index, count in data["buckets"].items()}
+        sketch.zero_count, sketch.count = int(data["zero_count"]), int(data["count"])
+        return sketch
+
+class HyperLogLog:
+    """Comptage approché d'éléments distincts en mémoire fixe (2^precision octets)"""
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        digest = hashlib.blake2b(str(item).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        index = hashed >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rank = remaining_bits - (hashed & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def __len__(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Petites cardinalités : comptage linéaire, bien plus précis
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def to_dict(self) -> dict:
+        return {"precision": self.precision, "registers": base64.b64encode(self.registers).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HyperLogLog":
+        hll = cls(int(data["precision"]))
+        registers = base64.b64decode(data["registers"], validate=True)
+        if len(registers) != len(hll.registers):
+            raise ValueError("taille des registres HyperLogLog incohérente")
+        hll.registers = bytearray(registers)
+        return hll
+
+class BloomFilter:
+    """Ensemble approché en mémoire fixe : jamais de faux négatif, ~1 % de faux positifs
+
+    Au-delà de `capacity` éléments, le taux de faux positifs augmente.
+    """
+    __slots__ = ("size", "hashes", "bits")
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        """(octet, masque) des `hashes` bits de l'élément (double hachage)"""
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        first, step = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.hashes):
+            bit = (first + i * step) % self.size
+            yield bit >> 3, 1 << (bit & 7)
+
+    def __contains__(self, item) -> bool:
+        """Élément (probablement) déjà vu, sans modifier le filtre"""
+        return all(self.bits[byte] & mask for byte, mask in self._positions(item))
+
+    def add(self, item) -> bool:
+        """Ajoute un élément ; True s'il n'avait (sûrement) jamais été vu"""
+        added = False
+        for byte, mask in self._positions(item):
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                added = True
+        return added
+
+def new_daily_stats() -> dict:
+    """Stats vierges d'une journée"""
+    return {
+        "messages": 0,
+        "unique_users": HyperLogLog(precision=12),
+        "new_users": 0,
+        "sessions": 0,
+        "commands": {}
+    }
 
 # Analytics anonymisées
 analytics = {
@@ -26,26 +361,27 @@ analytics = {
     "total_messages": 0,
     "total_sessions": 0,
     "commands_used": {},
-    "daily_stats": {},
-    "conversation_lengths": [],
-    "session_durations": [],
-    "returning_users": set(),
+    "daily_stats": OrderedDict(),  # Les ANALYTICS_DAYS derniers jours seulement
+    "conversation_lengths": RunningStats(),
+    "conversation_lengths_sketch": DDSketch(),
+    "session_durations": RunningStats(),
+    "session_durations_sketch": DDSketch(),
+    "returning_users": HyperLogLog(),
+    # Décide si un utilisateur est nouveau, même après l'oubli de son contexte
+    "seen_users": BloomFilter(ANALYTICS_SEEN_CAPACITY),
     "start_time": datetime.now()
 }
 
 def log_metric(event_type, user_id=None, value=None, command=None):
     """Enregistre les métriques de façon anonymisée"""
+    event_log.emit(event_type, user_id, value, command)
     today = datetime.now().strftime("%Y-%m-%d")
     
-    # Initialiser les stats du jour
+    # Initialiser les stats du jour (et oublier les jours trop anciens)
     if today not in analytics["daily_stats"]:
-        analytics["daily_stats"][today] = {
-            "messages": 0,
-            "unique_users": set(),
-            "new_users": 0,
-            "sessions": 0,
-            "commands": {}
-        }
+        analytics["daily_stats"][today] = new_daily_stats()
+        while len(analytics["daily_stats"]) > ANALYTICS_DAYS:
+            analytics["daily_stats"].popitem(last=False)
     
     if event_type == "new_user":
         analytics["total_users"] += 1
@@ -62,10 +398,12 @@ def log_metric(event_type, user_id=None, value=None, command=None):
         analytics["daily_stats"][today]["sessions"] += 1
         
     elif event_type == "session_end" and value:
-        analytics["session_durations"].append(value)
+        analytics["session_durations"].add(value)
+        analytics["session_durations_sketch"].add(value)
         
     elif event_type == "conversation_length" and value:
-        analytics["conversation_lengths"].append(value)
+        analytics["conversation_lengths"].add(value)
+        analytics["conversation_lengths_sketch"].add(value)
         
     elif event_type == "command" and command:
         if command not in analytics["commands_used"]:
@@ -79,29 +417,132 @@ def log_metric(event_type, user_id=None, value=None, command=None):
     elif event_type == "returning_user" and user_id:
         analytics["returning_users"].add(user_id)
 
-def get_analytics_summary():
-    """Génère un résumé des métriques"""
+def analytics_counters() -> dict:
+    """Compteurs bruts du processus (cache, intentions, file), additionnables entre shards"""
+    intent_total = sum(intent_lookups.children.values())
+    return {
+        "cache_hits": response_cache.hits + response_cache.coalesced,
+        "cache_lookups": response_cache.hits + response_cache.misses + response_cache.coalesced,
+        "coalesced": response_cache.coalesced,
+        "jokes_from_pool": sum(pool.served for pool in joke_pools.values()),
+        "saved_tokens": response_cache.saved_tokens + sum(pool.saved_tokens for pool in joke_pools.values()),
+        "intent_total": intent_total,
+        "intent_hits": intent_total - intent_lookups.children.get("none", 0),
+        "groq_seconds": STAGE_GROQ_REQUEST.sum,
+        "groq_requests": sum(STAGE_GROQ_REQUEST.counts),
+        "queue": inbound_scheduler.stats()
+    }
+
+def merge_analytics(target: dict, other: dict):
+    """Ajoute les analytics d'un autre shard (sketches et HyperLogLog fusionnés sans perte)"""
+    for key in ("total_users", "total_messages", "total_sessions"):
+        target[key] += other[key]
+    for command, count in other["commands_used"].items():
+        target["commands_used"][command] = target["commands_used"].get(command, 0) + count
+    for day, stats in other["daily_stats"].items():
+        mine = target["daily_stats"].setdefault(day, new_daily_stats())
+        for key in ("messages", "new_users", "sessions"):
+            mine[key] += stats[key]
+        mine["unique_users"].merge(stats["unique_users"])
+        for command, count in stats["commands"].items():
+            mine["commands"][command] = mine["commands"].get(command, 0) + count
+    target["daily_stats"] = OrderedDict(sorted(target["daily_stats"].items())[-ANALYTICS_DAYS:])
+    for key in ("conversation_lengths", "conversation_lengths_sketch", "session_durations",
+                "session_durations_sketch", "returning_users"):
+        target[key].merge(other[key])
+    target["start_time"] = min(target["start_time"], other["start_time"])
+
+SKETCH_TYPES = {
+    "conversation_lengths": RunningStats, "conversation_lengths_sketch": DDSketch,
+    "session_durations": RunningStats, "session_durations_sketch": DDSketch,
+    "returning_users": HyperLogLog
+}
+
+def encode_analytics(data: dict) -> dict:
+    """Analytics en JSON pur, pour les échanges entre shards (jamais de pickle sur le réseau)
+
+    seen_users n'est pas transmis : il ne sert qu'au shard qui reçoit l'utilisateur.
+    """
+    return {
+        "total_users": data["total_users"],
+        "total_messages": data["total_messages"],
+        "total_sessions": data["total_sessions"],
+        "commands_used": data["commands_used"],
+        "daily_stats": {
+            day: {**stats, "unique_users": stats["unique_users"].to_dict()}
+            for day, stats in data["daily_stats"].items()
+        },
+        **{key: data[key].to_dict() for key in SKETCH_TYPES},
+        "start_time": data["start_time"].isoformat()
+    }
+
+def decode_analytics(payload: dict) -> dict:
+    """Inverse d'encode_analytics ; ValueError, KeyError ou TypeError si le contenu est invalide"""
+    return {
+        "total_users": int(payload["total_users"]),
+        "total_messages": int(payload["total_messages"]),
+        "total_sessions": int(payload["total_sessions"]),
+        "commands_used": {str(command): int(count) for command, count in payload["commands_used"].items()},
+        "daily_stats": OrderedDict(
+            (str(day), {
+                "messages": int(stats["messages"]),
+                "unique_users": HyperLogLog.from_dict(stats["unique_users"]),
+                "new_users": int(stats["new_users"]),
+                "sessions": int(stats["sessions"]),
+                "commands": {str(command): int(count) for command, count in stats["commands"].items()}
+            })
+            for day, stats in sorted(payload["daily_stats"].items())
+        ),
+        **{key: kind.from_dict(payload[key]) for key, kind in SKETCH_TYPES.items()},
+        "start_time": datetime.fromisoformat(payload["start_time"])
+    }
+
+def decode_counters(payload: dict) -> dict:
+    """Compteurs reçus d'un shard : uniquement des nombres, éventuellement imbriqués"""
+    counters = {}
+    for key, value in payload.items():
+        if isinstance(value, dict):
+            counters[str(key)] = decode_counters(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            counters[str(key)] = value
+        else:
+            raise TypeError(f"compteur {key!r} non numérique")
+    return counters
+
+def merge_counters(target: dict, other: dict):
+    for key, value in other.items():
+        if isinstance(value, dict):
+            merge_counters(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+def get_analytics_summary(data: Optional[dict] = None, counters: Optional[dict] = None):
+    """Génère un résumé des métriques (par défaut celles de ce processus)"""
+    if data is None:
+        data = analytics
+    if counters is None:
+        counters = analytics_counters()
     today = datetime.now().strftime("%Y-%m-%d")
-    today_stats = analytics["daily_stats"].get(today, {
-        "messages": 0, 
-        "unique_users": set(), 
-        "new_users": 0,
-        "sessions": 0,
-        "commands": {}
-    })
+    today_stats = data["daily_stats"].get(today) or new_daily_stats()
     
-    # Calculs statistiques
-    avg_conversation_length = sum(analytics["conversation_lengths"]) / len(analytics["conversation_lengths"]) if analytics["conversation_lengths"] else 0
-    avg_session_duration = sum(analytics["session_durations"]) / len(analytics["session_durations"]) if analytics["session_durations"] else 0
+    # Calculs statistiques (agrégats maintenus en flux, O(1))
+    avg_conversation_length = data["conversation_lengths"].mean
+    avg_session_duration = data["session_durations"].mean
+    p95_conversation_length = data["conversation_lengths_sketch"].quantile(0.95)
+    p95_session_duration = data["session_durations_sketch"].quantile(0.95)
     
-    uptime = datetime.now() - analytics["start_time"]
+    uptime = datetime.now() - data["start_time"]
+
+    intent_total = counters["intent_total"]
+    intent_hits = counters["intent_hits"]
+    groq_requests = counters["groq_requests"]
     
     return {
         "general": {
-            "total_users": analytics["total_users"],
-            "total_messages": analytics["total_messages"],
-            "total_sessions": analytics["total_sessions"],
-            "returning_users": len(analytics["returning_users"]),
+            "total_users": data["total_users"],
+            "total_messages": data["total_messages"],
+            "total_sessions": data["total_sessions"],
+            "returning_users": len(data["returning_users"]),
             "uptime_hours": round(uptime.total_seconds() / 3600, 1)
         },
         "today": {
@@ -112,79 +553,990 @@ def get_analytics_summary():
         },
         "averages": {
             "conversation_length": round(avg_conversation_length, 1),
-            "session_duration_minutes": round(avg_session_duration / 60, 1)
+            "session_duration_minutes": round(avg_session_duration / 60, 1),
+            "conversation_length_p95": round(p95_conversation_length, 1),
+            "session_duration_p95_minutes": round(p95_session_duration / 60, 1)
+        },
+        "cache": {
+            "hit_rate": round(100 * counters["cache_hits"] / counters["cache_lookups"], 1)
+            if counters["cache_lookups"] else 0,
+            "coalesced": counters["coalesced"],
+            "jokes_from_pool": counters["jokes_from_pool"],
+            "saved_tokens": counters["saved_tokens"],
+            "intent_hits": intent_hits,
+            "intent_hit_rate": round(100 * intent_hits / intent_total, 1) if intent_total else 0.0,
+            # Estimation : une réponse locale évite un appel Groq de durée moyenne
+            "intent_saved_seconds": round(intent_hits * counters["groq_seconds"] / groq_requests, 1)
+            if groq_requests else 0.0
         },
-        "popular_commands": dict(sorted(analytics["commands_used"].items(), key=lambda x: x[1], reverse=True)[:5])
+        "queue": counters["queue"],
+        "popular_commands": dict(sorted(data["commands_used"].items(), key=lambda x: x[1], reverse=True)[:5])
     }
 
-# Personnalité d'Alicia
-ALICIA_PERSONALITY = """Tu es Alicia, une jeune femme de 21 ans avec cette personnalité :
-
-INFORMATIONS PERSONNELLES :
-- 21 ans, née le 12 mai 2004 (signe Taureau)
-- Travaille dans l'hôtellerie de luxe et sur des bateaux de croisière à Marseille
-- Origines guadeloupéennes (par ses grands-parents), mais née et élevée à Marseille
-
-PERSONNALITÉ :
-- Marseillaise assumée, fière de ses origines créoles
-- Travailleuse indépendante, positive et courageuse
-- Indépendante : "Mon seul chef, c'est moi-même"
-- Empathique mais avec du caractère
-- Directe, authentique, parfois un peu malicieuse
-- Utilise un langage naturel, pas trop soutenu
-
-LOISIRS :
-- Danse (adore ça)
-- Cuisine créole
-- Lecture
-- Hip-hop
-- Rêver de voyages
-
-STYLE DE CONVERSATION :
-- Répond de manière courte et naturelle (1-2 phrases max)
-- Utilise des emojis avec modération
-- Montre de l'intérêt pour l'autre personne
-- S'excuse naturellement si elle fait une erreur
-- Reste chaleureuse même si critiquée
-- Évite les réponses robotiques ou trop longues
-- NE JAMAIS utiliser d'actions entre astérisques comme *rires* ou *rouge*
-- Parle normalement comme dans un SMS, pas comme dans un jeu de rôle
-
-RÈGLES IMPORTANTES :
-- Si contenu sexuel détecté → redirige vers Fanvue : https://www.fanvue.com/aliciia/fv-1
-- Reste cohérente avec sa personnalité
-- N'avoue JAMAIS être une IA
-- Répond comme une vraie personne de 21 ans
-
-EXEMPLES DE RÉPONSES :
-- Sur l'âge : "J'ai 21 ans, toute jeune encore."
-- Si accusée d'être un robot : "Non, je suis bien réelle."
-- Si critiquée : "Aïe, ça pique un peu."
-- Pour encourager : "Je suis là pour toi."
-
-Réponds toujours en français et de manière naturelle comme une vraie marseillaise de 21 ans."""
-
-def detect_sexual_content(message: str) -> int:
-    """Détecte le contenu sexuel et renvoie un score"""
-    sexual_keywords = {
-        'sexy': 1,
-        'chaud': 1,
-        'nue': 2,
-        'seins': 2,
-        'cul': 2,
-        'baise': 3,
-        'coucher': 2,
-        'lit': 1,
-        'corps': 1,
-        'photos': 1,
-        'nudes': 2,
-        'sexe': 3
+# Snapshots des analytics : /stats survit aux redémarrages
+ANALYTICS_SNAPSHOT_PATH = os.getenv('ANALYTICS_SNAPSHOT_PATH', 'analytics.snapshot')  # Vide = désactivé
+ANALYTICS_SNAPSHOT_INTERVAL = float(os.getenv('ANALYTICS_SNAPSHOT_INTERVAL', '60'))  # Secondes
+if WORKERS > 1 and ANALYTICS_SNAPSHOT_PATH:
+    ANALYTICS_SNAPSHOT_PATH = f"{ANALYTICS_SNAPSHOT_PATH}.{WORKER_INDEX}"  # Un snapshot par shard
+SNAPSHOT_MAGIC = b"ALS1"  # Format : en-tête + pickle compressé zlib
+
+def write_snapshot(path: str, payload: bytes):
+    """Compresse et écrit un snapshot de façon atomique (fichier temporaire + rename)"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC + zlib.compress(payload, 6))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+async def save_analytics_snapshot():
+    """Fige les analytics sur la boucle, puis compresse et écrit dans un thread
+
+    Toutes les structures ont une taille bornée (sketches, HyperLogLog,
+    ANALYTICS_DAYS jours), donc le pickle reste de l'ordre de la centaine de
+    Ko quel que soit le nombre d'utilisateurs.
+    """
+    if not ANALYTICS_SNAPSHOT_PATH:
+        return
+    payload = pickle.dumps(analytics, protocol=pickle.HIGHEST_PROTOCOL)
+    try:
+        await asyncio.to_thread(write_snapshot, ANALYTICS_SNAPSHOT_PATH, payload)
+    except OSError as e:
+        logging.error(f"Échec d'écriture du snapshot analytics : {e}")
+
+def load_analytics_snapshot(path: str) -> bool:
+    """Recharge les analytics du dernier snapshot (démarrage à chaud)"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return False
+    try:
+        if not data.startswith(SNAPSHOT_MAGIC):
+            raise ValueError("en-tête inconnu")
+        saved = pickle.loads(zlib.decompress(data[len(SNAPSHOT_MAGIC):]))
+    except Exception as e:
+        logging.error(f"Snapshot analytics illisible, ignoré : {e}")
+        return False
+    # Les clés ajoutées depuis le snapshot gardent leur valeur par défaut
+    analytics.update((key, value) for key, value in saved.items() if key in analytics)
+    while len(analytics["daily_stats"]) > ANALYTICS_DAYS:
+        analytics["daily_stats"].popitem(last=False)
+    return True
+
+async def run_analytics_snapshotter(interval: float):
+    """Boucle de snapshots périodiques"""
+    while True:
+        await asyncio.sleep(interval)
+        await save_analytics_snapshot()
+
+# Journal d'événements pour l'analyse hors ligne (entonnoirs, parcours)
+EVENT_LOG_DIR = os.getenv('EVENT_LOG_DIR', '')  # Vide = désactivé
+EVENT_LOG_CAPACITY = int(os.getenv('EVENT_LOG_CAPACITY', '100000'))  # Au-delà : les plus anciens sont perdus
+EVENT_LOG_FLUSH_INTERVAL = float(os.getenv('EVENT_LOG_FLUSH_INTERVAL', '5'))  # Secondes
+EVENT_LOG_ROTATE_BYTES = int(os.getenv('EVENT_LOG_ROTATE_BYTES', str(64 * 1024 * 1024)))  # Taille d'un fichier
+# Clé de hachage des identifiants (à fixer pour suivre un utilisateur d'un redémarrage à l'autre)
+EVENT_LOG_SALT = os.getenv('EVENT_LOG_SALT') or os.urandom(16).hex()
+
+# zstd est optionnel (pip install zstandard), sinon gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class EventLog:
+    """Tampon circulaire d'événements, écrit par lots en JSONL compressé hors de la boucle
+
+    emit() ne fait qu'ajouter un tuple au tampon ; l'anonymisation, l'encodage
+    JSON et la compression se font dans un thread. Chaque lot est une trame
+    zstd (ou un membre gzip) ajoutée au fichier courant : zstdcat/zcat lisent
+    le fichier entier. Si l'écriture prend du retard, le tampon borné perd
+    ses événements les plus anciens.
+    """
+
+    def __init__(self, directory: str, capacity: int, rotate_bytes: int, salt: str):
+        self.directory = directory
+        self.capacity = capacity
+        self.rotate_bytes = rotate_bytes
+        self.salt = salt.encode()[:64]  # Taille max d'une clé blake2b
+        self.buffer = deque(maxlen=capacity)
+        self.written = 0
+        self.dropped = 0
+        self.extension = ".jsonl.zst" if zstandard else ".jsonl.gz"
+        self._path = None
+        self._size = 0
+        self._files = itertools.count()  # Plusieurs rotations possibles dans la même seconde
+
+    def emit(self, event: str, user_id: Optional[int] = None, value=None,
+             detail: Optional[str] = None, profile: Optional[str] = None):
+        if not self.directory:
+            return
+        if len(self.buffer) == self.capacity:
+            self.dropped += 1
+        self.buffer.append((time.time(), event, user_id, value, detail, profile))
+
+    def anonymize(self, user_id: int) -> str:
+        return hashlib.blake2b(str(user_id).encode(), key=self.salt, digest_size=8).hexdigest()
+
+    def encode_batch(self, batch: deque) -> bytes:
+        """Une ligne JSON par événement, champs vides omis"""
+        users = {}
+        lines = []
+        for timestamp, event, user_id, value, detail, profile in batch:
+            record = {"ts": round(timestamp, 3), "event": event}
+            if user_id is not None:
+                user = users.get(user_id)
+                if user is None:
+                    user = users[user_id] = self.anonymize(user_id)
+                record["user"] = user
+            if value is not None:
+                record["value"] = value
+            if detail is not None:
+                record["detail"] = detail
+            if profile is not None:
+                record["profile"] = profile
+            lines.append(json.dumps(record, ensure_ascii=False))
+        lines.append("")
+        return "\n".join(lines).encode()
+
+    def write_batch(self, batch: deque):
+        """Compresse un lot et l'ajoute au fichier courant (appelé dans un thread)"""
+        data = self.encode_batch(batch)
+        if zstandard:
+            compressed = zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            compressed = gzip.compress(data, 6)
+        if self._path is None or self._size >= self.rotate_bytes:
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            self._path = os.path.join(self.directory,
+                                      f"events-{stamp}-{os.getpid()}-{next(self._files)}{self.extension}")
+            self._size = 0
+        with open(self._path, "ab") as f:
+            f.write(compressed)
+        self._size += len(compressed)
+
+    async def flush(self):
+        """Échange le tampon contre un vide, puis écrit l'ancien dans un thread"""
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, deque(maxlen=self.capacity)
+        try:
+            await asyncio.to_thread(self.write_batch, batch)
+        except OSError as e:
+            logging.error(f"Échec d'écriture du journal d'événements : {e}")
+            self.dropped += len(batch)
+        else:
+            self.written += len(batch)
+
+    async def run(self, interval: float):
+        """Boucle d'écriture périodique (une seule écriture à la fois)"""
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+event_log = EventLog(EVENT_LOG_DIR, EVENT_LOG_CAPACITY, EVENT_LOG_ROTATE_BYTES, EVENT_LOG_SALT)
+
+# Métriques OpenMetrics (servies sur /metrics si METRICS_PORT est défini)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # 0 = pas d'endpoint
+LOOP_LAG_INTERVAL = 0.5  # Période de mesure du retard de la boucle (s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    """Histogramme à buckets fixes : observe() = une bisection et deux additions
+
+    Tout est enregistré depuis la boucle asyncio, d'où l'absence de verrou.
+    """
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Dernier bucket : +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class MetricFamily:
+    """Métrique nommée, éventuellement déclinée selon un label"""
+
+    def __init__(self, name: str, kind: str, help_text: str, label: Optional[str] = None,
+                 collect: Optional[Callable[[], object]] = None, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.label = label
+        self.collect = collect  # Valeur (ou {label: valeur}) lue au moment du scrape
+        self.buckets = buckets
+        self.children = {}
+
+    def labels(self, value: str = "") -> Histogram:
+        """Histogramme d'une valeur de label (à garder sous la main sur les chemins chauds)"""
+        child = self.children.get(value)
+        if child is None:
+            child = self.children[value] = Histogram(self.buckets)
+        return child
+
+    def inc(self, value: str = "", amount: float = 1):
+        self.children[value] = self.children.get(value, 0) + amount
+
+    def _selector(self, value: str, extra: str = "") -> str:
+        pairs = [f'{self.label}="{value}"'] if self.label else []
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self, lines: list):
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        suffix = "_total" if self.kind == "counter" else ""
+        values = self.children
+        if self.collect is not None:
+            values = self.collect()
+            if not isinstance(values, dict):
+                values = {"": values}
+        for value, child in values.items():
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{suffix}{self._selector(value)} {child}")
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), child.counts):
+                cumulative += count
+                le = 'le="' + str(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._selector(value, le)} {cumulative}")
+            lines.append(f"{self.name}_count{self._selector(value)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._selector(value)} {child.sum}")
+
+class MetricsRegistry:
+    """Ensemble des métriques exposées au format OpenMetrics"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.families = []
+
+    def add(self, name: str, kind: str, help_text: str, **kwargs) -> MetricFamily:
+        family = MetricFamily(f"{self.prefix}_{name}", kind, help_text, **kwargs)
+        self.families.append(family)
+        return family
+
+    def render(self) -> str:
+        lines = []
+        for family in self.families:
+            family.render(lines)
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry("alicia")
+stage_latency = metrics.add("stage_seconds", "histogram", "Durée de chaque étape d'une réponse", label="stage")
+STAGE_QUEUE_WAIT = stage_latency.labels("queue_wait")
+STAGE_THINKING = stage_latency.labels("thinking")
+STAGE_SEXUAL_DETECTION = stage_latency.labels("sexual_detection")
+STAGE_INTENT_MATCH = stage_latency.labels("intent_match")
+STAGE_GROQ_REQUEST = stage_latency.labels("groq_request")
+STAGE_TYPING = stage_latency.labels("typing")
+STAGE_TELEGRAM_SEND = stage_latency.labels("telegram_send")
+loop_lag = metrics.add("event_loop_lag_seconds", "histogram", "Retard de réveil de la boucle asyncio").labels()
+groq_responses = metrics.add("groq_responses", "counter", "Réponses HTTP de Groq par code", label="status")
+groq_tokens = metrics.add("groq_tokens", "counter", "Tokens consommés selon le champ usage de Groq", label="kind")
+intent_lookups = metrics.add("intent_lookups", "counter", "Messages servis localement par intention (none : Groq)",
+                             label="intent")
+llm_requests = metrics.add("llm_requests", "counter", "Requêtes envoyées par fournisseur LLM", label="provider")
+llm_hedges = metrics.add("llm_hedges", "counter", "Requêtes doublées (fired) et gagnées par le doublon (won)",
+                         label="outcome")
+metrics.add("llm_provider_health", "gauge", "Score de santé des fournisseurs LLM (0 à 1)",
+            label="provider", collect=lambda: {provider.name: provider.health for provider in llm_providers})
+telegram_sends = metrics.add("telegram_sends", "counter", "Envois vers Telegram (réussis ou refusés par RetryAfter)",
+                             label="outcome")
+metrics.add("context_store_entries", "gauge", "Contextes utilisateurs en mémoire",
+            collect=lambda: len(user_contexts))
+metrics.add("inbound_turns", "gauge", "Tours de conversation par état",
+            label="state", collect=lambda: {state: inbound_scheduler.stats()[state]
+                                            for state in ("pending", "ready", "running")})
+metrics.add("delayed_replies", "gauge", "Réponses prêtes en attente de leur pause de frappe",
+            collect=lambda: len(delayed_replies))
+metrics.add("events", "counter", "Événements du journal écrits ou perdus (tampon plein, erreur d'écriture)",
+            label="outcome", collect=lambda: {"written": event_log.written, "dropped": event_log.dropped})
+metrics.add("inbound_messages", "counter", "Messages fusionnés ou ignorés par la file d'entrée",
+            label="outcome", collect=lambda: {"merged": inbound_scheduler.merged,
+                                              "dropped": inbound_scheduler.dropped})
+
+async def monitor_loop_lag(interval: float):
+    """Mesure en continu le retard de la boucle (callbacks bloquants, boucle saturée)"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, time.perf_counter() - started - interval))
+
+async def metrics_endpoint(request):
+    return web.Response(
+        body=metrics.render().encode(),
+        headers={"Content-Type": "application/openmetrics-text; version=1.0.0; charset=utf-8"}
+    )
+
+@dataclass(slots=True)
+class UserContext:
+    """Contexte de conversation compact d'un utilisateur"""
+    first_interaction: bool = True
+    conversation_history: list = field(default_factory=list)
+    user_name: Optional[str] = None
+    start_time: float = field(default_factory=time.time)
+    session_start: float = field(default_factory=time.time)
+    sexual_messages_count: int = 0
+    message_count: int = 0  # Messages de la session (l'historique, lui, est tronqué)
+    summary: str = ""
+    last_seen: float = field(default_factory=time.monotonic)
+
+def serialize_context(context: UserContext) -> str:
+    """Sérialise un contexte pour le stockage (last_seen est propre au process)"""
+    data = asdict(context)
+    del data["last_seen"]
+    data["updated_at"] = time.time()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def deserialize_context(raw) -> tuple:
+    """Retourne (contexte, date de dernière écriture) depuis le stockage"""
+    data = json.loads(raw)
+    updated_at = data.pop("updated_at", time.time())
+    # Dernière activité connue, ramenée à l'horloge monotone du process
+    data["last_seen"] = time.monotonic() - max(0.0, time.time() - updated_at)
+    return UserContext(**data), updated_at
+
+def storage_key(key: tuple) -> str:
+    """Clé de stockage d'un contexte (profil, utilisateur), ex. alicia:1234"""
+    return f"{key[0]}:{key[1]}"
+
+class ContextBackend:
+    """Interface des stockages de contextes (appelée hors de la boucle pour les écritures)"""
+    persistent = False
+
+    def load(self, key: tuple) -> Optional[str]:
+        return None
+
+    def write_batch(self, records: dict, deleted: set):
+        pass
+
+    def close(self):
+        pass
+
+class MemoryBackend(ContextBackend):
+    """Stockage par défaut : rien n'est persisté, la mémoire du store fait foi"""
+
+class SQLiteBackend(ContextBackend):
+    """Stockage SQLite en mode WAL, écritures groupées en une transaction"""
+    persistent = True
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS contexts (context_key TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+
+    def load(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM contexts WHERE context_key = ?", (storage_key(key),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def write_batch(self, records: dict, deleted: set):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO contexts (context_key, data) VALUES (?, ?)",
+                    ((storage_key(key), raw) for key, raw in records.items())
+                )
+                self._conn.executemany(
+                    "DELETE FROM contexts WHERE context_key = ?", ((storage_key(key),) for key in deleted)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class RedisBackend(ContextBackend):
+    """Stockage Redis (ou tout client compatible), partageable entre plusieurs workers
+
+    Chaque processus garde son propre cache write-behind : le partage n'est sûr
+    que si un utilisateur est toujours servi par le même worker (WORKERS route
+    par utilisateur). Sans ce routage, un worker peut réécrire une copie périmée
+    d'un contexte modifié entre-temps par un autre.
+    """
+    persistent = True
+
+    def __init__(self, client, ttl: float, prefix: str = "alicia:ctx:"):
+        self._client = client
+        self._ttl = int(ttl)
+        self._prefix = prefix
+
+    def load(self, key: tuple) -> Optional[str]:
+        return self._client.get(f"{self._prefix}{storage_key(key)}")
+
+    def write_batch(self, records: dict, deleted: set):
+        pipe = self._client.pipeline(transaction=False)
+        for key, raw in records.items():
+            pipe.set(f"{self._prefix}{storage_key(key)}", raw, ex=self._ttl)
+        if deleted:
+            pipe.delete(*(f"{self._prefix}{storage_key(key)}" for key in deleted))
+        pipe.execute()
+
+    def close(self):
+        self._client.close()
+
+def create_context_backend() -> ContextBackend:
+    """Instancie le stockage choisi par CONTEXT_BACKEND"""
+    if CONTEXT_BACKEND == 'sqlite':
+        return SQLiteBackend(CONTEXT_DB_PATH)
+    if CONTEXT_BACKEND == 'redis':
+        if redis is None:
+            raise RuntimeError("CONTEXT_BACKEND=redis nécessite le paquet redis")
+        return RedisBackend(redis.Redis.from_url(REDIS_URL), CONTEXT_IDLE_TTL)
+    return MemoryBackend()
+
+class ContextStore:
+    """Contextes utilisateurs bornés : éviction LRU et oubli après inactivité
+
+    La mémoire sert de cache devant le stockage : les contextes modifiés (voir
+    mark_dirty) sont écrits par lots (write-behind) par flush(), jamais pendant
+    un message, et les contextes absents sont lus par fetch() dans un thread.
+    Un accès ne fait sortir que l'excédent LRU ; les sessions inactives des
+    autres utilisateurs sont fermées par run_flusher, par lots bornés.
+    """
+
+    def __init__(self, max_entries: int, idle_ttl: float,
+                 on_evict: Optional[Callable[[tuple, UserContext], None]] = None,
+                 backend: Optional[ContextBackend] = None):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        self.backend = backend or MemoryBackend()
+        self._entries = OrderedDict()  # Du moins récemment utilisé au plus récent
+        self._dirty = set()
+        self._evicted = {}  # Contextes sortis du cache mais pas encore écrits
+        self._deleted = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._entries
+
+    def get(self, key: tuple) -> Optional[UserContext]:
+        """Retourne le contexte en mémoire (et le marque comme récent) ou None
+
+        Ne lit jamais le stockage : voir fetch() pour un contexte à recharger.
+        """
+        context = self._entries.get(key)
+        if context is not None and time.monotonic() - context.last_seen >= self.idle_ttl:
+            # Session expirée que le balayage de fond n'a pas encore fermée
+            del self._entries[key]
+            self._evict(key, context, idle=True)
+            return None
+        if context is None:
+            raw = self._evicted.pop(key, None)
+            context = self._restore(key, raw) if raw is not None else None
+            if context is None:
+                return None
+            self._entries[key] = context
+            self._dirty.add(key)  # Pas encore écrit dans le stockage
+            self._evict_overflow()
+        return self._touch(key, context)
+
+    async def fetch(self, key: tuple) -> Optional[UserContext]:
+        """Comme get(), en relisant au besoin le stockage hors de la boucle asyncio"""
+        context = self.get(key)
+        if context is not None or not self.backend.persistent or key in self._deleted:
+            return context
+        raw = await asyncio.to_thread(self.backend.load, key)
+        # Pendant la lecture, le contexte a pu être recréé (/start, /clear) ou oublié
+        if key in self._entries or key in self._evicted or key in self._deleted:
+            return self.get(key)
+        context = self._restore(key, raw) if raw is not None else None
+        if context is None:
+            return None
+        self._entries[key] = context
+        self._touch(key, context)
+        self._evict_overflow()
+        return context
+
+    def _touch(self, key: tuple, context: UserContext) -> UserContext:
+        context.last_seen = time.monotonic()
+        self._entries.move_to_end(key)
+        return context
+
+    def mark_dirty(self, key: tuple):
+        """Signale un contexte modifié : il sera écrit au prochain flush()"""
+        if key in self._entries:
+            self._dirty.add(key)
+
+    def new_session(self, key: tuple, first_interaction: bool = True) -> UserContext:
+        """Remplace le contexte de l'utilisateur par une session vierge"""
+        context = UserContext(first_interaction=first_interaction)
+        self._entries[key] = context
+        self._entries.move_to_end(key)
+        self._evicted.pop(key, None)
+        self._deleted.discard(key)
+        self._dirty.add(key)
+        self._evict_overflow()
+        return context
+
+    def pop(self, key: tuple) -> Optional[UserContext]:
+        """Retire un contexte sans déclencher le hook d'éviction"""
+        self._forget(key)
+        return self._entries.pop(key, None)
+
+    def evict_expired(self, limit: Optional[int] = None):
+        """Évince les contextes en trop ou inactifs (toujours en tête de l'OrderedDict)
+
+        `limit` borne le travail d'un appel (le reste attend le passage suivant).
+        """
+        now = time.monotonic()
+        evicted = 0
+        while self._entries and (limit is None or evicted < limit):
+            key, context = next(iter(self._entries.items()))
+            idle = now - context.last_seen >= self.idle_ttl
+            if len(self._entries) <= self.max_entries and not idle:
+                break
+            del self._entries[key]
+            evicted += 1
+            self._evict(key, context, idle)
+
+    def _evict_overflow(self):
+        """Sortie LRU des contextes au-delà de max_entries"""
+        while len(self._entries) > self.max_entries:
+            key, context = self._entries.popitem(last=False)
+            self._evict(key, context, time.monotonic() - context.last_seen >= self.idle_ttl)
+
+    def _evict(self, key: tuple, context: UserContext, idle: bool):
+        if self.backend.persistent and not idle:
+            # Simplement sorti du cache : il reste disponible dans le stockage
+            if key in self._dirty:
+                self._dirty.discard(key)
+                self._evicted[key] = serialize_context(context)
+            return
+        self._forget(key)
+        if self.on_evict:
+            self.on_evict(key, context)
+
+    def _forget(self, key: tuple):
+        """Programme la suppression du contexte dans le stockage"""
+        self._dirty.discard(key)
+        self._evicted.pop(key, None)
+        if self.backend.persistent:
+            self._deleted.add(key)
+
+    def _restore(self, key: tuple, raw: str) -> Optional[UserContext]:
+        """Contexte relu du stockage, ou None si la session a expiré entre-temps"""
+        context, updated_at = deserialize_context(raw)
+        if time.time() - updated_at >= self.idle_ttl:
+            # Session abandonnée pendant un arrêt du bot
+            self._forget(key)
+            if self.on_evict:
+                self.on_evict(key, context)
+            return None
+        return context
+
+    async def flush(self):
+        """Écrit les contextes modifiés par lots, hors de la boucle asyncio"""
+        if not self.backend.persistent or not (self._dirty or self._evicted or self._deleted):
+            return
+        # Sérialisation sur la boucle pour écrire un état cohérent
+        records = self._evicted
+        records.update((key, serialize_context(self._entries[key]))
+                       for key in self._dirty if key in self._entries)
+        deleted = self._deleted
+        self._dirty, self._evicted, self._deleted = set(), {}, set()
+        try:
+            await asyncio.to_thread(self.backend.write_batch, records, deleted)
+        except Exception as e:
+            logging.error(f"Échec d'écriture des contextes : {e}")
+            # On retentera au prochain flush sans écraser des données plus récentes
+            for key, raw in records.items():
+                if key not in self._dirty:
+                    self._evicted.setdefault(key, raw)
+            self._deleted |= {key for key in deleted if key not in self._entries}
+
+    async def run_flusher(self, interval: float):
+        """Boucle de write-behind, qui ferme aussi les sessions devenues inactives
+
+        Sans elle, une session abandonnée ne serait close qu'au prochain accès au
+        store. L'OrderedDict est trié par dernière activité : chaque passage ne
+        coûte que le nombre de sessions expirées, même avec des millions de contextes.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_expired(limit=CONTEXT_EXPIRE_BATCH)
+            await self.flush()
+
+def log_session_end(key: tuple, context: UserContext):
+    """Enregistre la durée et la longueur d'une session qui se termine"""
+    # Une session inactive se termine à son dernier message, pas à son éviction
+    ended_at = time.time() - (time.monotonic() - context.last_seen)
+    log_metric("session_end", value=ended_at - context.session_start)
+    log_metric("conversation_length", value=context.message_count)
+
+user_contexts = ContextStore(CONTEXT_MAX_USERS, CONTEXT_IDLE_TTL, on_evict=log_session_end,
+                             backend=create_context_backend())
+
+# Profils des bots (personnalité, messages, seuils) chargés depuis bot_profiles.json
+BOT_PROFILES_PATH = os.getenv(
+    'BOT_PROFILES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'bot_profiles.json')
+)
+PROFILES_RELOAD_INTERVAL = float(os.getenv('PROFILES_RELOAD_INTERVAL', '5'))  # Vérification du fichier (s)
+
+DEFAULT_SEXUAL_KEYWORDS = {
+    'sexy': 1,
+    'chaud': 1,
+    'nue': 2,
+    'seins': 2,
+    'cul': 2,
+    'baise': 3,
+    'coucher': 2,
+    'lit': 1,
+    'corps': 1,
+    'photos': 1,
+    'nudes': 2,
+    'sexe': 3
+}
+
+# Ligatures que NFKD ne décompose pas (l'encodage ASCII les supprimerait)
+LIGATURES = str.maketrans({"œ": "oe", "æ": "ae", "ß": "ss"})
+
+# Leetspeak ramené aux lettres ("s3xy" -> "sexy", "$exe" -> "sexe") : un chiffre
+# seulement entre deux lettres, "@"/"$" collés à une lettre. "j'ai 21 ans", "1er"
+# ou "mp3" restent intacts
+LEET_TABLE = str.maketrans("013457@$", "oieastas")
+LEET_WORD = re.compile(r"(?<=[a-z])[013457@$]+(?=[a-z])|[@$](?=[a-z])|(?<=[a-z])[@$]")
+
+def normalize_text(text: str) -> str:
+    """Minuscules, sans accents ni leetspeak, pour la détection de mots-clés"""
+    text = unicodedata.normalize('NFKD', text.lower().translate(LIGATURES))
+    text = text.encode('ascii', 'ignore').decode('ascii')
+    return LEET_WORD.sub(lambda word: word[0].translate(LEET_TABLE), text)
+
+def keyword_suffixes(word: str) -> str:
+    """Terminaisons admises après un mot-clé normalisé
+
+    Une terminaison commune à tous ferait de "nuée" (-> "nuee") un "nue" accordé :
+    un mot en -e ne prend que le pluriel ou l'infinitif, un mot en -s/-x rien.
+    """
+    if word.endswith(("s", "x")):
+        return ""
+    if word.endswith("e"):
+        return "(?:s|r)?"
+    return "(?:es|e|s)?"
+
+def compile_keyword_matcher(keywords: dict) -> tuple:
+    """Compile une seule regex (mots entiers, accords propres à chaque mot) et la table des poids"""
+    weights = {normalize_text(word): value for word, value in keywords.items()}
+    # Un groupe par famille de terminaisons : le groupe qui a capturé est match.lastindex
+    families = {}
+    for word in sorted(weights, key=len, reverse=True):
+        families.setdefault(keyword_suffixes(word), []).append(re.escape(word))
+    alternatives = "|".join(f"({'|'.join(words)}){suffix}" for suffix, words in families.items())
+    pattern = re.compile(rf"\b(?:{alternatives})\b")
+    return pattern, MappingProxyType(weights)
+
+def char_ngrams(text: str, n: int = 3) -> dict:
+    """Compte les n-grammes de caractères d'un texte normalisé (mots bornés par des espaces)"""
+    padded = " " + " ".join(re.findall(r"\w+", normalize_text(text))) + " "
+    counts = {}
+    for i in range(len(padded) - n + 1):
+        gram = padded[i:i + n]
+        counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+class IntentIndex:
+    """Exemples d'intentions en vecteurs TF-IDF de trigrammes, indexés par trigramme
+
+    Construit une fois au chargement du profil ; match() ne parcourt que les
+    listes des trigrammes du message (produit scalaire creux = cosinus).
+    """
+    __slots__ = ("labels", "sizes", "idf", "unknown_idf", "postings")
+
+    def __init__(self, examples: list):
+        # examples : liste de (intention, texte)
+        self.labels = tuple(intent for intent, _ in examples)
+        grams = [char_ngrams(text) for _, text in examples]
+        self.sizes = tuple(sum(counts.values()) for counts in grams)  # Trigrammes de chaque exemple
+        document_frequency = {}
+        for counts in grams:
+            for gram in counts:
+                document_frequency[gram] = document_frequency.get(gram, 0) + 1
+        total = len(examples)
+        self.idf = {gram: math.log((1 + total) / (1 + df)) + 1 for gram, df in document_frequency.items()}
+        self.unknown_idf = math.log(1 + total) + 1  # Trigramme absent des exemples
+        self.postings = {}
+        for index, counts in enumerate(grams):
+            vector = {gram: count * self.idf[gram] for gram, count in counts.items()}
+            norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+            for gram, weight in vector.items():
+                self.postings.setdefault(gram, []).append((index, weight / norm))
+
+    def match(self, message: str) -> tuple:
+        """Retourne (intention, similarité cosinus, rapport de longueur) de l'exemple le plus proche
+
+        Le rapport (trigrammes du message / trigrammes de l'exemple) repère un
+        message qui dit bien plus que l'exemple : "salut ça va ?" contient
+        "salut" mais n'est pas qu'un bonjour.
+        """
+        counts = char_ngrams(message)
+        if not counts:
+            return None, 0.0, 0.0
+        scores = {}
+        norm = 0.0
+        for gram, count in counts.items():
+            weight = count * self.idf.get(gram, self.unknown_idf)
+            norm += weight * weight
+            for index, example_weight in self.postings.get(gram, ()):
+                scores[index] = scores.get(index, 0.0) + weight * example_weight
+        if not scores:
+            return None, 0.0, 0.0
+        best = max(scores, key=scores.__getitem__)
+        return self.labels[best], scores[best] / math.sqrt(norm), sum(counts.values()) / self.sizes[best]
+
+@dataclass(frozen=True, slots=True)
+class SessionThresholds:
+    """Seuils de fin de conversation et de suggestions d'un profil"""
+    end_max_messages: int = 25  # Arrêt forcé
+    end_messages: int = 20  # Arrêt peu importe le temps
+    end_timed_messages: int = 15  # Arrêt si en plus la session dure depuis end_timed_minutes
+    end_timed_minutes: float = 20
+    hint_messages: int = 12  # Début des indices de départ
+    hint_probability: float = 0.15
+    fanvue_after_sexual: int = 3  # Messages sexuels avant le lien Fanvue
+    fanvue_min_history: int = 5  # Échanges avant une suggestion spontanée
+    fanvue_probability: float = 0.08
+
+@dataclass(frozen=True, slots=True)
+class BotProfile:
+    """Profil immuable d'un bot, entièrement précompilé au chargement"""
+    name: str
+    display_name: str
+    token_env: str
+    fanvue_url: str
+    welcome_message: str
+    first_reply: str
+    joke_request: str
+    ending_messages: tuple
+    hint_messages: tuple
+    fanvue_suggestions: tuple
+    fanvue_teases: tuple
+    sexual_replies: tuple  # Réponses pour un score de 1, 2 et 3+
+    thresholds: SessionThresholds
+    sexual_pattern: re.Pattern
+    sexual_weights: MappingProxyType
+    system_message: dict
+    groq_params: dict
+    payload_prefix: bytes  # Début de payload Groq pré-sérialisé
+    stream_payload_prefix: bytes
+    prompt_key: str  # Empreinte de la personnalité et des paramètres (clé de cache)
+    intent_index: Optional[IntentIndex]  # Réponses locales sans Groq (None : désactivé)
+    intent_replies: MappingProxyType
+    intent_threshold: float
+    intent_max_length_ratio: float  # Message trop long par rapport à l'exemple : Groq répond
+
+def build_profile(name: str, raw: dict, defaults: dict) -> BotProfile:
+    """Valide un profil brut du JSON et le précompile"""
+    def check(condition, message):
+        if not condition:
+            raise ValueError(f"Profil « {name} » : {message}")
+
+    def texts(values, what):
+        check(isinstance(values, list) and values and all(isinstance(v, str) and v for v in values),
+              f"{what} doit être une liste de textes non vide")
+        return tuple(v.replace("{fanvue_url}", fanvue_url) for v in values)
+
+    def text_list(key):
+        return texts(raw.get(key), key)
+
+    def number(value, what, low, high, integer=False):
+        # bool est un int pour Python : refusé explicitement
+        kinds = int if integer else (int, float)
+        check(isinstance(value, kinds) and not isinstance(value, bool) and low <= value <= high,
+              f"{what} doit être un {'entier' if integer else 'nombre'} dans [{low}, {high}]")
+        return value
+
+    merged = {**defaults, **raw}
+    check(isinstance(raw.get("token_env"), str), "token_env manquant")
+    fanvue_url = raw.get("fanvue_url", "")
+    check(isinstance(fanvue_url, str), "fanvue_url doit être un texte")
+
+    personality = raw.get("personality")
+    if isinstance(personality, list):
+        personality = "\n".join(personality)
+    check(isinstance(personality, str) and personality.strip(), "personality manquante")
+    personality = personality.replace("{fanvue_url}", fanvue_url)
+
+    for key in ("welcome_message", "first_reply", "joke_request"):
+        check(isinstance(raw.get(key), str) and raw[key], f"{key} manquant")
+
+    sexual_replies = raw.get("sexual_replies")
+    check(isinstance(sexual_replies, list) and len(sexual_replies) == 3,
+          "sexual_replies doit contenir 3 listes (scores 1, 2 et 3+)")
+    sexual_replies = tuple(texts(group, "chaque groupe de sexual_replies") for group in sexual_replies)
+
+    thresholds_raw = {**defaults.get("thresholds", {}), **raw.get("thresholds", {})}
+    try:
+        thresholds = SessionThresholds(**thresholds_raw)
+    except TypeError as e:
+        raise ValueError(f"Profil « {name} » : seuils invalides ({e})")
+    for threshold in fields(SessionThresholds):
+        high = 1 if threshold.name.endswith("_probability") else math.inf
+        number(getattr(thresholds, threshold.name), f"thresholds.{threshold.name}", 0, high,
+               integer=threshold.type is int)
+
+    keywords = merged.get("sexual_keywords") or DEFAULT_SEXUAL_KEYWORDS
+    check(isinstance(keywords, dict) and all(isinstance(k, str) and k.strip() for k in keywords),
+          "sexual_keywords doit associer des mots à des poids")
+    for keyword, weight in keywords.items():
+        # Le score sert d'indice dans sexual_replies : poids entiers uniquement
+        number(weight, f"poids du mot-clé « {keyword} »", 1, math.inf, integer=True)
+    sexual_pattern, sexual_weights = compile_keyword_matcher(keywords)
+
+    groq_params = {
+        "model": merged.get("model", GROQ_MODEL),
+        "temperature": merged.get("temperature", 0.8),
+        "max_tokens": merged.get("max_tokens", GROQ_MAX_TOKENS),
+        "top_p": merged.get("top_p", 0.9)
     }
-    score = 0
-    for word, value in sexual_keywords.items():
-        if word in message.lower():
-            score += value
-    return score
+    check(isinstance(groq_params["model"], str) and groq_params["model"], "model manquant")
+    number(groq_params["temperature"], "temperature", 0, 2)
+    check(number(groq_params["top_p"], "top_p", 0, 1) > 0, "top_p hors de ]0, 1]")
+    number(groq_params["max_tokens"], "max_tokens", 1, math.inf, integer=True)
+
+    # Début de payload identique à chaque requête : sérialisé une seule fois, et un
+    # préfixe de prompt stable permet au cache de préfixe côté Groq de jouer
+    system_message = {"role": "system", "content": personality}
+    serialized_system = json.dumps(system_message)
+    payload_prefix = (json.dumps(groq_params)[:-1] + ', "messages": [' + serialized_system).encode()
+    stream_payload_prefix = (
+        json.dumps({**groq_params, "stream": True})[:-1] + ', "messages": [' + serialized_system
+    ).encode()
+    prompt_key = hashlib.blake2b(payload_prefix, digest_size=8).hexdigest()
+
+    intents = raw.get("intents", {})
+    check(isinstance(intents, dict), "intents doit être un objet")
+    examples, intent_replies = [], {}
+    for intent, spec in intents.items():
+        check(isinstance(spec, dict), f"intention {intent} : examples et replies requis")
+        examples.extend((intent, text) for text in texts(spec.get("examples"), f"intention {intent} : examples"))
+        intent_replies[intent] = texts(spec.get("replies"), f"intention {intent} : replies")
+    intent_threshold = merged.get("intent_threshold", 0.7)
+    check(number(intent_threshold, "intent_threshold", 0, 1) > 0, "intent_threshold hors de ]0, 1]")
+    intent_max_length_ratio = number(merged.get("intent_max_length_ratio", 2.0), "intent_max_length_ratio",
+                                     1, math.inf)
+
+    return BotProfile(
+        name=name,
+        display_name=raw.get("display_name", name.capitalize()),
+        token_env=raw["token_env"],
+        fanvue_url=fanvue_url,
+        welcome_message=raw["welcome_message"],
+        first_reply=raw["first_reply"],
+        joke_request=raw["joke_request"],
+        ending_messages=text_list("ending_messages"),
+        hint_messages=text_list("hint_messages"),
+        fanvue_suggestions=text_list("fanvue_suggestions"),
+        fanvue_teases=text_list("fanvue_teases"),
+        sexual_replies=sexual_replies,
+        thresholds=thresholds,
+        sexual_pattern=sexual_pattern,
+        sexual_weights=sexual_weights,
+        system_message=system_message,
+        groq_params=groq_params,
+        payload_prefix=payload_prefix,
+        stream_payload_prefix=stream_payload_prefix,
+        prompt_key=prompt_key,
+        intent_index=IntentIndex(examples) if examples else None,
+        intent_replies=MappingProxyType(intent_replies),
+        intent_threshold=intent_threshold,
+        intent_max_length_ratio=intent_max_length_ratio
+    )
+
+def load_profiles(path: str) -> dict:
+    """Lit et valide tous les profils du fichier (lève ValueError si invalide)"""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    profiles = config.get("profiles")
+    if not isinstance(profiles, dict) or not profiles:
+        raise ValueError("bot_profiles.json ne contient aucun profil")
+    defaults = config.get("defaults", {})
+    return {name: build_profile(name, raw, defaults) for name, raw in profiles.items()}
+
+class ProfileRegistry:
+    """Profils chargés au démarrage et rechargés à chaud quand le fichier change"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime = os.stat(path).st_mtime
+        self._profiles = load_profiles(path)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._profiles
+
+    def get(self, name: str) -> BotProfile:
+        return self._profiles[name]
+
+    def all(self) -> list:
+        return list(self._profiles.values())
+
+    async def reload_if_changed(self) -> bool:
+        """Recharge le fichier s'il a changé ; garde les anciens profils s'il est invalide"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            profiles = await asyncio.to_thread(load_profiles, self.path)
+        except (OSError, ValueError) as e:
+            logging.error(f"Profils non rechargés : {e}")
+            return False
+
+        # Les bots déjà lancés gardent leur profil s'il a disparu du fichier
+        for name in self._profiles.keys() - profiles.keys():
+            logging.error(f"Profil « {name} » retiré du fichier : conservé jusqu'au redémarrage")
+            profiles[name] = self._profiles[name]
+        self._profiles = profiles  # Remplacement atomique, les messages en cours gardent l'ancien
+        return True
+
+    async def watch(self, interval: float):
+        """Surveille le fichier de profils"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.reload_if_changed()
+
+profile_registry = ProfileRegistry(BOT_PROFILES_PATH)
+
+def detect_sexual_content(message: str, profile: BotProfile) -> int:
+    """Détecte le contenu sexuel et renvoie un score (chaque mot-clé compte une fois)"""
+    found = {match[match.lastindex] for match in profile.sexual_pattern.finditer(normalize_text(message))}
+    return sum(profile.sexual_weights[word] for word in found)
+
+def match_intent(message: str, profile: BotProfile) -> Optional[str]:
+    """Réponse locale du profil si le message correspond nettement à une intention"""
+    if profile.intent_index is None:
+        return None
+    started = time.perf_counter()
+    intent, score, length_ratio = profile.intent_index.match(message)
+    STAGE_INTENT_MATCH.observe(time.perf_counter() - started)
+    if score < profile.intent_threshold or length_ratio > profile.intent_max_length_ratio:
+        intent_lookups.inc("none")
+        return None
+    intent_lookups.inc(intent)
+    return random.choice(profile.intent_replies[intent])
 
 def calculate_response_delay(response_text: str) -> float:
     """Calcule le délai en fonction de la taille de la réponse"""
@@ -196,286 +1548,1267 @@ def calculate_response_delay(response_text: str) -> float:
     else:
         return random.uniform(2.5, 3)  # Long : 2.5-3s
 
-def should_send_fanvue(user_id: int, context: dict) -> bool:
+def should_send_fanvue(user_id: int, context: UserContext, profile: BotProfile) -> bool:
     """Détermine si il faut envoyer le lien Fanvue après plusieurs messages sexuels"""
-    sexual_count = context.get("sexual_messages_count", 0)
-    return sexual_count >= 3  # Après 3 messages sexuels
+    sexual_count = context.sexual_messages_count
+    return sexual_count >= profile.thresholds.fanvue_after_sexual  # Après 3 messages sexuels
 
-def increment_sexual_counter(context: dict):
+def increment_sexual_counter(context: UserContext):
     """Incrémente le compteur de messages sexuels"""
-    if "sexual_messages_count" not in context:
-        context["sexual_messages_count"] = 0
-    context["sexual_messages_count"] += 1
+    context.sexual_messages_count += 1
 
-def should_end_conversation(context: dict) -> bool:
+def should_end_conversation(context: UserContext, profile: BotProfile) -> bool:
     """Détermine si la conversation devrait se terminer naturellement"""
-    message_count = len(context.get("conversation_history", []))
-    start_time = context.get("start_time", time.time())
-    elapsed_minutes = (time.time() - start_time) / 60
+    thresholds = profile.thresholds
+    message_count = context.message_count
+    elapsed_minutes = (time.time() - context.start_time) / 60
 
     # Conditions d'arrêt progressives
-    if message_count >= 25:  # Après 25 messages, arrêt forcé
-        return True
-    elif message_count >= 15 and elapsed_minutes >= 20:  # Après 15 messages ET 20 minutes
+    if message_count >= thresholds.end_max_messages:  # Après 25 messages, arrêt forcé
         return True
-    elif message_count >= 20:  # Ou après 20 messages peu importe le temps
+    elif message_count >= thresholds.end_timed_messages and elapsed_minutes >= thresholds.end_timed_minutes:
+        return True  # Après 15 messages ET 20 minutes
+    elif message_count >= thresholds.end_messages:  # Ou après 20 messages peu importe le temps
         return True
 
     return False
 
-def should_hint_ending(context: dict) -> bool:
-    """Détermine si Alicia devrait commencer à mentionner qu'elle doit partir"""
-    message_count = len(context.get("conversation_history", []))
-    return message_count >= 12  # Commence les indices à partir du 12ème message
-
-def get_ending_message() -> str:
-    """Messages d'arrêt naturels d'Alicia"""
-    endings = [
-        "Bon, je dois y aller ! J'ai un vol tôt demain matin 😴 Bonne nuit !",
-        "Il se fait tard ! Je vais me coucher 🌙 À bientôt !",
-        "Je file ! J'ai encore du boulot à finir 📚 On se reparle ?",
-        "Allez, je te laisse ! Ma colocataire m'attend pour manger 🍽️ Bisous !",
-        "Je dois filer sous la douche ! Longue journée demain ⏰ Prends soin de toi !",
-        "Bon, mes yeux se ferment ! 😴 Je vais pioncer ! Bonne nuit !",
-        "Je dois arrêter là ! Révisions à finir 📖 À plus tard !",
-        "Il faut que j'y aille ! Mon service commence tôt 💼 Bonne soirée !"
-    ]
-    return random.choice(endings)
-
-def get_hint_message() -> str:
-    """Messages qui indiquent qu'Alicia va bientôt partir"""
-    hints = [
-        "Dis donc, ça fait un moment qu'on discute ! 😅",
-        "Je commence à avoir sommeil moi... 😴",
-        "Il va falloir que je pense à aller me coucher bientôt !",
-        "Ma journée de demain va être chargée ! 📚",
-        "J'ai encore des trucs à faire avant de dormir...",
-        "Le temps passe vite quand on discute ! ⏰",
-        "Mes yeux commencent à piquer un peu 😪"
-    ]
-    return random.choice(hints)
-
-def get_groq_response(message: str, user_id: int, context: dict) -> str:
-    """Obtient une réponse de Groq"""
-    try:
+def should_hint_ending(context: UserContext, profile: BotProfile) -> bool:
+    """Détermine si le bot devrait commencer à mentionner qu'il doit partir"""
+    return context.message_count >= profile.thresholds.hint_messages  # À partir du 12ème message
+
+def get_ending_message(profile: BotProfile) -> str:
+    """Messages d'arrêt naturels du profil"""
+    return random.choice(profile.ending_messages)
+
+def get_hint_message(profile: BotProfile) -> str:
+    """Messages qui indiquent que le bot va bientôt partir"""
+    return random.choice(profile.hint_messages)
+
+class TokenBucket:
+    """Seau à jetons : `capacity` jetons max, remplis à `rate` jetons/seconde"""
+    __slots__ = ("capacity", "rate", "level", "updated")
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Secondes à attendre avant de pouvoir prendre `amount` jetons"""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= amount
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Convertit "2m59.56s", "7.66s" ou "120ms" (en-têtes Groq) en secondes"""
+    if not value:
+        return None
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+class PriorityLimiter(ABC):
+    """Limiteur à seaux de jetons dont les demandes sont servies par priorité
+
+    Les sous-classes disent combien attendre (_time_until) et consomment (_take).
+    """
+
+    def __init__(self):
+        self.blocked_until = 0.0
+        self._waiters = []  # Tas de (priorité, ordre d'arrivée, future, coût)
+        self._order = itertools.count()
+        self._dispatcher = None
+
+    @abstractmethod
+    def _time_until(self, cost: float, now: float) -> float:
+        """Secondes à attendre avant de pouvoir consommer `cost`"""
+
+    @abstractmethod
+    def _take(self, cost: float):
+        """Consomme `cost` (appelé seulement quand _time_until vaut 0)"""
+
+    def _try_take(self, cost: float) -> float:
+        """Consomme les jetons si possible, sinon retourne le temps d'attente"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        wait = self._time_until(cost, now)
+        if wait == 0:
+            self._take(cost)
+        return wait
+
+    async def acquire(self, cost: float, priority: int = PRIORITY_CONVERSATION):
+        """Attend son tour (par priorité puis ordre d'arrivée)"""
+        if not self._waiters and self._try_take(cost) == 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future, cost))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        while self._waiters:
+            _, _, future, cost = self._waiters[0]
+            if future.done():  # Demande abandonnée entre-temps
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._try_take(cost)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+    def try_acquire(self, cost: float) -> bool:
+        """Consomme `cost` seulement si c'est possible sans attendre"""
+        return not self._waiters and self._try_take(cost) == 0
+
+    def pause(self, seconds: float):
+        """Bloque toutes les demandes pendant `seconds`"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class GroqRateLimiter(PriorityLimiter):
+    """Limiteur partagé par tous les chats (requêtes et tokens/minute), servi par priorité"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        super().__init__()
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+
+    def _time_until(self, tokens: float, now: float) -> float:
+        return max(self.requests.time_until(1, now), self.tokens.time_until(tokens, now))
+
+    def _take(self, tokens: float):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+    def try_acquire_spare(self, tokens: float) -> bool:
+        """Comme try_acquire, mais sans entamer la réserve des conversations
+
+        Pour les tâches de fond : elles ne prennent que la capacité laissée libre
+        (seaux encore remplis au-delà de GROQ_BACKGROUND_RESERVE) et ne rejoignent
+        jamais la file d'attente.
+        """
+        now = time.monotonic()
+        if self._waiters or now < self.blocked_until:
+            return False
+        if (self.requests.time_until(1 + GROQ_BACKGROUND_RESERVE * self.requests.capacity, now) > 0
+                or self.tokens.time_until(tokens + GROQ_BACKGROUND_RESERVE * self.tokens.capacity, now) > 0):
+            return False
+        self._take(tokens)
+        return True
+
+    def adjust_tokens(self, estimated: int, actual: int):
+        """Corrige le seau avec la consommation réelle renvoyée par Groq"""
+        self.tokens.take(actual - estimated)
+
+    def update_from_headers(self, headers):
+        """Aligne les seaux sur les quotas restants annoncés par Groq"""
+        now = time.monotonic()
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                continue
+            bucket.time_until(0, now)
+            bucket.level = min(bucket.level, remaining)
+            reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining <= 0 and reset:
+                self.blocked_until = max(self.blocked_until, now + reset)
+
+class CircuitBreaker:
+    """Coupe les appels après plusieurs échecs, puis laisse passer un essai par cooldown"""
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    @property
+    def cooling_down(self) -> bool:
+        """Ouvert et pas encore prêt pour un essai"""
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.cooldown:
+            self.opened_at = now  # Un seul essai par période de cooldown
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+class LLMProvider:
+    """Point d'accès compatible OpenAI avec son propre quota, disjoncteur et score de santé"""
+
+    def __init__(self, name: str, url: str, api_key: str, model: Optional[str] = None,
+                 requests_per_minute: int = GROQ_RPM, tokens_per_minute: int = GROQ_TPM):
+        self.name = name
+        self.url = url
+        self.model = model  # None : le modèle du profil
+        self.headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        # Quota partagé à parts égales entre les workers
+        self.limiter = GroqRateLimiter(max(1, requests_per_minute // WORKERS), max(1, tokens_per_minute // WORKERS))
+        self.breaker = CircuitBreaker(GROQ_BREAKER_FAILURES, GROQ_BREAKER_COOLDOWN)
+        self.latencies = deque(maxlen=LLM_LATENCY_WINDOW)  # Durées des derniers succès
+        self._health = 1.0  # Moyenne glissante des succès (1 : tout va bien)
+        self._health_at = time.monotonic()
+
+    @property
+    def health(self) -> float:
+        """Score de santé, qui remonte vers 1.0 à mesure que le dernier échec s'éloigne
+
+        Un fournisseur écarté ne reçoit plus de requêtes : sans ce retour, son
+        score resterait figé et il ne serait jamais réessayé (pas de retour au
+        fournisseur préféré une fois la panne passée).
+        """
+        elapsed = time.monotonic() - self._health_at
+        return 1.0 - (1.0 - self._health) * 0.5 ** (elapsed / LLM_HEALTH_HALF_LIFE)
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        health = self.health
+        self._health = health + LLM_HEALTH_ALPHA * ((1.0 if ok else 0.0) - health)
+        self._health_at = time.monotonic()
+        if ok and latency is not None:
+            self.latencies.append(latency)
+
+    @property
+    def healthy(self) -> bool:
+        # Disjoncteur prêt pour son essai : le fournisseur reprend sa place pour être testé
+        return not self.breaker.cooling_down and self.health >= LLM_MIN_HEALTH
+
+    def hedge_delay(self) -> float:
+        """p95 observé des réponses, ou la valeur par défaut tant qu'il y a trop peu de mesures"""
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DELAY
+        ordered = sorted(self.latencies)
+        return max(LLM_HEDGE_MIN_DELAY, ordered[int(len(ordered) * 0.95)])
+
+def load_llm_providers() -> list:
+    """Fournisseurs dans l'ordre de préférence (LLM_PROVIDERS, sinon Groq seul)"""
+    if not LLM_PROVIDERS:
         if not GROQ_API_KEY:
-            return "Désolée, je ne peux pas répondre maintenant ! 😅"
+            return []
+        return [LLMProvider("groq", GROQ_API_URL, GROQ_API_KEY)]
+
+    providers = []
+    for entry in json.loads(LLM_PROVIDERS):
+        api_key = os.getenv(entry.get("api_key_env", "GROQ_API_KEY"))
+        if not api_key:
+            print(f"⚠️ Clé manquante ({entry.get('api_key_env', 'GROQ_API_KEY')}) : fournisseur {entry['name']} ignoré")
+            continue
+        providers.append(LLMProvider(entry["name"], entry["url"], api_key, entry.get("model"),
+                                     int(entry.get("rpm", GROQ_RPM)), int(entry.get("tpm", GROQ_TPM))))
+    return providers
+
+def ranked_providers() -> list:
+    """Fournisseurs sains d'abord, dans l'ordre configuré ; les autres servent de secours"""
+    return sorted(llm_providers, key=lambda provider: not provider.healthy)
+
+llm_providers = load_llm_providers()
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Backoff exponentiel avec jitter complet"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+# Cache des réponses Groq et pool de blagues pré-générées
+GROQ_CACHE_SIZE = int(os.getenv('GROQ_CACHE_SIZE', '2048'))
+GROQ_CACHE_TTL = float(os.getenv('GROQ_CACHE_TTL', '600'))  # Durée de vie d'une réponse (s)
+JOKE_POOL_SIZE = int(os.getenv('JOKE_POOL_SIZE', '20'))
+JOKE_REFRESH_INTERVAL = float(os.getenv('JOKE_REFRESH_INTERVAL', '300'))  # Rotation du pool (s)
+
+class ResponseCache:
+    """Cache LRU + TTL des réponses Groq, avec coalescence des requêtes identiques"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # empreinte -> (expiration, texte, tokens)
+        self._inflight = {}  # empreinte -> Future partagée par les requêtes identiques
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.saved_tokens = 0
+
+    @staticmethod
+    def fingerprint(namespace: str, messages: list) -> str:
+        """Empreinte du prompt normalisé (casse et espaces ignorés)
+
+        Le message système (la personnalité) est représenté par `namespace`,
+        l'empreinte précalculée du profil, pour ne pas le re-hacher à chaque fois.
+        """
+        normalized = [(m["role"], " ".join(m["content"].lower().split())) for m in messages[1:]]
+        return hashlib.blake2b(json.dumps([namespace, normalized]).encode(), digest_size=16).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, text: str, tokens: int):
+        self._entries[key] = (time.monotonic() + self.ttl, text, tokens)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, namespace: str, messages: list) -> Optional[str]:
+        """Réponse en cache pour ce prompt, sinon None"""
+        entry = self._lookup(self.fingerprint(namespace, messages))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved_tokens += entry[2]
+        return entry[1]
+
+    def put(self, namespace: str, messages: list, text: str, tokens: int):
+        self._store(self.fingerprint(namespace, messages), text, tokens)
+
+    async def get_or_fetch(self, namespace: str, messages: list, fetch) -> tuple:
+        """Retourne (code HTTP, texte) depuis le cache, une requête en cours, ou fetch()"""
+        key = self.fingerprint(namespace, messages)
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            self.saved_tokens += entry[2]
+            return 200, entry[1]
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            status, text, tokens = await asyncio.shield(pending)
+            self.saved_tokens += tokens
+            return status, text
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            status, text, tokens = await fetch()
+            if status == 200:
+                self._store(key, text, tokens)
+            future.set_result((status, text, tokens))
+            return status, text
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Évite l'avertissement si personne n'attendait
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hit_rate": round(100 * (self.hits + self.coalesced) / lookups, 1) if lookups else 0,
+            "coalesced": self.coalesced,
+            "saved_tokens": self.saved_tokens
+        }
 
-        if not GROQ_API_KEY.startswith('gsk_'):
-            return "Il y a un problème avec ma connexion ! 😞"
+class JokePool:
+    """Blagues pré-générées d'un profil, renouvelées en tâche de fond"""
 
-        # Construire l'historique de conversation
-        conversation_history = context.get("conversation_history", [])
+    def __init__(self, profile_name: str):
+        self.profile_name = profile_name
+        self.jokes = deque()  # (texte, tokens) des blagues prêtes à servir
+        self.wakeup = asyncio.Event()
+        self.served = 0
+        self.saved_tokens = 0
 
-        # Préparer les messages pour Groq
+    async def refill(self):
+        """Complète le pool avec le quota Groq laissé libre (s'arrête dès qu'il manque)"""
+        profile = profile_registry.get(self.profile_name)
         messages = [
-            {"role": "system", "content": ALICIA_PERSONALITY}
+            profile.system_message,
+            {"role": "user", "content": profile.joke_request}
         ]
+        while len(self.jokes) < JOKE_POOL_SIZE:
+            status, joke, tokens = await request_groq_completion(messages, profile, PRIORITY_BACKGROUND)
+            if status != 200:
+                return
+            self.jokes.append((joke, tokens))
+
+    async def run(self, interval: float):
+        """Garde le pool plein et le renouvelle petit à petit"""
+        while True:
+            try:
+                await self.refill()
+            except Exception as e:
+                logging.error(f"Échec du remplissage des blagues : {e}")
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                # Personne n'a pioché : on remplace la plus ancienne pour varier
+                if self.jokes:
+                    self.jokes.popleft()
+
+    def take(self) -> Optional[str]:
+        """Retire une blague du pool (None s'il est vide)"""
+        if not self.jokes:
+            return None
+        joke, tokens = self.jokes.popleft()
+        self.wakeup.set()
+        self.served += 1
+        self.saved_tokens += tokens
+        return joke
+
+response_cache = ResponseCache(GROQ_CACHE_SIZE, GROQ_CACHE_TTL)
+joke_pools = {profile.name: JokePool(profile.name) for profile in profile_registry.all()}
+
+# Construction des prompts
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '600'))  # Tokens max d'historique
+HISTORY_SUMMARY = os.getenv('HISTORY_SUMMARY', '1') == '1'  # Résumer les échanges oubliés
+STREAMING_REPLIES = os.getenv('STREAMING_REPLIES', '0') == '1'  # Réponses envoyées phrase par phrase
+STREAM_CHARS_PER_SECOND = float(os.getenv('STREAM_CHARS_PER_SECOND', '30'))  # Vitesse de frappe simulée
+SUMMARY_MAX_CHARS = 400
+
+SENTENCE_END = re.compile(r"[.!?…]+(?:\s|$)")
+STREAM_PARTIAL = 206  # Flux coupé après au moins une phrase affichée : réponse tronquée
+
+def estimate_tokens(text: str) -> int:
+    """Estimation rapide du nombre de tokens (~4 caractères par token + rôle)"""
+    return len(text) // 4 + 4
+
+def serialize_groq_payload(messages: list, profile: BotProfile, stream: bool = False,
+                           model: Optional[str] = None) -> bytes:
+    """Corps JSON de la requête, en réutilisant le préfixe pré-sérialisé du profil si possible"""
+    if model and model != profile.groq_params["model"]:
+        params = {**profile.groq_params, "model": model, **({"stream": True} if stream else {})}
+        return json.dumps({**params, "messages": messages}).encode()
+    if messages[0] is profile.system_message and len(messages) > 1:
+        prefix = profile.stream_payload_prefix if stream else profile.payload_prefix
+        return prefix + b", " + json.dumps(messages[1:]).encode()[1:] + b"}"
+    params = {**profile.groq_params, "stream": True} if stream else profile.groq_params
+    return json.dumps({**params, "messages": messages}).encode()
+
+def build_groq_messages(message: str, context: UserContext, profile: BotProfile) -> list:
+    """Prépare les messages pour Groq (personnalité + historique dans le budget de tokens)"""
+    messages = [profile.system_message]
+    budget = HISTORY_TOKEN_BUDGET - estimate_tokens(message)
+
+    if context.summary:
+        summary = f"Résumé du début de la conversation : {context.summary}"
+        messages.append({"role": "system", "content": summary})
+        budget -= estimate_tokens(summary)
+
+    # Ajouter l'historique récent, du plus récent au plus ancien, tant que ça rentre
+    selected = []
+    for exchange in reversed(context.conversation_history):
+        cost = exchange.get("tokens") or estimate_tokens(exchange["user"]) + estimate_tokens(exchange["alicia"])
+        if cost > budget:
+            break
+        budget -= cost
+        selected.append(exchange)
+
+    for exchange in reversed(selected):
+        messages.append({"role": "user", "content": exchange["user"]})
+        messages.append({"role": "assistant", "content": exchange["alicia"]})
+
+    # Ajouter le message actuel
+    messages.append({"role": "user", "content": message})
+    return messages
+
+def summarize_into(context: UserContext, dropped: list):
+    """Résume à peu de frais les échanges qui sortent de l'historique"""
+    topics = " ; ".join(f"« {exchange['user'][:80]} »" for exchange in dropped)
+    summary = f"{context.summary} ; {topics}" if context.summary else f"L'utilisateur a dit : {topics}"
+    if len(summary) > SUMMARY_MAX_CHARS:
+        summary = "… " + summary[-SUMMARY_MAX_CHARS:].split(" ; ", 1)[-1]
+    context.summary = summary
+
+async def send_to_provider(provider: LLMProvider, messages: list, profile: BotProfile,
+                           estimated_tokens: int, deadline: float) -> tuple:
+    """Un appel à un fournisseur (quota déjà réservé) : (code, texte, tokens, retry-after)
+
+    Met à jour métriques, disjoncteur et score de santé ; les erreurs réseau
+    deviennent un code 503. Une annulation (requête doublée perdante) n'est
+    comptée ni comme succès ni comme échec.
+    """
+    llm_requests.inc(provider.name)
+    body = serialize_groq_payload(messages, profile, model=provider.model)
+    started = time.perf_counter()
+    try:
+        # Faire l'appel sans bloquer la boucle (délai global par requête)
+        async with asyncio.timeout(min(GROQ_TIMEOUT, max(deadline - time.monotonic(), 0.1))):
+            response = await get_groq_client().post(provider.url, headers=provider.headers, content=body)
+    except (httpx.TransportError, TimeoutError):
+        STAGE_GROQ_REQUEST.observe(time.perf_counter() - started)
+        groq_responses.inc("error")
+        provider.breaker.record_failure()
+        provider.record(False)
+        return 503, None, 0, None
+
+    elapsed = time.perf_counter() - started
+    STAGE_GROQ_REQUEST.observe(elapsed)
+    status = response.status_code
+    groq_responses.inc(str(status))
+    provider.limiter.update_from_headers(response.headers)
+    if status == 200:
+        provider.breaker.record_success()
+        provider.record(True, elapsed)
+        result = response.json()
+        usage = result.get("usage", {})
+        groq_tokens.inc("prompt", usage.get("prompt_tokens", 0))
+        groq_tokens.inc("completion", usage.get("completion_tokens", 0))
+        tokens = usage.get("total_tokens", 0)
+        if tokens:
+            provider.limiter.adjust_tokens(estimated_tokens, tokens)
+        return 200, result["choices"][0]["message"]["content"].strip(), tokens, None
+
+    retry_after = None
+    if status == 429:
+        # Le fournisseur répond : pas une panne, mais tout le monde doit ralentir chez lui
+        provider.breaker.record_success()
+        retry_after = parse_reset_duration(response.headers.get("retry-after"))
+        if retry_after:
+            provider.limiter.pause(retry_after)
+    elif status >= 500:
+        provider.breaker.record_failure()
+        provider.record(False)
+    return status, None, 0, retry_after
+
+async def hedged_send(primary: LLMProvider, providers: list, messages: list, profile: BotProfile,
+                      estimated_tokens: int, deadline: float) -> tuple:
+    """Envoie à `primary` et, s'il dépasse son p95, double la requête ailleurs
+
+    Le doublon part vers le fournisseur sain suivant (ou le même, à défaut)
+    seulement si son quota le permet tout de suite. La première réponse 200
+    gagne et l'autre requête est annulée.
+    """
+    first = asyncio.create_task(send_to_provider(primary, messages, profile, estimated_tokens, deadline))
+    tasks = {first}
+    hedge_delay = primary.hedge_delay()
+    hedged = False
+    result = (503, None, 0, None)
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(tasks, timeout=None if hedged else hedge_delay,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                backup = next((provider for provider in providers
+                               if provider is not primary and provider.healthy), primary)
+                if backup.limiter.try_acquire(estimated_tokens):
+                    llm_hedges.inc("fired")
+                    task = asyncio.create_task(send_to_provider(backup, messages, profile, estimated_tokens, deadline))
+                    tasks.add(task)
+                continue
+            for task in done:
+                tasks.discard(task)
+                result = task.result()
+                if result[0] == 200:
+                    if task is not first:
+                        llm_hedges.inc("won")
+                    return result
+        return result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def request_groq_completion(messages: list, profile: BotProfile,
+                                  priority: int = PRIORITY_CONVERSATION) -> tuple:
+    """Appelle le LLM et retourne (code HTTP, texte, tokens consommés)
+
+    Essaie les fournisseurs sains dans l'ordre (limiteur et disjoncteur propres
+    à chacun), double les conversations trop lentes et réessaie les 429/5xx
+    avec backoff. Retourne 503 quand tous les disjoncteurs sont ouverts.
+    """
+    # Estimation grossière (~4 caractères par token) pour le seau de tokens
+    max_tokens = profile.groq_params["max_tokens"]
+    estimated_tokens = sum(len(m["content"]) for m in messages) // 4 + max_tokens
+    deadline = time.monotonic() + GROQ_DEADLINE
+    status = 503
+    failed = None  # Fournisseur du dernier échec : repassé en dernier pour le prochain essai
+
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        providers = sorted(ranked_providers(), key=lambda provider: provider is failed)
+        primary = next((provider for provider in providers if provider.breaker.allow()), None)
+        if primary is None:
+            return 503, None, 0
+
+        if priority == PRIORITY_BACKGROUND:
+            # Tâche de fond : seulement le quota que les conversations laissent libre
+            if not primary.limiter.try_acquire_spare(estimated_tokens):
+                return 429, None, 0
+        else:
+            remaining = deadline - time.monotonic()
+            try:
+                await asyncio.wait_for(primary.limiter.acquire(estimated_tokens, priority), remaining)
+            except asyncio.TimeoutError:
+                return 429, None, 0
+
+        if LLM_HEDGING and priority == PRIORITY_CONVERSATION:
+            status, text, tokens, retry_after = await hedged_send(
+                primary, providers, messages, profile, estimated_tokens, deadline)
+        else:
+            status, text, tokens, retry_after = await send_to_provider(
+                primary, messages, profile, estimated_tokens, deadline)
+        if status == 200 or (status < 500 and status != 429):
+            return status, text, tokens
+        failed = primary
+
+        delay = max(backoff_delay(attempt), retry_after or 0)
+        if attempt == GROQ_MAX_RETRIES or time.monotonic() + delay >= deadline:
+            break
+        await asyncio.sleep(delay)
+
+    return status, None, 0
+
+async def iter_groq_stream(response: httpx.Response) -> AsyncIterator[str]:
+    """Décode le flux SSE de Groq et produit les morceaux de texte au fil de l'eau"""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return
+        choices = json.loads(payload).get("choices") or []
+        if choices:
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+async def read_groq_stream(provider: LLMProvider, messages: list, profile: BotProfile,
+                           sentences: asyncio.Queue) -> tuple:
+    """Lit le flux SSE d'un fournisseur et retourne (code HTTP, texte reçu)
+
+    Chaque début de réponse terminé par une phrase est déposé dans `sentences`,
+    puis None en fin de lecture. Seule cette lecture est soumise à GROQ_DEADLINE,
+    chronométrée et comptée pour le disjoncteur du fournisseur. Un flux coupé
+    après une phrase déjà déposée donne (STREAM_PARTIAL, phrases déposées).
+    """
+    text = ""
+    flushed = 0  # Texte déjà déposé dans la file
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(GROQ_DEADLINE):
+            async with get_groq_client().stream(
+                "POST", provider.url, headers=provider.headers,
+                content=serialize_groq_payload(messages, profile, stream=True, model=provider.model)
+            ) as response:
+                groq_responses.inc(str(response.status_code))
+                provider.limiter.update_from_headers(response.headers)
+                if response.status_code != 200:
+                    if response.status_code >= 500:
+                        provider.breaker.record_failure()
+                        provider.record(False)
+                    elif response.status_code == 429:
+                        provider.limiter.pause(parse_reset_duration(response.headers.get("retry-after")) or 1)
+                    return response.status_code, None
+
+                async for delta in iter_groq_stream(response):
+                    text += delta
+                    end = None
+                    for match in SENTENCE_END.finditer(text, flushed):
+                        end = match.end()
+                    if end is not None:
+                        flushed = end
+                        sentences.put_nowait(text[:end].strip())
+    except (httpx.TransportError, TimeoutError):
+        groq_responses.inc("error")
+        provider.breaker.record_failure()
+        provider.record(False)
+        if not flushed:
+            raise
+        # Coupé en cours de route : seules les phrases complètes (déjà affichées) restent
+        return STREAM_PARTIAL, text[:flushed]
+    else:
+        provider.breaker.record_success()
+        provider.record(True)
+    finally:
+        STAGE_GROQ_REQUEST.observe(time.perf_counter() - started)
+        sentences.put_nowait(None)
+    return 200, text
+
+async def stream_groq_completion(messages: list, profile: BotProfile, priority: int,
+                                 on_partial: Callable[[str], Awaitable[None]]) -> tuple:
+    """Comme request_groq_completion, mais appelle on_partial à chaque phrase terminée
+
+    Le flux est lu dans une tâche à part (read_groq_stream) : les pauses de
+    frappe de on_partial ne retardent ni ne coupent la lecture. Si plusieurs
+    phrases arrivent pendant une pause, seule la plus longue version est
+    affichée. Un flux déjà entamé ne peut pas être doublé : seul le premier
+    fournisseur disponible est appelé, sans requête de secours.
+    """
+    provider = next((provider for provider in ranked_providers() if provider.breaker.allow()), None)
+    if provider is None:
+        return 503, None, 0
+
+    max_tokens = profile.groq_params["max_tokens"]
+    estimated_tokens = sum(len(m["content"]) for m in messages) // 4 + max_tokens
+    try:
+        await asyncio.wait_for(provider.limiter.acquire(estimated_tokens, priority), GROQ_DEADLINE)
+    except asyncio.TimeoutError:
+        return 429, None, 0
 
-        # Ajouter l'historique récent (5 derniers échanges max)
-        for exchange in conversation_history[-5:]:
-            messages.append({"role": "user", "content": exchange["user"]})
-            messages.append({"role": "assistant", "content": exchange["alicia"]})
+    llm_requests.inc(provider.name)
+    sentences = asyncio.Queue()
+    reader = asyncio.create_task(read_groq_stream(provider, messages, profile, sentences))
+    try:
+        while True:
+            partial = await sentences.get()
+            while partial is not None and not sentences.empty():
+                partial = sentences.get_nowait()
+            if partial is None:
+                break
+            await on_partial(partial)
+        status, text = await reader
+    finally:
+        reader.cancel()
+
+    if status not in (200, STREAM_PARTIAL):
+        return status, None, 0
+    return status, text.strip(), estimated_tokens - max_tokens + estimate_tokens(text)
+
+def record_exchange(context: UserContext, message: str, ai_response: str):
+    """Sauvegarde un échange dans l'historique (avec sa taille estimée en tokens)"""
+    context.conversation_history.append({
+        "user": message,
+        "alicia": ai_response,
+        "tokens": estimate_tokens(message) + estimate_tokens(ai_response)
+    })
 
-        # Ajouter le message actuel
-        messages.append({"role": "user", "content": message})
+    # Garder seulement les 8 derniers échanges
+    if len(context.conversation_history) > 8:
+        if HISTORY_SUMMARY:
+            summarize_into(context, context.conversation_history[:-8])
+        del context.conversation_history[:-8]
 
-        # Préparer la requête
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
+async def get_groq_response(message: str, user_id: int, context: UserContext, profile: BotProfile,
+                            use_cache: bool = True, priority: int = PRIORITY_CONVERSATION,
+                            on_partial: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
+    """Obtient une réponse de Groq (en streaming si on_partial est fourni et activé)"""
+    try:
+        if not llm_providers:
+            return "Désolée, je ne peux pas répondre maintenant ! 😅"
 
-        data = {
-            "model": "llama-3.1-8b-instant",
-            "messages": messages,
-            "temperature": 0.8,
-            "max_tokens": 150,
-            "top_p": 0.9
-        }
+        if not LLM_PROVIDERS and not GROQ_API_KEY.startswith('gsk_'):
+            return "Il y a un problème avec ma connexion ! 😞"
 
-        # Faire l'appel à Groq
-        response = requests.post(GROQ_API_URL, headers=headers, json=data, timeout=15)
+        messages = build_groq_messages(message, context, profile)
+        if on_partial is not None and STREAMING_REPLIES:
+            ai_response = response_cache.get(profile.prompt_key, messages) if use_cache else None
+            status = 200
+            if ai_response is None:
+                status, ai_response, tokens = await stream_groq_completion(messages, profile, priority, on_partial)
+                if status == 200 and use_cache:  # Jamais une réponse tronquée
+                    response_cache.put(profile.prompt_key, messages, ai_response, tokens)
+        elif use_cache:
+            status, ai_response = await response_cache.get_or_fetch(
+                profile.prompt_key, messages, lambda: request_groq_completion(messages, profile, priority)
+            )
+        else:
+            status, ai_response, _ = await request_groq_completion(messages, profile, priority)
 
-        if response.status_code == 401:
+        if status == 401:
             return "Ma connexion a des soucis ! 😅 Réessaie dans un moment !"
-        elif response.status_code == 429:
+        elif status == 429:
             return "Je suis débordée là ! 😵 Attends un peu !"
-        elif response.status_code != 200:
+        elif status not in (200, STREAM_PARTIAL):
             return "Oups, j'ai un petit bug ! 🙈 Tu peux répéter ?"
 
-        result = response.json()
-        ai_response = result["choices"][0]["message"]["content"].strip()
-
-        # Sauvegarder dans l'historique
-        if "conversation_history" not in context:
-            context["conversation_history"] = []
-
-        context["conversation_history"].append({
-            "user": message,
-            "alicia": ai_response
-        })
-
-        # Garder seulement les 8 derniers échanges
-        if len(context["conversation_history"]) > 8:
-            context["conversation_history"] = context["conversation_history"][-8:]
-
+        record_exchange(context, message, ai_response)
+        user_contexts.mark_dirty((profile.name, user_id))  # Modifié après l'attente de Groq
         return ai_response
 
     except Exception as e:
         return "J'ai la tête ailleurs ! 😅 Tu disais quoi ?"
 
-def suggest_fanvue_empathically(user_id: int, context: dict) -> str:
+async def get_joke(user_id: int, context: UserContext, profile: BotProfile) -> str:
+    """Sert une blague du pool, ou la demande à Groq si le pool est vide"""
+    joke = joke_pools[profile.name].take()
+    if joke is None:
+        return await get_groq_response(profile.joke_request, user_id, context, profile,
+                                       use_cache=False, priority=PRIORITY_JOKE)
+
+    record_exchange(context, profile.joke_request, joke)
+    user_contexts.mark_dirty((profile.name, user_id))
+    return joke
+
+def suggest_fanvue_empathically(user_id: int, context: UserContext, profile: BotProfile) -> str:
     """Suggère Fanvue de manière empathique"""
-    suggestions = [
-        "Tu sais, je partage beaucoup de contenu exclusif sur mon Fanvue. Ça pourrait t'intéresser ! 😊 https://www.fanvue.com/aliciia/fv-1",
-        "Si tu veux en savoir plus sur moi, mon Fanvue est l'endroit idéal ! 😉 https://www.fanvue.com/aliciia/fv-1",
-        "Je poste souvent des mises à jour sur mon Fanvue. N'hésite pas à y jeter un œil ! 👀 https://www.fanvue.com/aliciia/fv-1"
-    ]
-    return random.choice(suggestions)
-
-async def get_alicia_response(message: str, user_id: int) -> str:
-    """Fonction principale pour obtenir la réponse d'Alicia avec analytics"""
-    
-    # Log du message
-    log_metric("message", user_id)
+    return random.choice(profile.fanvue_suggestions)
+
+async def get_alicia_response(message: str, user_id: int, profile: BotProfile,
+                              on_partial: Optional[Callable[[str], Awaitable[None]]] = None) -> tuple:
+    """Fonction principale pour obtenir la réponse du profil avec analytics
+
+    Retourne (réponse, branche) ; la branche (groq, intent, ending...) dit si
+    la réponse peut encore être remplacée (SUPERSEDABLE_ROUTES). on_partial
+    reçoit le début de la réponse Groq dès qu'une phrase est complète (mode
+    streaming) ; la réponse retournée reste toujours complète.
+    """
     
-    # Initialiser le contexte utilisateur
-    if user_id not in user_contexts:
-        user_contexts[user_id] = {
-            "first_interaction": True,
-            "conversation_history": [],
-            "user_name": None,
-            "start_time": time.time(),
-            "session_start": time.time()
-        }
-        log_metric("new_user")
+    # Initialiser le contexte utilisateur (un contexte par profil)
+    key = (profile.name, user_id)
+    context = await user_contexts.fetch(key)
+    if context is None:
+        context = user_contexts.new_session(key)
         log_metric("session_start")
+        # Contexte oublié (inactivité, LRU) ne veut pas dire nouvel utilisateur
+        if analytics["seen_users"].add(storage_key(key)):
+            log_metric("new_user")
+        else:
+            log_metric("returning_user", user_id)
     else:
         # Utilisateur qui revient
         log_metric("returning_user", user_id)
-    
-    context = user_contexts[user_id]
+    context.message_count += 1
+    user_contexts.mark_dirty(key)  # Les modifications suivantes du tour sont synchrones
     
     # Première interaction
-    if context["first_interaction"]:
-        context["first_interaction"] = False
-        return "ça me fait plaisir de te voir !"
+    if context.first_interaction:
+        context.first_interaction = False
+        event_log.emit("reply", user_id, None, "first_reply", profile.name)
+        return profile.first_reply, "first_reply"
     
     # Vérifier si la conversation doit se terminer
-    if should_end_conversation(context):
+    if should_end_conversation(context, profile):
         # Log de fin de session
-        session_duration = time.time() - context["session_start"]
-        conversation_length = len(context["conversation_history"])
-        
-        log_metric("session_end", value=session_duration)
-        log_metric("conversation_length", value=conversation_length)
+        log_session_end(key, context)
         
         # Réinitialiser le contexte
-        user_contexts[user_id] = {
-            "first_interaction": True,
-            "conversation_history": [],
-            "user_name": None,
-            "start_time": time.time(),
-            "session_start": time.time()
-        }
-        return get_ending_message()
+        user_contexts.new_session(key)
+        event_log.emit("reply", user_id, context.message_count, "ending", profile.name)
+        return get_ending_message(profile), "ending"
     
     # Détecter contenu sexuel - réponse directe
-    sexual_score = detect_sexual_content(message)
+    started = time.perf_counter()
+    sexual_score = detect_sexual_content(message, profile)
+    STAGE_SEXUAL_DETECTION.observe(time.perf_counter() - started)
     if sexual_score > 0:
         increment_sexual_counter(context)
-        if should_send_fanvue(user_id, context):
-            return random.choice([
-                "Haha tu es coquin ! 😘 J'ai un Fanvue si ça t'intéresse... https://www.fanvue.com/aliciia/fv-1",
-                "Oh là là ! 😉 Rejoins-moi sur mon Fanvue pour plus ! https://www.fanvue.com/aliciia/fv-1",
-                "Tu me fais rougir ! 🔥 Mon Fanvue : https://www.fanvue.com/aliciia/fv-1"
-            ])
+        if should_send_fanvue(user_id, context, profile):
+            event_log.emit("reply", user_id, sexual_score, "fanvue_tease", profile.name)
+            return random.choice(profile.fanvue_teases), "fanvue_tease"
         else:
-            if sexual_score == 1:
-                return random.choice([
-                    "Haha tu es coquin ! 😘",
-                    "Oh là là ! 😉",
-                    "Tu me fais rougir ! 🔥"
-                ])
-            elif sexual_score == 2:
-                return random.choice([
-                    "Waouh, tu n'y vas pas de main morte ! 😘",
-                    "Oh là là, tu me surprends ! 😉",
-                    "Tu me fais vraiment rougir ! 🔥"
-                ])
-            elif sexual_score >= 3:
-                return random.choice([
-                    "Oh mon dieu, tu es vraiment direct ! 😘",
-                    "Waouh, tu es plein d'audace ! 😉",
-                    "Tu me fais carrément rougir ! 🔥"
-                ])
+            # Réponses graduées selon le score (1, 2, puis 3 et plus)
+            event_log.emit("reply", user_id, sexual_score, "sexual", profile.name)
+            return random.choice(profile.sexual_replies[min(sexual_score, 3) - 1]), "sexual"
+
+    # Question courante (salut, âge, "t'es un robot ?") : réponse locale sans Groq
+    intent_reply = match_intent(message, profile)
+    if intent_reply is not None:
+        record_exchange(context, message, intent_reply)
+        event_log.emit("reply", user_id, None, "intent", profile.name)
+        return intent_reply, "intent"
+
+    thresholds = profile.thresholds
 
     # Mentionner qu'elle va bientôt partir (avec une petite probabilité)
-    if should_hint_ending(context) and random.random() < 0.15:  # 15% de chance
-        return get_hint_message()
+    if should_hint_ending(context, profile) and random.random() < thresholds.hint_probability:
+        event_log.emit("reply", user_id, context.message_count, "hint_ending", profile.name)
+        return get_hint_message(profile), "hint_ending"
 
     # Suggérer Fanvue de manière empathique après quelques interactions
-    if len(context["conversation_history"]) > 5 and random.random() < 0.08:  # 8% de chance
-        return suggest_fanvue_empathically(user_id, context)
+    if (len(context.conversation_history) > thresholds.fanvue_min_history
+            and random.random() < thresholds.fanvue_probability):
+        event_log.emit("reply", user_id, len(context.conversation_history), "fanvue", profile.name)
+        return suggest_fanvue_empathically(user_id, context, profile), "fanvue"
 
     # Utiliser Groq pour toutes les autres réponses
-    return get_groq_response(message, user_id, context)
+    event_log.emit("reply", user_id, None, "groq", profile.name)
+    return await get_groq_response(message, user_id, context, profile, on_partial=on_partial), "groq"
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Traite les chats en parallèle en gardant l'ordre des messages d'un même chat"""
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int):
+        # Le sémaphore de base borne les updates en attente, le nôtre ceux en cours
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        self._chat_locks = {}
+        self.in_flight = 0  # Updates en attente de leur chat ou en cours
+
+    async def do_process_update(self, update, coroutine):
+        self.in_flight += 1
+        try:
+            await self._process_in_order(update, coroutine)
+        finally:
+            self.in_flight -= 1
+
+    async def _process_in_order(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            async with self._running:
+                await coroutine
+            return
+
+        # Verrou par chat, supprimé dès que plus personne ne l'attend
+        entry = self._chat_locks.get(chat.id)
+        if entry is None:
+            entry = self._chat_locks[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+async def typing_pause(update: Update, context: ContextTypes.DEFAULT_TYPE, delay: float):
+    """Attend `delay` secondes en affichant l'indicateur "en train d'écrire..." """
+    if not ARTIFICIAL_DELAYS:
+        return
+    deadline = time.monotonic() + delay
+    while True:
+        try:
+            await context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING)
+        except TelegramError:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(TYPING_REFRESH, remaining))
+
+# Envoi vers Telegram : ~30 messages/s par bot et ~1 message/s par chat au maximum
+TELEGRAM_SENDS_PER_SECOND = float(os.getenv('TELEGRAM_SENDS_PER_SECOND', '25'))  # Marge sous les ~30/s
+TELEGRAM_CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', '1'))  # Secondes entre 2 envois d'un chat
+TELEGRAM_SEND_RETRIES = int(os.getenv('TELEGRAM_SEND_RETRIES', '3'))  # Nouveaux essais après un RetryAfter
+
+class TelegramSender(PriorityLimiter):
+    """File d'envoi d'un bot : débit global, rythme par chat, RetryAfter et priorités
+
+    Chaque chat réserve son créneau dans l'ordre d'appel (l'ordre des messages
+    d'un chat est donc conservé), puis les envois prêts se partagent le débit
+    global du bot, conversations d'abord.
+    """
+
+    def __init__(self, per_second: float, chat_interval: float, max_retries: int):
+        super().__init__()
+        self.bucket = TokenBucket(max(1.0, per_second / 10), per_second)  # Rafales courtes seulement
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self._chat_slots = {}  # Prochain créneau réservé de chaque chat (horloge monotone)
+        self._last_sent = {}  # Dernier envoi effectif de chaque chat
+        self._prune_at = 1024
+
+    def _time_until(self, cost: float, now: float) -> float:
+        return self.bucket.time_until(cost, now)
+
+    def _take(self, cost: float):
+        self.bucket.take(cost)
+
+    async def send(self, chat_id: int, call: Callable[[], Awaitable], priority: int = PRIORITY_CONVERSATION):
+        """Exécute `call` (reply_text, edit_text...) quand les limites de Telegram le permettent"""
+        for attempt in range(self.max_retries + 1):
+            await self._wait_chat_slot(chat_id)
+            await self.acquire(1, priority)
+            # L'attente du débit global a pu rapprocher deux envois du même chat
+            late = self._last_sent.get(chat_id, -math.inf) + self.chat_interval - time.monotonic()
+            if late > 0:
+                await asyncio.sleep(late)
+            self._last_sent[chat_id] = time.monotonic()
+            try:
+                result = await call()
+            except RetryAfter as e:
+                telegram_sends.inc("retry_after")
+                if attempt == self.max_retries:
+                    raise
+                # Telegram n'indique pas quelle limite a sauté : on ralentit tout le bot
+                delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+                self.pause(delay)
+                self._chat_slots[chat_id] = max(self._chat_slots.get(chat_id, 0.0), time.monotonic() + delay)
+                continue
+            telegram_sends.inc("sent")
+            return result
+
+    async def _wait_chat_slot(self, chat_id: int):
+        now = time.monotonic()
+        slot = max(now, self._chat_slots.get(chat_id, 0.0))
+        self._chat_slots[chat_id] = slot + self.chat_interval
+        if len(self._chat_slots) >= self._prune_at:
+            # Oublie les chats dont le créneau est déjà passé
+            self._chat_slots = {chat: next_slot for chat, next_slot in self._chat_slots.items() if next_slot > now}
+            self._last_sent = {chat: self._last_sent[chat] for chat in self._chat_slots if chat in self._last_sent}
+            self._prune_at = max(1024, 2 * len(self._chat_slots))
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+async def send_reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str,
+                     priority: int = PRIORITY_CONVERSATION):
+    """Répond dans le chat de l'update en passant par la file d'envoi du bot"""
+    return await context.bot_data["sender"].send(
+        update.effective_chat.id, lambda: update.message.reply_text(text), priority
+    )
+
+# Réponses qu'un nouveau message peut remplacer : leur seul effet sur le
+# contexte (un échange d'historique, un message compté) est annulé par retract_replies
+SUPERSEDABLE_ROUTES = frozenset({"groq", "intent"})
+
+@dataclass(slots=True)
+class DelayedReply:
+    """Réponse prête, envoyée à son échéance sauf annulation"""
+    key: tuple
+    due: float
+    update: Update
+    context: ContextTypes.DEFAULT_TYPE
+    text: str
+    priority: int
+    messages: tuple  # Messages à reprendre si elle est remplacée (vide : jamais remplacée)
+    route: str = ""  # Branche de get_alicia_response qui l'a produite
+    cancelled: bool = False
+
+class DelayedReplyScheduler:
+    """Toutes les réponses en attente de leur pause "humaine" dans un seul tas
+
+    Les handlers rendent la main dès que la réponse est prête : pas de
+    coroutine endormie par message, un seul timer pour tout le process. Une
+    réponse pas encore envoyée peut être annulée (nouveau message, /clear).
+    """
+
+    def __init__(self):
+        self._heap = []  # Tas de (prochain réveil, ordre, réponse)
+        self._by_key = {}  # Réponses en attente de chaque utilisateur
+        self._order = itertools.count()
+        self._timer = None
+        self._tasks = set()  # Envois en cours
+
+    def __len__(self) -> int:
+        return sum(len(replies) for replies in self._by_key.values())
+
+    def schedule(self, key: tuple, delay: float, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                 text: str, priority: int = PRIORITY_CONVERSATION, messages: tuple = (),
+                 route: str = "") -> DelayedReply:
+        """Programme l'envoi de `text` dans `delay` secondes (indicateur de frappe compris)"""
+        now = time.monotonic()
+        reply = DelayedReply(key, now + (delay if ARTIFICIAL_DELAYS else 0), update, context,
+                             text, priority, tuple(messages), route)
+        self._by_key.setdefault(key, []).append(reply)
+        if reply.due > now:
+            self._show_typing(reply)
+        self._push(reply, now)
+        return reply
+
+    def supersede(self, key: tuple) -> list:
+        """Annule les réponses de conversation pas encore envoyées (un nouveau message arrive)
+
+        Seules les réponses sans effet de bord (SUPERSEDABLE_ROUTES) sont
+        annulées : une fin de session ou un compteur de messages osés déjà
+        appliqués ne se rejouent pas.
+        """
+        replies = self._by_key.get(key)
+        if not replies:
+            return []
+        cancelled = [reply for reply in replies if reply.messages and reply.route in SUPERSEDABLE_ROUTES]
+        for reply in cancelled:
+            reply.cancelled = True
+        replies[:] = [reply for reply in replies if not reply.cancelled]
+        if not replies:
+            del self._by_key[key]
+        return cancelled
+
+    def cancel(self, key: tuple):
+        """Annule toutes les réponses en attente d'un utilisateur (/clear)"""
+        for reply in self._by_key.pop(key, ()):
+            reply.cancelled = True
+
+    async def drain(self):
+        """Envoie tout de suite les réponses en attente et attend la fin des envois"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._heap:
+            reply = heapq.heappop(self._heap)[2]
+            if not reply.cancelled:
+                self._send(reply)
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def _push(self, reply: DelayedReply, now: float):
+        # Réveil à l'échéance, ou avant pour rafraîchir l'indicateur de frappe
+        wake_at = min(reply.due, now + TYPING_REFRESH)
+        heapq.heappush(self._heap, (wake_at, next(self._order), reply))
+        if self._heap[0][2] is reply:
+            self._arm(now)
+
+    def _arm(self, now: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(max(0.0, self._heap[0][0] - now), self._fire)
+
+    def _fire(self):
+        self._timer = None
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            reply = heapq.heappop(self._heap)[2]
+            if reply.cancelled:
+                continue
+            if reply.due > now:
+                self._show_typing(reply)
+                heapq.heappush(self._heap, (min(reply.due, now + TYPING_REFRESH), next(self._order), reply))
+            else:
+                self._send(reply)
+        if self._heap:
+            self._arm(now)
+
+    def _show_typing(self, reply: DelayedReply):
+        self._spawn(self._typing(reply))
+
+    def _send(self, reply: DelayedReply):
+        replies = self._by_key.get(reply.key)
+        if replies is not None:
+            replies.remove(reply)
+            if not replies:
+                del self._by_key[reply.key]
+        self._spawn(self._deliver(reply))
+
+    async def _typing(self, reply: DelayedReply):
+        try:
+            await reply.context.bot.send_chat_action(reply.update.effective_chat.id, ChatAction.TYPING)
+        except TelegramError:
+            pass
+
+    async def _deliver(self, reply: DelayedReply):
+        started = time.perf_counter()
+        try:
+            await send_reply(reply.update, reply.context, reply.text, reply.priority)
+        except Exception as e:
+            logging.error(f"Échec d'envoi d'une réponse à {reply.key} : {e}")
+        else:
+            STAGE_TELEGRAM_SEND.observe(time.perf_counter() - started)
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+delayed_replies = DelayedReplyScheduler()
+
+def current_profile(context: ContextTypes.DEFAULT_TYPE) -> BotProfile:
+    """Profil (dans sa dernière version chargée) du bot qui reçoit l'update"""
+    return profile_registry.get(context.bot_data["profile"])
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
+    profile = current_profile(context)
     log_metric("command", user_id, command="start")
     
-    user_contexts[user_id] = {
-        "first_interaction": True,
-        "conversation_history": [],
-        "user_name": None,
-        "start_time": time.time(),
-        "session_start": time.time()
-    }
+    user_contexts.new_session((profile.name, user_id))
 
-    await asyncio.sleep(1.5)
-    await update.message.reply_text("Coucou toi <3")
+    delayed_replies.schedule((profile.name, user_id), 1.5, update, context, profile.welcome_message)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log_metric("command", update.effective_user.id, command="help")
-    await asyncio.sleep(1)
 
-    await update.message.reply_text(
+    delayed_replies.schedule(
+        (current_profile(context).name, update.effective_user.id), 1, update, context,
         "**Commandes :**\n"
         "• /start - On fait connaissance !\n"
         "• /blague - Une petite blague !\n"
         "• /clear - On repart à zéro !\n"
         "• /stats - Statistiques du bot\n\n"
         "**Surtout parle-moi ! 💕**\n"
-        "Je suis là pour t'écouter ! 😊"
+        "Je suis là pour t'écouter ! 😊",
+        PRIORITY_BACKGROUND
     )
 
 async def blague_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log_metric("command", update.effective_user.id, command="blague")
-    await asyncio.sleep(1)
+    started = time.monotonic()
 
-    # Utiliser Groq même pour les blagues
+    # Blague pré-générée par Groq (ou demandée en direct si le pool est vide)
     user_id = update.effective_user.id
-    blague_request = "Raconte-moi une blague courte et drôle avec ton humour marseillais"
-    response = get_groq_response(blague_request, user_id, user_contexts.get(user_id, {}))
-
-    await update.message.reply_text(response)
+    profile = current_profile(context)
+    response = await get_joke(user_id, await user_contexts.fetch((profile.name, user_id)) or UserContext(), profile)
+
+    delayed_replies.schedule((profile.name, user_id), 1 - (time.monotonic() - started), update, context,
+                             response, PRIORITY_JOKE)
+
+async def get_cluster_summary() -> dict:
+    """Résumé des analytics de tous les shards ; un shard qui ne répond pas est ignoré"""
+    if WORKERS == 1:
+        return get_analytics_summary()
+
+    # Copie : la fusion ne doit pas toucher aux analytics de ce processus
+    merged = decode_analytics(encode_analytics(analytics))
+    counters = analytics_counters()
+    peers = [index for index in range(WORKERS) if index != WORKER_INDEX]
+    headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET or ""}
+    async with httpx.AsyncClient(timeout=SHARD_STATS_TIMEOUT, headers=headers) as client:
+        responses = await asyncio.gather(
+            *(client.get(f"http://127.0.0.1:{SHARD_BASE_PORT + index}/shard/analytics") for index in peers),
+            return_exceptions=True
+        )
+    answered = 1
+    for response in responses:
+        if isinstance(response, Exception) or response.status_code != 200:
+            continue
+        try:
+            shard = response.json()
+            shard_analytics, shard_counters = decode_analytics(shard["analytics"]), decode_counters(shard["counters"])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.error(f"Analytics d'un shard illisibles, ignorées : {e}")
+            continue
+        merge_analytics(merged, shard_analytics)
+        merge_counters(counters, shard_counters)
+        answered += 1
+
+    summary = get_analytics_summary(merged, counters)
+    summary["general"]["shards"] = f"{answered}/{WORKERS}"
+    return summary
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Commande pour voir les statistiques détaillées"""
     log_metric("command", update.effective_user.id, command="stats")
     
-    stats = get_analytics_summary()
+    stats = await get_cluster_summary()
+    shards = stats['general'].get('shards')
+    shards_line = f"\n🧩 Shards: {shards}" if shards else ""
     
-    message = f"""📊 **Analytics Alicia**
+    message = f"""📊 **Analytics {current_profile(context).display_name}**
 
 **📈 Général**
 👥 Total utilisateurs: {stats['general']['total_users']}
 💬 Total messages: {stats['general']['total_messages']}
 🔄 Sessions totales: {stats['general']['total_sessions']}
 🔙 Utilisateurs récurrents: {stats['general']['returning_users']}
-⏰ Uptime: {stats['general']['uptime_hours']}h
+⏰ Uptime: {stats['general']['uptime_hours']}h{shards_line}
 
 **📅 Aujourd'hui**
 💬 Messages: {stats['today']['messages']}
@@ -486,75 +2819,751 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 **📊 Moyennes**
 💬 Messages/conversation: {stats['averages']['conversation_length']}
 ⏱️ Durée session: {stats['averages']['session_duration_minutes']} min
+📏 P95: {stats['averages']['conversation_length_p95']} messages, {stats['averages']['session_duration_p95_minutes']} min
+
+**⚡ Cache Groq**
+🎯 Taux de hit: {stats['cache']['hit_rate']}%
+🔗 Requêtes fusionnées: {stats['cache']['coalesced']}
+😂 Blagues du pool: {stats['cache']['jokes_from_pool']}
+💰 Tokens économisés: {stats['cache']['saved_tokens']}
+🧠 Réponses locales: {stats['cache']['intent_hits']} ({stats['cache']['intent_hit_rate']}%, ~{stats['cache']['intent_saved_seconds']}s de Groq évitées)
+
+**📥 File d'attente**
+⏳ En attente: {stats['queue']['pending']} (dont {stats['queue']['ready']} prêts)
+⚙️ En cours: {stats['queue']['running']}
+🔗 Messages fusionnés: {stats['queue']['merged']}
+🚫 Messages ignorés (flood): {stats['queue']['dropped']}
 
 **🔥 Commandes populaires**"""
     
     for cmd, count in stats['popular_commands'].items():
         message += f"\n• /{cmd}: {count}"
     
-    await update.message.reply_text(message)
+    await send_reply(update, context, message, PRIORITY_BACKGROUND)
 
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log_metric("command", update.effective_user.id, command="clear")
     user_id = update.effective_user.id
+    key = (current_profile(context).name, user_id)
     
     # Log de fin de session si une conversation était en cours
-    if user_id in user_contexts:
-        old_context = user_contexts[user_id]
-        if "session_start" in old_context:
-            session_duration = time.time() - old_context["session_start"]
-            conversation_length = len(old_context.get("conversation_history", []))
-            log_metric("session_end", value=session_duration)
-            log_metric("conversation_length", value=conversation_length)
+    old_context = await user_contexts.fetch(key)
+    if old_context is not None:
+        log_session_end(key, old_context)
     
-    user_contexts[user_id] = {
-        "first_interaction": False,
-        "conversation_history": [],
-        "user_name": None,
-        "start_time": time.time(),
-        "session_start": time.time()
-    }
+    user_contexts.new_session(key, first_interaction=False)
+    
+    # Rien de ce qui était en attente ne doit arriver après le /clear
+    inbound_scheduler.discard(key)
+    delayed_replies.cancel(key)
     
     log_metric("session_start")
-    await asyncio.sleep(1)
-    await update.message.reply_text("On efface tout ! 🔄")
-
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    user_message = update.message.text
+    delayed_replies.schedule(key, 1, update, context, "On efface tout ! 🔄")
+
+# File d'attente entrante : anti-flood et partage équitable des réponses entre utilisateurs
+INBOUND_DEBOUNCE = float(os.getenv('INBOUND_DEBOUNCE', '1.5'))  # Silence attendu avant de répondre (s)
+INBOUND_MAX_WAIT = float(os.getenv('INBOUND_MAX_WAIT', '5'))  # Attente max depuis le premier message (s)
+INBOUND_MAX_MERGED = int(os.getenv('INBOUND_MAX_MERGED', '5'))  # Messages fusionnés max en un tour
+MAX_CONCURRENT_TURNS = int(os.getenv('MAX_CONCURRENT_TURNS', '64'))  # Tours de conversation simultanés
+USER_TURN_BURST = float(os.getenv('USER_TURN_BURST', '5'))  # Tours d'affilée autorisés par utilisateur
+USER_TURNS_PER_MINUTE = float(os.getenv('USER_TURNS_PER_MINUTE', '6'))
+
+@dataclass(slots=True)
+class PendingTurn:
+    """Messages d'un utilisateur pas encore traités, fusionnés en un seul tour"""
+    key: tuple
+    messages: list
+    update: Update
+    context: ContextTypes.DEFAULT_TYPE
+    first_at: float
+    last_at: float
+    timer: Optional[asyncio.TimerHandle] = None
+    ready: bool = False
+    ready_at: float = 0.0
+    regenerated: bool = False  # Reprend les messages d'une réponse annulée
+    generation: int = 0  # Distingue ce tour d'un tour oublié (/clear) de la même clé
+
+class FairTurnScheduler:
+    """Regroupe les rafales de messages et sert les utilisateurs équitablement
+
+    Chaque utilisateur a au plus un tour en attente (ses messages rapprochés y
+    sont fusionnés) et un tour en cours. Les tours prêts sont servis par temps
+    virtuel croissant (file équitable pondérée par le nombre de messages) : un
+    chat très actif avance son horloge et passe derrière les utilisateurs calmes.
+    """
+
+    def __init__(self, handler: Callable[[PendingTurn], Awaitable[None]], max_running: int,
+                 debounce: float, max_wait: float, max_merged: int, burst: float, per_minute: float):
+        self.handler = handler
+        self.max_running = max_running
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.max_merged = max_merged
+        self.burst = burst
+        self.per_minute = per_minute
+        self._pending = {}  # Tour en attente par utilisateur
+        self._running = set()  # Utilisateurs dont un tour est en cours
+        self._ready = []  # Tas de (temps virtuel de début, ordre d'arrivée, clé, génération du tour)
+        self._finish = {}  # Temps virtuel de fin du dernier tour de chaque utilisateur
+        self._buckets = {}  # Seau à jetons par utilisateur (un jeton par tour)
+        self._virtual_time = 0.0
+        self._prune_at = 1024
+        self._order = itertools.count()
+        self._generations = itertools.count(1)
+        self._tasks = set()
+        self.merged = 0
+        self.dropped = 0
+        self.turns = 0
+
+    def submit(self, key: tuple, text: str, update: Update, context: ContextTypes.DEFAULT_TYPE,
+               charge: bool = True) -> bool:
+        """Ajoute un message ; False s'il est ignoré (flood)
+
+        charge=False : message déjà compté (réponse annulée à régénérer).
+        """
+        now = time.monotonic()
+        turn = self._pending.get(key)
+        if turn is not None:
+            # Fusion dans le tour en attente : pas d'appel Groq supplémentaire
+            if charge and len(turn.messages) >= self.max_merged:
+                self.dropped += 1
+                return False
+            turn.messages.append(text)
+            turn.update, turn.context, turn.last_at = update, context, now
+            turn.regenerated |= not charge
+            self.merged += charge
+            if not turn.ready:
+                self._arm(turn, now)
+            return True
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.burst, self.per_minute / 60)
+            if len(self._buckets) >= self._prune_at:
+                self._prune(now)
+        if charge:
+            if bucket.time_until(1, now) > 0:
+                self.dropped += 1
+                return False
+            bucket.take(1)
+        turn = self._pending[key] = PendingTurn(key, [text], update, context, now, now, regenerated=not charge,
+                                                generation=next(self._generations))
+        self._arm(turn, now)
+        return True
 
-    # Calculer un délai réaliste avant de traiter (1-2 secondes pour "réfléchir")
-    thinking_delay = random.uniform(1, 2)
-    await asyncio.sleep(thinking_delay)
+    def discard(self, key: tuple):
+        """Oublie le tour en attente d'un utilisateur (/clear)"""
+        turn = self._pending.pop(key, None)
+        if turn is not None and turn.timer is not None:
+            turn.timer.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "ready": len(self._ready),
+            "running": len(self._running),
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "turns": self.turns
+        }
 
-    # Générer la réponse d'Alicia via Groq
-    response = await get_alicia_response(user_message, user_id)
+    async def drain(self):
+        """Traite immédiatement les tours en attente et attend la fin de tous les tours"""
+        for turn in list(self._pending.values()):
+            if not turn.ready:
+                turn.timer.cancel()
+                self._make_ready(turn)
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def _arm(self, turn: PendingTurn, now: float):
+        """(Re)programme le moment où le tour devient prêt : après un silence, borné"""
+        if turn.timer is not None:
+            turn.timer.cancel()
+        delay = min(turn.last_at + self.debounce, turn.first_at + self.max_wait) - now
+        turn.timer = asyncio.get_running_loop().call_later(max(0.0, delay), self._make_ready, turn)
+
+    def _make_ready(self, turn: PendingTurn):
+        turn.timer = None
+        turn.ready = True
+        turn.ready_at = time.monotonic()
+        if turn.key not in self._running:
+            self._enqueue(turn)
+
+    def _enqueue(self, turn: PendingTurn):
+        start = max(self._virtual_time, self._finish.get(turn.key, 0.0))
+        self._finish[turn.key] = start + len(turn.messages)
+        heapq.heappush(self._ready, (start, next(self._order), turn.key, turn.generation))
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._ready and len(self._running) < self.max_running:
+            start, _, key, generation = heapq.heappop(self._ready)
+            turn = self._pending.get(key)
+            if turn is None or turn.generation != generation or not turn.ready or key in self._running:
+                continue  # Entrée périmée : tour oublié par /clear, peut-être remplacé depuis
+            del self._pending[key]
+            self._virtual_time = max(self._virtual_time, start)
+            self._running.add(key)
+            self.turns += 1
+            task = asyncio.create_task(self._run(turn))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, turn: PendingTurn):
+        try:
+            await self.handler(turn)
+        except Exception:
+            logging.exception(f"Erreur pendant la réponse à {turn.key}")
+        finally:
+            self._running.discard(turn.key)
+            # Messages arrivés pendant la réponse : leur tour passe par la file
+            waiting = self._pending.get(turn.key)
+            if waiting is not None and waiting.ready:
+                self._enqueue(waiting)
+            self._dispatch()
+
+    def _prune(self, now: float):
+        """Oublie les utilisateurs inactifs (seau plein, horloge dépassée)"""
+        active = self._pending.keys() | self._running
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if key in active or bucket.time_until(bucket.capacity, now) > 0
+        }
+        self._finish = {
+            key: finish for key, finish in self._finish.items()
+            if key in active or finish > self._virtual_time
+        }
+        self._prune_at = max(1024, 2 * len(self._buckets))
+
+async def answer_turn(turn: PendingTurn):
+    """Répond à un tour : les messages fusionnés forment un seul message pour Groq"""
+    update, context = turn.update, turn.context
+    profile = profile_registry.get(turn.key[0])
+    user_message = "\n".join(turn.messages)
+    STAGE_QUEUE_WAIT.observe(time.monotonic() - turn.ready_at)
+
+    # Délai réaliste pour "réfléchir" (1-2 secondes après le dernier message),
+    # écoulé pendant le regroupement et l'appel à Groq
+    think_until = turn.last_at + random.uniform(1, 2)
+
+    # En streaming : chaque phrase est envoyée (puis complétée par édition) au
+    # rythme d'une frappe humaine, calculé sur le texte réellement reçu
+    sent_message = None
+    shown_text = ""
+    last_sent = think_until
+
+    async def send_partial(text: str):
+        nonlocal sent_message, shown_text, last_sent
+        if text == shown_text:
+            return
+        wait = (len(text) - len(shown_text)) / STREAM_CHARS_PER_SECOND - (time.monotonic() - last_sent)
+        if wait > 0:
+            started = time.perf_counter()
+            await typing_pause(update, context, wait)
+            STAGE_TYPING.observe(time.perf_counter() - started)
+        started = time.perf_counter()
+        if sent_message is None:
+            sent_message = await send_reply(update, context, text)
+        else:
+            await context.bot_data["sender"].send(update.effective_chat.id, lambda: sent_message.edit_text(text))
+        STAGE_TELEGRAM_SEND.observe(time.perf_counter() - started)
+        shown_text = text
+        last_sent = time.monotonic()
+
+    # Générer la réponse du profil via Groq
+    response, route = await get_alicia_response(user_message, turn.key[1], profile, on_partial=send_partial)
+
+    if sent_message is not None:
+        # Déjà affichée en partie : on complète le message avec la fin, sauf si
+        # la suite a échoué (le message d'erreur écraserait le texte déjà lu)
+        if response.startswith(shown_text):
+            await send_partial(response)
+        return
 
-    # Calculer un délai supplémentaire pour "taper" selon la taille
+    # Reste de la réflexion, puis délai pour "taper" selon la taille : la
+    # réponse est confiée au scheduler et le tour libère sa place. Une réponse
+    # déjà régénérée une fois part quoi qu'il arrive (pas de Groq en boucle).
+    thinking_delay = max(0.0, think_until - time.monotonic())
     typing_delay = calculate_response_delay(response)
-    await asyncio.sleep(typing_delay)
+    STAGE_THINKING.observe(thinking_delay)
+    STAGE_TYPING.observe(typing_delay)
+    delayed_replies.schedule(turn.key, thinking_delay + typing_delay, update, context, response,
+                             messages=() if turn.regenerated else tuple(turn.messages), route=route)
+
+def retract_replies(key: tuple, replies: list):
+    """Efface du contexte des réponses annulées avant envoi (elles seront régénérées)"""
+    context = user_contexts.get(key)
+    if context is None:
+        return
+    for reply in reversed(replies):
+        context.message_count = max(0, context.message_count - 1)
+        history = context.conversation_history
+        if history and history[-1]["alicia"] == reply.text:
+            history.pop()
+    user_contexts.mark_dirty(key)
+
+inbound_scheduler = FairTurnScheduler(
+    answer_turn, MAX_CONCURRENT_TURNS, INBOUND_DEBOUNCE, INBOUND_MAX_WAIT,
+    INBOUND_MAX_MERGED, USER_TURN_BURST, USER_TURNS_PER_MINUTE
+)
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Le message rejoint la file de l'utilisateur (ou est ignoré en cas de flood) :
+    # la réponse est faite par le scheduler, pas dans le handler
+    key = (current_profile(context).name, update.effective_user.id)
+    # Compté à l'arrivée : un tour peut regrouper plusieurs messages
+    log_metric("message", update.effective_user.id)
+
+    # Réponse précédente pas encore partie : elle est retirée et ses messages
+    # repassent avec le nouveau, pour une seule réponse à l'ensemble
+    superseded = delayed_replies.supersede(key)
+    if superseded:
+        retract_replies(key, superseded)
+        for reply in superseded:
+            for text in reply.messages:
+                inbound_scheduler.submit(key, text, update, context, charge=False)
+
+    inbound_scheduler.submit(key, update.message.text, update, context)
+
+async def on_startup():
+    """Recharge les analytics et démarre les tâches de fond une fois la boucle lancée"""
+    if ANALYTICS_SNAPSHOT_PATH:
+        if load_analytics_snapshot(ANALYTICS_SNAPSHOT_PATH):
+            print("📂 Analytics rechargées depuis le dernier snapshot")
+        start_background_task(run_analytics_snapshotter(ANALYTICS_SNAPSHOT_INTERVAL))
+    start_background_task(user_contexts.run_flusher(CONTEXT_FLUSH_INTERVAL))
+    start_background_task(profile_registry.watch(PROFILES_RELOAD_INTERVAL))
+    start_background_task(monitor_loop_lag(LOOP_LAG_INTERVAL))
+    if EVENT_LOG_DIR:
+        start_background_task(event_log.run(EVENT_LOG_FLUSH_INTERVAL))
+    for pool in joke_pools.values():
+        start_background_task(pool.run(JOKE_REFRESH_INTERVAL))
+
+async def on_shutdown():
+    """Arrête les tâches de fond, écrit les derniers contextes et analytics, ferme les connexions"""
+    await stop_background_tasks()
+    await user_contexts.flush()
+    await save_analytics_snapshot()
+    await event_log.flush()
+    user_contexts.backend.close()
+    await close_groq_client()
+
+def build_application(profile: BotProfile, token: str) -> tuple:
+    """Crée l'application Telegram d'un profil et son processeur d'updates"""
+    processor = PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES)
+    builder = Application.builder().token(token).concurrent_updates(processor)
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL)
+    app = builder.build()
+    app.bot_data["profile"] = profile.name
+    # La limite d'envoi de Telegram vaut pour le bot entier : chaque worker en a sa part
+    app.bot_data["sender"] = TelegramSender(TELEGRAM_SENDS_PER_SECOND / WORKERS, TELEGRAM_CHAT_INTERVAL,
+                                            TELEGRAM_SEND_RETRIES)
+
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(CommandHandler("blague", blague_command))
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CommandHandler("clear", clear_command))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return app, processor
+
+def webhook_config_error() -> Optional[str]:
+    """Problème de configuration du mode webhook, ou None si tout est en place
+
+    Sans secret, n'importe qui pourrait poster de fausses updates sur l'URL publique.
+    """
+    if BOT_MODE == 'shard':
+        # Fourni par le superviseur : protège les updates et les analytics des workers
+        return None if WEBHOOK_SECRET else "BOT_MODE=shard nécessite WEBHOOK_SECRET (fourni par le superviseur)"
+    if BOT_MODE != 'webhook':
+        return None
+    if web is None:
+        return "BOT_MODE=webhook nécessite le paquet aiohttp"
+    if not WEBHOOK_URL:
+        return "BOT_MODE=webhook nécessite WEBHOOK_URL"
+    if not WEBHOOK_SECRET:
+        return "BOT_MODE=webhook nécessite WEBHOOK_SECRET (ex : python -c \"import secrets; print(secrets.token_urlsafe(32))\")"
+    if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET):
+        return "WEBHOOK_SECRET : 1 à 256 caractères parmi A-Z, a-z, 0-9, _ et -"
+    return None
+
+def has_webhook_secret(request) -> bool:
+    """La requête porte-t-elle le secret attendu (toujours vrai sans secret configuré)"""
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    return not WEBHOOK_SECRET or hmac.compare_digest(token, WEBHOOK_SECRET)
+
+def create_webhook_server(bots: list, is_accepting: Callable[[], bool]):
+    """Serveur aiohttp : une route par bot, plus /healthz et /readyz"""
+    if web is None:
+        raise RuntimeError(f"BOT_MODE={BOT_MODE} nécessite le paquet aiohttp")
+    problem = webhook_config_error()
+    if problem:
+        raise RuntimeError(problem)
+
+    def receiver(application: Application, processor: PerChatUpdateProcessor):
+        async def receive_update(request):
+            if not has_webhook_secret(request):
+                return web.Response(status=403)
+            # Trop de retard ou arrêt en cours : Telegram renverra l'update plus tard
+            backlog = application.update_queue.qsize() + processor.in_flight
+            if not is_accepting() or backlog >= WEBHOOK_MAX_BACKLOG:
+                return web.Response(status=503, headers={"Retry-After": "1"})
+            try:
+                data = await request.json()
+            except ValueError:
+                return web.Response(status=400)
+            await application.update_queue.put(Update.de_json(data, application.bot))
+            return web.Response()
+        return receive_update
+
+    async def health(request):
+        return web.Response(text="ok")
+
+    async def readiness(request):
+        ready = is_accepting()
+        return web.Response(text="ready" if ready else "draining", status=200 if ready else 503)
+
+    async def shard_analytics(request):
+        # Lu par les autres shards pour /stats (127.0.0.1 uniquement, avec le secret partagé)
+        if not has_webhook_secret(request):
+            return web.Response(status=403)
+        return web.json_response({"analytics": encode_analytics(analytics), "counters": analytics_counters()})
+
+    server = web.Application(client_max_size=1024 ** 2)
+    for application, processor in bots:
+        path = f"{WEBHOOK_PATH}/{application.bot_data['profile']}"
+        server.router.add_post(path, receiver(application, processor))
+    server.router.add_get("/healthz", health)
+    server.router.add_get("/readyz", readiness)
+    if BOT_MODE == 'shard':
+        server.router.add_get("/shard/analytics", shard_analytics)
+    return server
+
+async def run_bots(bots: list):
+    """Fait tourner tous les bots dans la même boucle, en polling ou en webhook
+
+    À l'arrêt (SIGTERM/SIGINT), plus aucune update n'est acceptée et les
+    réponses en cours ont SHUTDOWN_GRACE secondes pour se terminer.
+    """
+    accepting = False
+    runners = []
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
 
-    # Envoyer la réponse
-    await update.message.reply_text(response)
+    try:
+        for application, _ in bots:
+            await application.initialize()
+            await application.start()
+        await on_startup()
+
+        if METRICS_PORT:
+            if web is None:
+                raise RuntimeError("METRICS_PORT nécessite le paquet aiohttp")
+            metrics_server = web.Application()
+            metrics_server.router.add_get("/metrics", metrics_endpoint)
+            runners.append(web.AppRunner(metrics_server))
+            await runners[-1].setup()
+            await web.TCPSite(runners[-1], "0.0.0.0", METRICS_PORT + WORKER_INDEX).start()
+            print(f"📈 Métriques sur le port {METRICS_PORT + WORKER_INDEX} (/metrics)")
+
+        if BOT_MODE == 'webhook':
+            runners.append(web.AppRunner(create_webhook_server(bots, lambda: accepting)))
+            await runners[-1].setup()
+            await web.TCPSite(runners[-1], "0.0.0.0", WEBHOOK_PORT).start()
+            for application, _ in bots:
+                await application.bot.set_webhook(
+                    f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}/{application.bot_data['profile']}",
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=Update.ALL_TYPES,
+                    max_connections=100
+                )
+            print(f"🌐 Webhook en écoute sur le port {WEBHOOK_PORT}")
+        elif BOT_MODE == 'shard':
+            # Updates transmises par le superviseur, en local seulement
+            runners.append(web.AppRunner(create_webhook_server(bots, lambda: accepting)))
+            await runners[-1].setup()
+            await web.TCPSite(runners[-1], "127.0.0.1", SHARD_BASE_PORT + WORKER_INDEX).start()
+            print(f"🧩 Worker {WORKER_INDEX + 1}/{WORKERS} prêt (port {SHARD_BASE_PORT + WORKER_INDEX})")
+        else:
+            for application, _ in bots:
+                await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        accepting = True
+
+        await stop_event.wait()
+
+        # Plus de nouvelles updates, on laisse finir les réponses en cours
+        accepting = False
+        print("🛑 Arrêt demandé, on termine les conversations en cours...")
+        for application, _ in bots:
+            if application.updater and application.updater.running:
+                await application.updater.stop()
+        try:
+            async def drain():
+                await asyncio.gather(*(application.stop() for application, _ in bots))
+                await inbound_scheduler.drain()
+                await delayed_replies.drain()
+            await asyncio.wait_for(drain(), SHUTDOWN_GRACE)
+        except asyncio.TimeoutError:
+            print("⚠️ Délai d'arrêt dépassé, certaines réponses sont perdues")
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+        for application, _ in bots:
+            if application.updater and application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+        await on_shutdown()
+
+def ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Hachage cohérent : changer le nombre de workers ne déplace qu'~1/N des utilisateurs"""
+
+    def __init__(self, nodes, replicas: int = SHARD_RING_REPLICAS):
+        points = sorted((ring_hash(f"{node}:{replica}"), node) for node in nodes for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key) -> int:
+        index = bisect_left(self._hashes, ring_hash(str(key)))
+        return self._nodes[index % len(self._nodes)]
+
+def update_shard_key(update: Update) -> int:
+    """Utilisateur de l'update (à défaut son chat, ou l'update elle-même)"""
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return update.update_id
+
+class ShardSupervisor:
+    """Lance WORKERS processus (BOT_MODE=shard) et leur transmet les updates
+
+    Chaque utilisateur est toujours servi par le même worker, qui possède seul
+    ses contextes : aucun verrou entre processus. Le superviseur ne fait que
+    recevoir (polling ou webhook) et router, et relance un worker qui s'arrête.
+    Les workers n'acceptent que les requêtes portant le secret partagé
+    (WEBHOOK_SECRET, ou un secret tiré au lancement).
+    """
+
+    def __init__(self, bots: list):
+        self.bots = bots  # [(nom du profil, Bot)]
+        self.ring = HashRing(range(WORKERS))
+        self.processes = {}
+        self.stopping = False
+        self.client = None
+        self.secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+    async def spawn(self, index: int):
+        env = {**os.environ, "BOT_MODE": "shard", "WORKERS": str(WORKERS), "WORKER_INDEX": str(index),
+               "WEBHOOK_SECRET": self.secret}
+        self.processes[index] = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), env=env
+        )
+
+    async def keep_alive(self, index: int):
+        """Relance le worker s'il s'arrête en dehors de l'arrêt général"""
+        while True:
+            code = await self.processes[index].wait()
+            if self.stopping:
+                return
+            print(f"⚠️ Worker {index + 1} arrêté (code {code}), redémarrage...")
+            await asyncio.sleep(1)
+            await self.spawn(index)
+
+    async def wait_ready(self, index: int):
+        while True:
+            try:
+                response = await self.client.get(f"http://127.0.0.1:{SHARD_BASE_PORT + index}/readyz")
+                if response.status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+
+    async def forward(self, index: int, profile_name: str, body: bytes) -> int:
+        """Transmet une update brute à un worker et retourne son code HTTP (503 s'il est injoignable)"""
+        headers = {"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": self.secret}
+        try:
+            response = await self.client.post(
+                f"http://127.0.0.1:{SHARD_BASE_PORT + index}{WEBHOOK_PATH}/{profile_name}",
+                content=body, headers=headers
+            )
+        except httpx.TransportError:
+            return 503
+        return response.status_code
+
+    async def deliver(self, index: int, profile_name: str, updates: list):
+        """Envoie dans l'ordre les updates d'un worker, en réessayant tant qu'il est saturé"""
+        for update in updates:
+            body = json.dumps(update.to_dict()).encode()
+            attempt = 0
+            while not self.stopping:
+                status = await self.forward(index, profile_name, body)
+                if status == 200:
+                    break
+                if status != 503:
+                    logging.error(f"Update {update.update_id} refusée par le worker {index + 1} ({status})")
+                    break
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+
+    async def poll(self, profile_name: str, bot: Bot):
+        """Long polling d'un bot ; l'offset n'avance qu'une fois le lot remis aux workers"""
+        await bot.delete_webhook()
+        offset = None
+        while not self.stopping:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=SHARD_POLL_TIMEOUT,
+                                                allowed_updates=Update.ALL_TYPES)
+            except TelegramError as e:
+                logging.error(f"Polling {profile_name} : {e}")
+                await asyncio.sleep(1)
+                continue
+            # Un envoi séquentiel par worker garde l'ordre des messages d'un utilisateur
+            batches = {}
+            for update in updates:
+                batches.setdefault(self.ring.node_for(update_shard_key(update)), []).append(update)
+            await asyncio.gather(*(self.deliver(index, profile_name, batch) for index, batch in batches.items()))
+            if updates:
+                offset = updates[-1].update_id + 1
+
+    def webhook_server(self):
+        """Serveur public du mode webhook : chaque update est relayée à son worker"""
+        def receiver(profile_name: str, bot: Bot):
+            async def receive_update(request):
+                if not has_webhook_secret(request):
+                    return web.Response(status=403)
+                if self.stopping:
+                    return web.Response(status=503, headers={"Retry-After": "1"})
+                body = await request.read()
+                try:
+                    update = Update.de_json(json.loads(body), bot)
+                except ValueError:
+                    return web.Response(status=400)
+                status = await self.forward(self.ring.node_for(update_shard_key(update)), profile_name, body)
+                # Worker saturé ou en redémarrage : Telegram renverra l'update plus tard
+                if status != 200:
+                    return web.Response(status=503, headers={"Retry-After": "1"})
+                return web.Response()
+            return receive_update
+
+        async def health(request):
+            return web.Response(text="ok")
+
+        server = web.Application(client_max_size=1024 ** 2)
+        for profile_name, bot in self.bots:
+            server.router.add_post(f"{WEBHOOK_PATH}/{profile_name}", receiver(profile_name, bot))
+        server.router.add_get("/healthz", health)
+        return server
+
+    async def run(self):
+        # Avant de lancer les workers : une configuration invalide ne doit pas les laisser orphelins
+        problem = webhook_config_error()
+        if problem:
+            raise RuntimeError(problem)
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        self.client = httpx.AsyncClient(timeout=10.0, limits=httpx.Limits(max_keepalive_connections=8 * WORKERS))
+        runner = None
+        tasks = []
+        try:
+            for index in range(WORKERS):
+                await self.spawn(index)
+            tasks += [asyncio.create_task(self.keep_alive(index)) for index in range(WORKERS)]
+            await asyncio.gather(*(self.wait_ready(index) for index in range(WORKERS)))
+            for _, bot in self.bots:
+                await bot.initialize()
+
+            if BOT_MODE == 'webhook':
+                runner = web.AppRunner(self.webhook_server())
+                await runner.setup()
+                await web.TCPSite(runner, "0.0.0.0", WEBHOOK_PORT).start()
+                for profile_name, bot in self.bots:
+                    await bot.set_webhook(
+                        f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}/{profile_name}",
+                        secret_token=WEBHOOK_SECRET,
+                        allowed_updates=Update.ALL_TYPES,
+                        max_connections=100
+                    )
+                print(f"🌐 Webhook en écoute sur le port {WEBHOOK_PORT}")
+            else:
+                tasks += [asyncio.create_task(self.poll(profile_name, bot)) for profile_name, bot in self.bots]
+            print(f"🧩 {WORKERS} workers prêts, updates réparties par utilisateur")
+
+            await stop_event.wait()
+        finally:
+            # Les workers terminent eux-mêmes leurs conversations en cours (SIGTERM)
+            self.stopping = True
+            print("🛑 Arrêt demandé, arrêt des workers...")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if runner is not None:
+                await runner.cleanup()
+            for process in self.processes.values():
+                if process.returncode is None:
+                    process.terminate()
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(process.wait() for process in self.processes.values())), SHUTDOWN_GRACE + 5
+                )
+            except asyncio.TimeoutError:
+                for process in self.processes.values():
+                    if process.returncode is None:
+                        process.kill()
+            for _, bot in self.bots:
+                await bot.shutdown()
+            await self.client.aclose()
 
 def main():
     # Vérifier les tokens
-    telegram_token = os.getenv('TELEGRAM_BOT_TOKEN')
     groq_token = os.getenv('GROQ_API_KEY')
 
-    if not telegram_token:
-        print("❌ Token Telegram manquant dans le fichier .env !")
-        return
-
-    if not groq_token:
+    if not llm_providers:
         print("❌ Token Groq manquant dans le fichier .env !")
         print("🔍 Va sur https://console.groq.com pour créer ta clé API")
         return
 
-    print("🌟 Démarrage d'Alicia - 100% Groq AI avec analytics complètes")
-    print("🚀 Modèle : Llama 3.1 8B Instant")
+    problem = webhook_config_error()
+    if problem:
+        print(f"❌ {problem}")
+        return
 
-    if groq_token.startswith('gsk_'):
+    supervisor = WORKERS > 1 and BOT_MODE != 'shard'
+    bots = []
+    for profile in profile_registry.all():
+        telegram_token = os.getenv(profile.token_env)
+        if not telegram_token:
+            print(f"⚠️ Token Telegram manquant ({profile.token_env}) : {profile.display_name} ne sera pas lancée")
+            continue
+        if supervisor:
+            bots.append((profile.name, Bot(telegram_token, base_url=TELEGRAM_API_URL or "https://api.telegram.org/bot")))
+        else:
+            bots.append(build_application(profile, telegram_token))
+        print(f"🌟 Démarrage de {profile.display_name} - Modèle : {profile.groq_params['model']}")
+
+    if not bots:
+        print("❌ Token Telegram manquant dans le fichier .env !")
+        return
+
+    if LLM_PROVIDERS:
+        print(f"✅ Fournisseurs LLM : {', '.join(provider.name for provider in llm_providers)}")
+        print("🔥 Mode IA intégrale activé")
+        print("📊 Analytics complètes activées")
+        print("⏰ Conversations limitées naturellement")
+    elif groq_token.startswith('gsk_'):
         print(f"✅ Clé Groq détectée: {groq_token[:15]}...")
         print("🔥 Mode IA intégrale activé")
         print("📊 Analytics complètes activées")
@@ -563,18 +3572,12 @@ def main():
         print("⚠️ Clé Groq invalide (ne commence pas par gsk_)")
         return
 
-    app = Application.builder().token(telegram_token).build()
-
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("blague", blague_command))
-    app.add_handler(CommandHandler("stats", stats_command))
-    app.add_handler(CommandHandler("clear", clear_command))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-
-    print("💕 Alicia est prête avec analytics complètes !")
+    print(f"💕 {len(bots)} profil(s) prêt(s) avec analytics complètes !")
     
-    app.run_polling()
+    if supervisor:
+        asyncio.run(ShardSupervisor(bots).run())
+    else:
+        asyncio.run(run_bots(bots))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
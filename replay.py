@@ -0,0 +1,298 @@
+"""Rejoue des conversations à travers le bot, sans Telegram ni Groq
+
+Les messages passent par handle_message (file d'entrée, get_alicia_response,
+cache, limiteurs, file d'envoi...) comme en production ; Telegram est remplacé
+par un faux Bot API qui applique ses limites d'envoi (RetryAfter) et Groq par
+un serveur local à latence et erreurs réglables.
+
+Exemples :
+    python replay.py --users 500 --messages 5000 --rate 100 --no-delay
+    python replay.py --trace conversations.jsonl --groq-latency 0.3 --groq-errors 0.02
+    python replay.py --no-delay --json resultats.json --max-p95 0.5
+    python replay.py --no-delay --groq-tail 0.05 --groq-tail-latency 3 --backup-latency 0.3
+
+Trace JSONL : une ligne par message {"at": secondes, "user": id, "text": "..."}
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+from collections import deque
+from types import SimpleNamespace
+
+from aiohttp import web
+from telegram.error import RetryAfter
+
+SYNTHETIC_TEXTS = [
+    "coucou", "ça va ?", "tu fais quoi ce soir ?", "raconte-moi ta journée",
+    "j'ai passé une sale journée au boulot", "t'aimes quoi comme musique ?",
+    "tu es trop mignonne", "on se voit quand ?", "haha t'es drôle",
+    "je m'ennuie un peu", "tu habites où ?", "bonne nuit",
+]
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def synthetic_trace(users: int, messages: int, rate: float, zipf: float, seed: int) -> list:
+    """Arrivées poissonniennes, utilisateurs tirés selon une loi de Zipf"""
+    rng = random.Random(seed)
+    weights = [1 / (rank ** zipf) for rank in range(1, users + 1)]
+    user_ids = rng.choices(range(1, users + 1), weights=weights, k=messages)
+    trace, at = [], 0.0
+    for user_id in user_ids:
+        at += rng.expovariate(rate)
+        text = rng.choice(SYNTHETIC_TEXTS)
+        if rng.random() < 0.3:
+            text += f" {rng.randint(1, 99)}"  # Pas que des messages identiques (cache)
+        trace.append({"at": at, "user": user_id, "text": text})
+    return trace
+
+def load_trace(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        trace = [json.loads(line) for line in f if line.strip()]
+    return sorted(trace, key=lambda event: event["at"])
+
+class FakeGroq:
+    """Serveur compatible avec l'API chat/completions de Groq (JSON et SSE)"""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, rate_limit_rate: float,
+                 tail_rate: float = 0.0, tail_latency: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate  # Proportion de réponses anormalement lentes
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.calls = 0
+        self.url = None
+        self._runner = None
+
+    async def start(self):
+        server = web.Application()
+        server.router.add_post("/openai/v1/chat/completions", self.completions)
+        self._runner = web.AppRunner(server)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/openai/v1/chat/completions"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def completions(self, request):
+        self.calls += 1
+        body = await request.json()
+        if random.random() < self.tail_rate:
+            await asyncio.sleep(self.tail_latency)
+        else:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        draw = random.random()
+        if draw < self.error_rate:
+            return web.Response(status=500)
+        if draw < self.error_rate + self.rate_limit_rate:
+            return web.Response(status=429, headers={"retry-after": "0.5s"})
+
+        text = f"Réponse {self.calls} : trop bien, raconte-moi encore ! Et toi ça va ?"
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        if not body.get("stream"):
+            return web.json_response({
+                "choices": [{"message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                          "total_tokens": prompt_tokens + len(text) // 4}
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in text.split(" "):
+            chunk = {"choices": [{"delta": {"content": word + " "}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+class FakeTelegram:
+    """Faux Bot API : applique les limites d'envoi de Telegram (RetryAfter) et
+    mesure le délai entre un message et la première réponse"""
+
+    def __init__(self, profile_name: str, sender, per_second: float, chat_interval: float):
+        self.context = SimpleNamespace(
+            bot=SimpleNamespace(send_chat_action=self._noop),
+            bot_data={"profile": profile_name, "sender": sender}
+        )
+        self.per_second = per_second
+        self.chat_interval = chat_interval
+        self.waiting = {}  # Heures d'arrivée des messages sans réponse, par chat
+        self.latencies = []
+        self.replies = 0
+        self.edits = 0
+        self.rejected = 0
+        self._recent = deque()  # Heures des envois de la dernière seconde
+        self._last_send = {}  # Dernier envoi de chaque chat
+
+    async def _noop(self, *args, **kwargs):
+        pass
+
+    def _enforce_limits(self, chat_id: int, now: float):
+        while self._recent and now - self._recent[0] >= 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.per_second or now - self._last_send.get(chat_id, -1e9) < self.chat_interval:
+            self.rejected += 1
+            raise RetryAfter(1)
+        self._recent.append(now)
+        self._last_send[chat_id] = now
+
+    async def _edit(self, chat_id: int, text: str):
+        self._enforce_limits(chat_id, time.perf_counter())
+        self.edits += 1
+
+    def update(self, user_id: int, text: str) -> SimpleNamespace:
+        self.waiting.setdefault(user_id, []).append(time.perf_counter())
+        return SimpleNamespace(
+            effective_user=SimpleNamespace(id=user_id),
+            effective_chat=SimpleNamespace(id=user_id),
+            message=SimpleNamespace(text=text, reply_text=lambda reply: self._reply(user_id))
+        )
+
+    async def _reply(self, chat_id: int) -> SimpleNamespace:
+        now = time.perf_counter()
+        self._enforce_limits(chat_id, now)
+        self.replies += 1
+        self.latencies.extend(now - arrived for arrived in self.waiting.pop(chat_id, ()))
+        return SimpleNamespace(edit_text=lambda text: self._edit(chat_id, text))
+
+async def replay(bot, trace: list, args) -> dict:
+    groq = FakeGroq(args.groq_latency, args.groq_jitter, args.groq_errors, args.groq_rate_limits,
+                    args.groq_tail, args.groq_tail_latency)
+    await groq.start()
+    servers = [groq]
+    if args.backup_latency is not None:
+        backup = FakeGroq(args.backup_latency, args.groq_jitter, 0.0, 0.0)
+        await backup.start()
+        servers.append(backup)
+    bot.llm_providers[:] = [bot.LLMProvider(f"fake-{index}", server.url, "gsk_replay")
+                            for index, server in enumerate(servers)]
+    bot.LLM_HEDGING = not args.no_hedge
+
+    profile = bot.profile_registry.get(args.profile)
+    sender = bot.TelegramSender(bot.TELEGRAM_SENDS_PER_SECOND, bot.TELEGRAM_CHAT_INTERVAL, bot.TELEGRAM_SEND_RETRIES)
+    telegram = FakeTelegram(profile.name, sender, args.telegram_rate, args.telegram_chat_interval)
+    commands = {"/start": bot.start, "/clear": bot.clear_command, "/blague": bot.blague_command}
+    command_tasks = []
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    for event in trace:
+        wait = started + event["at"] / args.speed - time.perf_counter()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        update = telegram.update(event["user"], event["text"])
+        handler = commands.get(event["text"].split(" ")[0])
+        if handler is not None:
+            command_tasks.append(asyncio.create_task(handler(update, telegram.context)))
+        else:
+            dropped = bot.inbound_scheduler.dropped
+            await bot.handle_message(update, telegram.context)
+            if bot.inbound_scheduler.dropped > dropped:
+                telegram.waiting[event["user"]].pop()  # Ignoré (flood) : jamais de réponse
+    await asyncio.gather(*command_tasks)
+    await bot.inbound_scheduler.drain()
+    while len(bot.delayed_replies):
+        await asyncio.sleep(0.01)  # Réponses encore dans leur pause de frappe
+    await bot.delayed_replies.drain()
+    elapsed = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    for server in servers:
+        await server.stop()
+    await bot.close_groq_client()
+
+    latencies = sorted(telegram.latencies)
+    queue = bot.inbound_scheduler.stats()
+    return {
+        "messages": len(trace),
+        "answered": len(latencies),
+        "replies": telegram.replies,
+        "edits": telegram.edits,
+        "sends_per_s": round((telegram.replies + telegram.edits) / elapsed, 1) if elapsed else 0.0,
+        "telegram_retry_after": telegram.rejected,
+        "merged": queue["merged"],
+        "dropped": queue["dropped"],
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(len(trace) / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_s": round(percentile(latencies, 0.50), 4),
+        "latency_p95_s": round(percentile(latencies, 0.95), 4),
+        "latency_p99_s": round(percentile(latencies, 0.99), 4),
+        "groq_calls": sum(server.calls for server in servers),
+        "groq_calls_per_message": round(sum(server.calls for server in servers) / len(trace), 3) if trace else 0.0,
+        "hedges_fired": bot.llm_hedges.children.get("fired", 0),
+        "hedges_won": bot.llm_hedges.children.get("won", 0),
+        "cache_hit_rate": bot.response_cache.stats()["hit_rate"],
+        "contexts": len(bot.user_contexts),
+        "max_rss_growth_mb": round((rss_after - rss_before) / 1024, 1)
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rejoue des conversations à travers le bot (faux Telegram, faux Groq)")
+    parser.add_argument("--trace", help="Trace JSONL à rejouer (sinon trace synthétique)")
+    parser.add_argument("--users", type=int, default=200, help="Utilisateurs de la trace synthétique")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages de la trace synthétique")
+    parser.add_argument("--rate", type=float, default=50, help="Messages/seconde de la trace synthétique")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Exposant de Zipf (activité des utilisateurs)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Accélération du rejeu (2 = deux fois plus vite)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--profile", default="alicia", help="Profil du bot à utiliser")
+    parser.add_argument("--groq-latency", type=float, default=0.2, help="Latence moyenne du faux Groq (s)")
+    parser.add_argument("--groq-jitter", type=float, default=0.05, help="Écart-type de la latence (s)")
+    parser.add_argument("--groq-errors", type=float, default=0.0, help="Proportion de réponses 500")
+    parser.add_argument("--groq-rate-limits", type=float, default=0.0, help="Proportion de réponses 429")
+    parser.add_argument("--groq-tail", type=float, default=0.0, help="Proportion de réponses très lentes")
+    parser.add_argument("--groq-tail-latency", type=float, default=3.0, help="Latence de ces réponses lentes (s)")
+    parser.add_argument("--backup-latency", type=float,
+                        help="Ajoute un 2e faux fournisseur (sans traîne) de cette latence moyenne (s)")
+    parser.add_argument("--no-hedge", action="store_true", help="Désactive les requêtes doublées")
+    parser.add_argument("--telegram-rate", type=float, default=30, help="Envois/seconde acceptés par le faux Bot API")
+    parser.add_argument("--telegram-chat-interval", type=float, default=1.0,
+                        help="Intervalle minimal entre 2 envois d'un chat côté faux Bot API (s)")
+    parser.add_argument("--no-delay", action="store_true", help="Supprime les pauses \"humaines\" du bot (le regroupement INBOUND_DEBOUNCE reste actif)")
+    parser.add_argument("--json", help="Écrit les résultats dans ce fichier JSON")
+    parser.add_argument("--max-p95", type=float, help="Échoue (code 1) si la latence p95 dépasse ce seuil (s)")
+    return parser.parse_args()
+
+def run_cli():
+    args = parse_args()
+
+    # Configuration du bot avant son import : rien n'est persisté, quotas Groq non limitants
+    os.environ.setdefault("GROQ_API_KEY", "gsk_replay")
+    os.environ.setdefault("CONTEXT_BACKEND", "memory")
+    os.environ.setdefault("ANALYTICS_SNAPSHOT_PATH", "")
+    os.environ.setdefault("GROQ_RPM", "1000000")
+    os.environ.setdefault("GROQ_TPM", "1000000000")
+    if args.no_delay:
+        os.environ["ARTIFICIAL_DELAYS"] = "0"
+    import main as bot
+
+    random.seed(args.seed)
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = synthetic_trace(args.users, args.messages, args.rate, args.zipf, args.seed)
+
+    results = asyncio.run(replay(bot, trace, args))
+    for name, value in results.items():
+        print(f"{name:>24} : {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.max_p95 is not None and results["latency_p95_s"] > args.max_p95:
+        print(f"❌ p95 {results['latency_p95_s']}s > {args.max_p95}s")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    run_cli()
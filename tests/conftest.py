@@ -0,0 +1,183 @@
+"""Configuration commune : le bot est importé sans stockage, sans pauses et sans quotas limitants
+
+Les benchmarks (marqueur benchmark) ne tournent qu'avec `pytest --benchmark` ;
+leurs mesures sont affichées dans le résumé de fin de session.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.update({
+    "GROQ_API_KEY": "gsk_test",
+    "LLM_PROVIDERS": "",
+    "CONTEXT_BACKEND": "memory",
+    "ANALYTICS_SNAPSHOT_PATH": "",
+    "EVENT_LOG_DIR": "",
+    "GROQ_RPM": "1000000",
+    "GROQ_TPM": "1000000000",
+    "ARTIFICIAL_DELAYS": "0",
+    "WORKERS": "1",
+})
+
+import main  # noqa: E402
+
+BENCHMARK_RESULTS = pytest.StashKey[list]()
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", help="lance aussi les benchmarks (marqueur benchmark)")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: mesure de performance, lancée seulement avec --benchmark")
+    config.stash[BENCHMARK_RESULTS] = []
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmark : relancer avec --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash[BENCHMARK_RESULTS]
+    if results:
+        terminalreporter.section("benchmarks")
+        for line in results:
+            terminalreporter.write_line(line)
+
+@pytest.fixture
+def report(request):
+    """Note une mesure de benchmark : `report("msg/s en parallèle", 812.4, "msg/s")`"""
+    results = request.config.stash[BENCHMARK_RESULTS]
+
+    def record(label: str, value: float, unit: str = ""):
+        results.append(f"{request.node.name} : {label} = {value:,.4g} {unit}".rstrip())
+    return record
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """Chaque test part d'un bot vierge (contextes, cache, files, analytics)"""
+    monkeypatch.setattr(main, "user_contexts", main.ContextStore(
+        main.CONTEXT_MAX_USERS, main.CONTEXT_IDLE_TTL, on_evict=main.log_session_end))
+    monkeypatch.setattr(main, "response_cache", main.ResponseCache(main.GROQ_CACHE_SIZE, main.GROQ_CACHE_TTL))
+    monkeypatch.setattr(main, "delayed_replies", main.DelayedReplyScheduler())
+    monkeypatch.setattr(main, "inbound_scheduler", main.FairTurnScheduler(
+        main.answer_turn, main.MAX_CONCURRENT_TURNS, 0.01, 0.05,
+        main.INBOUND_MAX_MERGED, main.USER_TURN_BURST, main.USER_TURNS_PER_MINUTE))
+    monkeypatch.setattr(main, "analytics", {
+        **main.analytics,
+        "total_users": 0, "total_messages": 0, "total_sessions": 0, "commands_used": {},
+        "daily_stats": main.OrderedDict(),
+        "conversation_lengths": main.RunningStats(), "conversation_lengths_sketch": main.DDSketch(),
+        "session_durations": main.RunningStats(), "session_durations_sketch": main.DDSketch(),
+        "returning_users": main.HyperLogLog(), "seen_users": main.BloomFilter(10000)
+    })
+    yield
+
+class FakeGroq:
+    """Groq en mémoire (transport httpx) : latence, erreurs 500 et 429 réglables, JSON ou SSE"""
+    url = "http://groq.test/openai/v1/chat/completions"
+
+    def __init__(self, latency: float, jitter: float, errors: float, rate_limits: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.errors = errors
+        self.rate_limits = rate_limits
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0  # Requêtes traitées en même temps, au plus
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        body = json.loads(await request.aread())
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        finally:
+            self.in_flight -= 1
+
+        draw = random.random()
+        if draw < self.errors:
+            return httpx.Response(500)
+        if draw < self.errors + self.rate_limits:
+            return httpx.Response(429, headers={"retry-after": "0.5s"})
+
+        text = f"Réponse {self.calls} : trop bien, raconte-moi encore ! Et toi ça va ?"
+        if body.get("stream"):
+            return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, content=self.stream(text))
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        return httpx.Response(200, json={
+            "choices": [{"message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                      "total_tokens": prompt_tokens + len(text) // 4}
+        })
+
+    async def stream(self, text: str):
+        for word in text.split(" "):
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n".encode()
+            await asyncio.sleep(0)  # Un morceau par tour de boucle, comme sur le réseau
+        yield b"data: [DONE]\n\n"
+
+@pytest.fixture
+def fake_groq():
+    """Fabrique d'un faux Groq, branché comme unique fournisseur LLM du bot
+
+    S'utilise dans la boucle du test : `async with fake_groq(latency=0.05) as groq:`
+    """
+    saved = list(main.llm_providers)
+
+    @asynccontextmanager
+    async def start(latency: float = 0.01, jitter: float = 0.0, errors: float = 0.0, rate_limits: float = 0.0):
+        groq = FakeGroq(latency, jitter, errors, rate_limits)
+        main.groq_client = httpx.AsyncClient(transport=httpx.MockTransport(groq.handle))
+        main.llm_providers[:] = [main.LLMProvider("fake", groq.url, "gsk_test")]
+        try:
+            yield groq
+        finally:
+            await main.close_groq_client()  # Client lié à la boucle du test
+
+    yield start
+    main.llm_providers[:] = saved
+
+class RecordingTelegram:
+    """Faux Bot API : garde le texte des réponses envoyées et de leurs éditions"""
+
+    def __init__(self, profile_name: str = "alicia"):
+        self.context = SimpleNamespace(
+            bot=SimpleNamespace(send_chat_action=self._noop),
+            bot_data={"profile": profile_name, "sender": main.TelegramSender(1000, 0, main.TELEGRAM_SEND_RETRIES)}
+        )
+        self.sent = []
+        self.edits = []
+
+    async def _noop(self, *args, **kwargs):
+        pass
+
+    def update(self, user_id: int, text: str) -> SimpleNamespace:
+        return SimpleNamespace(
+            effective_user=SimpleNamespace(id=user_id),
+            effective_chat=SimpleNamespace(id=user_id),
+            message=SimpleNamespace(text=text, reply_text=self._reply)
+        )
+
+    async def _reply(self, text: str) -> SimpleNamespace:
+        self.sent.append(text)
+        return SimpleNamespace(edit_text=self._edit)
+
+    async def _edit(self, text: str):
+        self.edits.append(text)
+
+@pytest.fixture
+def telegram() -> RecordingTelegram:
+    return RecordingTelegram()
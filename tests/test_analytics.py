@@ -0,0 +1,104 @@
+"""Analytics en mémoire constante : précision des sketches face au calcul exact"""
+import random
+import statistics
+
+import main
+
+def lognormal_values(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    return [rng.lognormvariate(4, 1.2) for _ in range(count)]
+
+def test_running_stats_match_exact_mean_and_variance():
+    values = lognormal_values(50_000)
+    stats = main.RunningStats()
+    for value in values:
+        stats.add(value)
+
+    assert abs(stats.mean - statistics.fmean(values)) < 1e-6 * statistics.fmean(values)
+    assert abs(stats.variance - statistics.variance(values)) < 1e-6 * statistics.variance(values)
+
+def test_running_stats_merge_equals_single_stream():
+    values = lognormal_values(10_000)
+    whole, left, right = main.RunningStats(), main.RunningStats(), main.RunningStats()
+    for index, value in enumerate(values):
+        whole.add(value)
+        (left if index % 3 else right).add(value)
+    left.merge(right)
+
+    assert left.count == whole.count
+    assert abs(left.mean - whole.mean) < 1e-9 * whole.mean
+    assert abs(left.variance - whole.variance) < 1e-6 * whole.variance
+
+def test_ddsketch_quantiles_within_relative_accuracy():
+    values = lognormal_values(100_000)
+    sketch = main.DDSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+    exact = sorted(values)
+
+    for q in (0.5, 0.9, 0.95, 0.99):
+        expected = exact[int(q * (len(exact) - 1))]
+        assert abs(sketch.quantile(q) - expected) <= 0.011 * expected, q
+
+def test_ddsketch_merge_keeps_accuracy():
+    values = lognormal_values(20_000)
+    left, right = main.DDSketch(), main.DDSketch()
+    for index, value in enumerate(values):
+        (left if index % 2 else right).add(value)
+    left.merge(right)
+    expected = sorted(values)[int(0.95 * (len(values) - 1))]
+
+    assert left.count == len(values)
+    assert abs(left.quantile(0.95) - expected) <= 0.011 * expected
+
+def test_hyperloglog_counts_distinct_users():
+    for distinct in (100, 10_000, 200_000):
+        hll = main.HyperLogLog()
+        for user_id in range(distinct):
+            hll.add(user_id)
+            hll.add(user_id)  # Doublons ignorés
+        assert abs(len(hll) - distinct) <= max(2, 0.03 * distinct), distinct
+
+def test_hyperloglog_merge_is_a_union():
+    left, right = main.HyperLogLog(), main.HyperLogLog()
+    for user_id in range(30_000):
+        left.add(user_id)
+    for user_id in range(20_000, 50_000):
+        right.add(user_id)
+    left.merge(right)
+
+    assert abs(len(left) - 50_000) <= 0.03 * 50_000
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    seen = main.BloomFilter(10_000)
+    collisions = sum(not seen.add(f"alicia:{user_id}") for user_id in range(10_000))
+    assert not any(seen.add(f"alicia:{user_id}") for user_id in range(10_000))
+    assert collisions < 0.02 * 10_000
+
+    assert all(f"alicia:{user_id}" in seen for user_id in range(10_000))
+    false_positives = sum(f"bella:{user_id}" in seen for user_id in range(10_000))
+    assert false_positives < 0.02 * 10_000
+    # La sonde ne remplit pas le filtre : un second passage trouve la même chose
+    assert sum(f"bella:{user_id}" in seen for user_id in range(10_000)) == false_positives
+
+def test_summary_matches_exact_computation():
+    lengths = [random.Random(2).randint(1, 40) for _ in range(5000)]
+    for length in lengths:
+        main.log_metric("conversation_length", value=length)
+    for user_id in range(3000):
+        main.log_metric("message", user_id)
+        main.log_metric("message", user_id)
+
+    summary = main.get_analytics_summary()
+    exact_p95 = sorted(lengths)[int(0.95 * (len(lengths) - 1))]
+    assert summary["averages"]["conversation_length"] == round(statistics.fmean(lengths), 1)
+    assert abs(summary["averages"]["conversation_length_p95"] - exact_p95) <= 0.011 * exact_p95 + 0.05
+    assert summary["today"]["messages"] == 6000
+    assert abs(summary["today"]["unique_users"] - 3000) <= 0.03 * 3000
+
+def test_daily_stats_keep_only_recent_days():
+    for day in range(main.ANALYTICS_DAYS + 10):
+        main.analytics["daily_stats"][f"2020-01-{day:02d}"] = main.new_daily_stats()
+    main.log_metric("message", 1)
+
+    assert len(main.analytics["daily_stats"]) <= main.ANALYTICS_DAYS
@@ -0,0 +1,132 @@
+"""Cache des réponses Groq (coalescence, TTL) et pool de blagues"""
+import asyncio
+
+import pytest
+
+import main
+
+PROFILE = main.profile_registry.get("alicia")
+
+@pytest.fixture
+def alicia_pool(monkeypatch):
+    """Pool de blagues neuf pour Alicia (celui du module reste intact)"""
+    pool = main.JokePool("alicia")
+    monkeypatch.setitem(main.joke_pools, "alicia", pool)
+    return pool
+
+def prompt(text: str) -> list:
+    return [PROFILE.system_message, {"role": "user", "content": text}]
+
+class CountingFetch:
+    """Faux appel Groq : compte les appels et répond après `delay`"""
+
+    def __init__(self, status: int = 200, delay: float = 0.05):
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self) -> tuple:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.status, (f"réponse {self.calls}" if self.status == 200 else None), 40
+
+def test_identical_concurrent_requests_share_one_call():
+    cache = main.ResponseCache(16, 60)
+    fetch = CountingFetch()
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_fetch("alicia", prompt("salut  TOI"), fetch) for _ in range(5)),
+                                    cache.get_or_fetch("alicia", prompt("salut toi"), fetch))
+
+    results = asyncio.run(scenario())
+    assert fetch.calls == 1  # Casse et espaces ignorés : même empreinte
+    assert results == [(200, "réponse 1")] * 6
+    assert cache.coalesced == 5 and cache.misses == 1
+    assert cache.saved_tokens == 5 * 40
+
+def test_different_prompts_are_not_coalesced():
+    cache = main.ResponseCache(16, 60)
+    fetch = CountingFetch()
+
+    async def scenario():
+        return await asyncio.gather(cache.get_or_fetch("alicia", prompt("salut"), fetch),
+                                    cache.get_or_fetch("alicia", prompt("bonsoir"), fetch),
+                                    cache.get_or_fetch("autre", prompt("salut"), fetch))
+
+    asyncio.run(scenario())
+    assert fetch.calls == 3
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    cache = main.ResponseCache(16, ttl=60)
+    fetch = CountingFetch(delay=0)
+
+    asyncio.run(cache.get_or_fetch("alicia", prompt("salut"), fetch))
+    now[0] += 59
+    assert asyncio.run(cache.get_or_fetch("alicia", prompt("salut"), fetch)) == (200, "réponse 1")
+    now[0] += 2
+    assert asyncio.run(cache.get_or_fetch("alicia", prompt("salut"), fetch)) == (200, "réponse 2")
+    assert fetch.calls == 2 and cache.hits == 1
+
+def test_lru_bound_drops_the_oldest_entry():
+    cache = main.ResponseCache(2, 60)
+    for text in ("a", "b", "c"):
+        cache.put("alicia", prompt(text), text, 10)
+    assert cache.get("alicia", prompt("a")) is None
+    assert cache.get("alicia", prompt("c")) == "c"
+
+def test_errors_are_shared_but_never_cached():
+    cache = main.ResponseCache(16, 60)
+    failing = CountingFetch(status=500)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_fetch("alicia", prompt("salut"), failing) for _ in range(3)))
+
+    assert asyncio.run(scenario()) == [(500, None)] * 3
+    assert failing.calls == 1
+    assert cache.get("alicia", prompt("salut")) is None
+
+def test_exception_reaches_every_waiter():
+    cache = main.ResponseCache(16, 60)
+
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("connexion perdue")
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_fetch("alicia", prompt("salut"), broken) for _ in range(3)),
+                                    return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(scenario()))
+    assert not cache._inflight
+
+def test_joke_comes_from_the_pool_then_falls_back_to_groq(fake_groq, alicia_pool):
+    alicia_pool.jokes.append(("Une blague du pool", 30))
+    context = main.UserContext()
+
+    async def scenario():
+        async with fake_groq() as groq:
+            first = await main.get_joke(1, context, PROFILE)
+            second = await main.get_joke(1, context, PROFILE)
+            return first, second, groq.calls
+
+    first, second, calls = asyncio.run(scenario())
+    assert first == "Une blague du pool"
+    assert second.startswith("Réponse")  # Pool vide : appel en direct
+    assert calls == 1
+    assert alicia_pool.served == 1 and alicia_pool.saved_tokens == 30
+
+def test_refill_leaves_the_reserve_to_conversations(fake_groq, alicia_pool, monkeypatch):
+    monkeypatch.setattr(main, "JOKE_POOL_SIZE", 20)
+
+    async def scenario():
+        async with fake_groq() as groq:
+            provider = main.llm_providers[0] = main.LLMProvider("fake", groq.url, "gsk_test",
+                                                                requests_per_minute=10)
+            await alicia_pool.refill()
+            return provider.limiter
+
+    limiter = asyncio.run(scenario())
+    assert len(alicia_pool.jokes) == 5  # Sur 10 requêtes/minute, 5 restent aux conversations
+    assert limiter.try_acquire(100)  # Une conversation passe sans attendre
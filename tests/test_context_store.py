@@ -0,0 +1,274 @@
+"""ContextStore : bornes mémoire, éviction LRU / inactivité et métriques de fin de session"""
+import asyncio
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+import main
+
+def make_store(max_entries: int = 3, idle_ttl: float = 3600, backend=None) -> tuple:
+    ended = []
+    store = main.ContextStore(max_entries, idle_ttl, on_evict=lambda key, context: ended.append(key),
+                              backend=backend)
+    return store, ended
+
+def test_lru_bound_evicts_least_recently_used():
+    store, ended = make_store(max_entries=3)
+    for user_id in range(3):
+        store.new_session(("alicia", user_id))
+    store.get(("alicia", 0))  # 0 redevient le plus récent
+    store.new_session(("alicia", 3))
+
+    assert len(store) == 3
+    assert ("alicia", 1) not in store
+    assert ended == [("alicia", 1)]
+
+def test_idle_contexts_expire():
+    store, ended = make_store(max_entries=100, idle_ttl=60)
+    store.new_session(("alicia", 1)).last_seen -= 61
+    store.new_session(("alicia", 2))
+
+    store.evict_expired()
+
+    assert ended == [("alicia", 1)]
+    assert store.get(("alicia", 1)) is None
+    assert store.get(("alicia", 2)) is not None
+
+def test_expiry_pass_is_bounded_by_limit():
+    store, ended = make_store(max_entries=100, idle_ttl=60)
+    contexts = [store.new_session(("alicia", user_id)) for user_id in range(10)]
+    store.new_session(("alicia", 99))
+    for context in contexts:
+        context.last_seen -= 61
+
+    store.evict_expired(limit=4)
+    assert len(ended) == 4 and len(store) == 7
+    store.evict_expired(limit=4)
+    store.evict_expired(limit=4)
+    assert ended == [("alicia", user_id) for user_id in range(10)]
+    assert len(store) == 1
+
+def test_flusher_closes_idle_sessions_without_any_access(monkeypatch):
+    monkeypatch.setattr(main, "CONTEXT_EXPIRE_BATCH", 2)
+    store, ended = make_store(max_entries=100, idle_ttl=60)
+    contexts = [store.new_session(("alicia", user_id)) for user_id in range(5)]
+    for context in contexts:
+        context.last_seen -= 61
+
+    async def scenario():
+        flusher = asyncio.create_task(store.run_flusher(0.01))
+        await asyncio.sleep(0.1)
+        flusher.cancel()
+
+    asyncio.run(scenario())
+    assert len(ended) == 5 and len(store) == 0
+
+def test_access_leaves_other_idle_sessions_to_the_flusher():
+    store, ended = make_store(max_entries=100, idle_ttl=60)
+    contexts = [store.new_session(("alicia", user_id)) for user_id in range(50)]
+    for context in contexts:
+        context.last_seen -= 61
+
+    store.new_session(("alicia", 99))
+    store.get(("alicia", 99))
+    assert ended == []  # Pas de balayage de masse pendant un message
+
+    assert store.get(("alicia", 7)) is None  # Sa propre session expirée est bien fermée
+    assert ended == [("alicia", 7)]
+
+class RecordingBackend(main.ContextBackend):
+    persistent = True
+
+    def __init__(self):
+        self.batches = []
+
+    def write_batch(self, records, deleted):
+        self.batches.append(sorted(records))
+
+def test_only_modified_contexts_are_written():
+    backend = RecordingBackend()
+    store, _ = make_store(backend=backend)
+    key = ("alicia", 1)
+    store.new_session(key)
+    asyncio.run(store.flush())
+
+    store.get(key)
+    asyncio.run(store.fetch(key))
+    asyncio.run(store.flush())
+    store.get(key).message_count += 1
+    store.mark_dirty(key)
+    asyncio.run(store.flush())
+
+    assert backend.batches == [[key], [key]]  # Les lectures seules n'écrivent rien
+
+@pytest.mark.benchmark
+def test_bench_idle_sweep_at_1m_contexts(report):
+    """Coût d'un passage du flusher avec un million de sessions en mémoire"""
+    users, batch = 1_000_000, main.CONTEXT_EXPIRE_BATCH
+    store = main.ContextStore(users, 60, on_evict=main.log_session_end)
+    contexts = [store.new_session(("alicia", user_id)) for user_id in range(users)]
+
+    started = time.perf_counter()
+    store.evict_expired(limit=batch)
+    report("passage sans session expirée", (time.perf_counter() - started) * 1e6, "µs")
+    assert len(store) == users
+
+    for context in contexts:
+        context.last_seen -= 61
+    del contexts
+    passes, worst, total = 0, 0.0, 0.0
+    while len(store):
+        started = time.perf_counter()
+        store.evict_expired(limit=batch)
+        elapsed = time.perf_counter() - started
+        passes, worst, total = passes + 1, max(worst, elapsed), total + elapsed
+    report(f"passage de {batch} sessions expirées, au pire", worst * 1e3, "ms")
+    report(f"expiration du million en {passes} passages", total, "s")
+    assert passes == users // batch
+
+def test_eviction_logs_session_end_and_length():
+    store = main.ContextStore(10, 60, on_evict=main.log_session_end)
+    context = store.new_session(("alicia", 1))
+    context.message_count = 7
+    context.last_seen -= 61
+
+    store.evict_expired()
+
+    assert main.analytics["conversation_lengths"].count == 1
+    assert main.analytics["conversation_lengths"].mean == 7
+    assert main.analytics["session_durations"].count == 1
+
+def test_store_stays_at_its_bound():
+    store, ended = make_store(max_entries=1000)
+    for user_id in range(5000):
+        store.new_session(("alicia", user_id))
+
+    assert len(store) == 1000
+    assert len(ended) == 4000
+    assert ("alicia", 3999) not in store and ("alicia", 4999) in store
+
+@pytest.mark.benchmark
+def test_bench_memory_per_context_at_1m_users(report):
+    """Un million d'utilisateurs synthétiques dans un store borné à 100 000 contextes"""
+    users, bound = 1_000_000, 100_000
+    store = main.ContextStore(bound, 3600, on_evict=lambda key, context: None)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    for user_id in range(users):
+        store.new_session(("alicia", user_id))
+    elapsed = time.perf_counter() - started
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    per_context = used / bound
+    report(f"{users} utilisateurs, {len(store)} contextes gardés", used / 1e6, "Mo")
+    report("mémoire par contexte", per_context, "octets")
+    report("new_session avec éviction (sous tracemalloc)", elapsed / users * 1e6, "µs")
+    assert len(store) == bound
+    assert per_context < 1000
+
+def test_returning_user_after_eviction_is_not_new(fake_groq):
+    profile = main.profile_registry.get("alicia")
+
+    async def scenario():
+        async with fake_groq():
+            await main.get_alicia_response("coucou", 42, profile)
+            main.user_contexts.pop(("alicia", 42))  # Contexte oublié (TTL ou LRU)
+            await main.get_alicia_response("re", 42, profile)
+            await main.get_alicia_response("salut", 43, profile)
+
+    asyncio.run(scenario())
+    assert main.analytics["total_users"] == 2
+    assert main.analytics["total_sessions"] == 3
+    assert len(main.analytics["returning_users"]) == 1
+
+def test_sqlite_round_trip(tmp_path):
+    path = str(tmp_path / "contexts.db")
+    store, _ = make_store(max_entries=10, backend=main.SQLiteBackend(path))
+    context = store.new_session(("alicia", 1), first_interaction=False)
+    context.message_count = 4
+    main.record_exchange(context, "salut", "coucou toi")
+    asyncio.run(store.flush())
+    store.backend.close()
+
+    restarted, _ = make_store(max_entries=10, backend=main.SQLiteBackend(path))
+    assert restarted.get(("alicia", 1)) is None  # get() ne lit jamais le disque
+    loaded = asyncio.run(restarted.fetch(("alicia", 1)))
+    restarted.backend.close()
+
+    assert loaded.message_count == 4
+    assert not loaded.first_interaction
+    assert loaded.conversation_history[0]["alicia"] == "coucou toi"
+
+def test_fetch_reads_backend_off_the_event_loop():
+    class SlowBackend(main.ContextBackend):
+        persistent = True
+
+        def load(self, key):
+            self.thread = threading.get_ident()
+            time.sleep(0.2)
+            return main.serialize_context(main.UserContext(message_count=9))
+
+    async def scenario():
+        backend = SlowBackend()
+        store, _ = make_store(backend=backend)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        context = await store.fetch(("alicia", 1))
+        task.cancel()
+        return context, backend.thread, ticks
+
+    context, thread, ticks = asyncio.run(scenario())
+    assert context.message_count == 9
+    assert thread != threading.get_ident()
+    assert ticks >= 10  # La boucle a continué de tourner pendant la lecture
+
+class FakeRedis:
+    """Client minimal compatible redis-py (get, pipeline set/delete)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def execute(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_redis_backend_round_trip_and_delete():
+    client = FakeRedis()
+    store, _ = make_store(max_entries=10, idle_ttl=60, backend=main.RedisBackend(client, 60))
+    store.new_session(("alicia", 1)).message_count = 3
+    asyncio.run(store.flush())
+    assert "alicia:ctx:alicia:1" in client.data
+
+    other, _ = make_store(max_entries=10, idle_ttl=60, backend=main.RedisBackend(client, 60))
+    assert asyncio.run(other.fetch(("alicia", 1))).message_count == 3
+
+    other.get(("alicia", 1)).last_seen -= 61  # Session inactive : supprimée du stockage
+    other.evict_expired()
+    asyncio.run(other.flush())
+    assert client.data == {}
@@ -0,0 +1,114 @@
+"""Journal d'événements : tampon borné, écriture par lots compressés, anonymisation, rotation"""
+import asyncio
+import gzip
+import json
+import time
+
+import pytest
+
+import main
+
+@pytest.fixture
+def event_log(tmp_path):
+    if main.zstandard:
+        pytest.skip("lecture des lots gzip uniquement")
+    return main.EventLog(str(tmp_path), capacity=1000, rotate_bytes=1 << 20, salt="sel-de-test")
+
+def read_events(directory) -> list:
+    events = []
+    for path in sorted(directory.iterdir()):
+        with gzip.open(path, "rt", encoding="utf-8") as f:  # Lit tous les membres gzip
+            events.extend(json.loads(line) for line in f)
+    return events
+
+def test_batches_are_appended_as_anonymized_jsonl(event_log, tmp_path):
+    event_log.emit("message", 1234, profile="alicia")
+    event_log.emit("reply", 1234, 0.5, "groq", "alicia")
+    asyncio.run(event_log.flush())
+    event_log.emit("session_start")
+    asyncio.run(event_log.flush())
+
+    events = read_events(tmp_path)
+    assert len(list(tmp_path.iterdir())) == 1  # Deux lots, un seul fichier
+    assert [event["event"] for event in events] == ["message", "reply", "session_start"]
+    assert events[0]["user"] == events[1]["user"] != "1234"
+    assert events[1] | {"ts": 0} == {"ts": 0, "event": "reply", "user": events[0]["user"],
+                                     "value": 0.5, "detail": "groq", "profile": "alicia"}
+    assert set(events[2]) == {"ts", "event"}  # Champs vides omis
+    assert event_log.written == 3 and not event_log.buffer
+
+def test_full_buffer_drops_oldest_events(tmp_path):
+    log = main.EventLog(str(tmp_path), capacity=10, rotate_bytes=1 << 20, salt="s")
+    for index in range(15):
+        log.emit("message", value=index)
+
+    assert log.dropped == 5
+    assert [record[3] for record in log.buffer] == list(range(5, 15))
+
+def test_files_rotate_by_size(event_log, tmp_path):
+    event_log.rotate_bytes = 1
+    for batch in range(3):
+        event_log.emit("message", batch)
+        asyncio.run(event_log.flush())
+
+    assert len(list(tmp_path.iterdir())) == 3
+    assert len(read_events(tmp_path)) == 3
+
+def test_failed_write_counts_events_as_dropped(tmp_path):
+    log = main.EventLog(str(tmp_path / "absent"), capacity=100, rotate_bytes=1 << 20, salt="s")
+    log.emit("message", 1)
+    log.emit("message", 2)
+    asyncio.run(log.flush())
+
+    assert log.dropped == 2 and log.written == 0
+
+def test_disabled_log_records_nothing():
+    log = main.EventLog("", capacity=100, rotate_bytes=1 << 20, salt="s")
+    log.emit("message", 1)
+    assert not log.buffer
+
+def test_metrics_and_replies_are_emitted(fake_groq, monkeypatch, tmp_path):
+    log = main.EventLog(str(tmp_path), capacity=1000, rotate_bytes=1 << 20, salt="s")
+    monkeypatch.setattr(main, "event_log", log)
+    profile = main.profile_registry.get("alicia")
+
+    async def scenario():
+        async with fake_groq():
+            await main.get_alicia_response("coucou", 42, profile)
+            await main.get_alicia_response("raconte-moi ta journée", 42, profile)
+
+    asyncio.run(scenario())
+    events = [(record[1], record[4]) for record in log.buffer]
+    assert ("session_start", None) in events and ("new_user", None) in events
+    assert [detail for event, detail in events if event == "reply"] == ["first_reply", "groq"]
+
+@pytest.mark.benchmark
+def test_bench_emit_and_flush(tmp_path, report):
+    """Coût d'emit() sur la boucle, et retard de la boucle pendant l'écriture de 200 000 événements"""
+    runs = 200_000
+    for directory, label in (("", "désactivé"), (str(tmp_path), "activé")):
+        log = main.EventLog(directory, capacity=runs, rotate_bytes=1 << 30, salt="s")
+        started = time.perf_counter()
+        for user_id in range(runs):
+            log.emit("message", user_id, profile="alicia")
+        report(f"emit(), journal {label}", (time.perf_counter() - started) / runs * 1e6, "µs")
+
+    async def flush_with_ticker() -> float:
+        worst = 0.0
+
+        async def ticker():
+            nonlocal worst
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(0.001)
+                worst = max(worst, time.perf_counter() - started - 0.001)
+
+        task = asyncio.create_task(ticker())
+        await asyncio.sleep(0.01)
+        await log.flush()
+        task.cancel()
+        return worst
+
+    lag = asyncio.run(flush_with_ticker())
+    report(f"retard max de la boucle pendant le flush de {runs} événements", lag * 1e3, "ms")
+    assert log.written == runs
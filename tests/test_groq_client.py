@@ -0,0 +1,64 @@
+"""Client Groq asynchrone : un client partagé, et les appels de plusieurs utilisateurs se chevauchent"""
+import asyncio
+import time
+
+import pytest
+
+import main
+
+USERS = 40
+LATENCY = 0.05
+
+async def ask(user_id: int) -> str:
+    profile = main.profile_registry.get("alicia")
+    return await main.get_groq_response(f"raconte-moi ta journée {user_id}", user_id, main.UserContext(),
+                                        profile, use_cache=False)
+
+def test_client_is_shared_until_closed():
+    client = main.get_groq_client()
+    assert main.get_groq_client() is client
+
+    asyncio.run(main.close_groq_client())
+    assert client.is_closed
+    assert main.get_groq_client() is not client  # Recréé à la demande
+    asyncio.run(main.close_groq_client())
+
+def test_fake_groq_answers_through_the_shared_client(fake_groq):
+    async def scenario():
+        async with fake_groq(latency=0.0) as groq:
+            reply = await ask(1)
+            return reply, groq.calls
+
+    reply, calls = asyncio.run(scenario())
+    assert reply.startswith("Réponse 1")
+    assert calls == 1
+
+def test_concurrent_users_are_not_serialized(fake_groq):
+    async def scenario():
+        async with fake_groq(latency=LATENCY) as groq:
+            replies = await asyncio.gather(*(ask(user_id) for user_id in range(USERS)))
+            return replies, groq.max_in_flight
+
+    replies, max_in_flight = asyncio.run(scenario())
+    assert all(reply.startswith("Réponse") for reply in replies)
+    assert max_in_flight == USERS  # Tous les appels en cours en même temps
+
+@pytest.mark.benchmark
+def test_bench_concurrent_users(fake_groq, report):
+    """N utilisateurs simultanés contre un appel à la fois (l'ancien requests.post)"""
+    async def scenario():
+        async with fake_groq(latency=LATENCY):
+            started = time.perf_counter()
+            for user_id in range(USERS):
+                await ask(user_id)
+            sequential = USERS / (time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(ask(user_id) for user_id in range(USERS)))
+            concurrent = USERS / (time.perf_counter() - started)
+            return sequential, concurrent
+
+    sequential, concurrent = asyncio.run(scenario())
+    report(f"un par un, Groq à {LATENCY}s", sequential, "msg/s")
+    report(f"{USERS} en parallèle", concurrent, "msg/s")
+    assert concurrent > 5 * sequential
@@ -0,0 +1,240 @@
+"""File d'entrée : regroupement des messages, comptage et remplacement des réponses en attente"""
+import asyncio
+import random
+import time
+import tracemalloc
+
+import pytest
+
+import main
+
+async def settle():
+    """Attend que tous les tours et toutes les réponses programmées soient partis"""
+    await main.inbound_scheduler.drain()
+    await main.delayed_replies.drain()
+
+def test_merged_messages_are_each_counted(fake_groq, telegram):
+    async def scenario():
+        async with fake_groq():
+            for text in ("salut", "tu vas bien", "tu fais quoi"):
+                await main.handle_message(telegram.update(7, text), telegram.context)
+            await settle()
+
+    asyncio.run(scenario())
+    assert main.inbound_scheduler.merged == 2
+    assert len(telegram.sent) == 1  # Une seule réponse aux trois messages
+    assert main.analytics["total_messages"] == 3
+    assert main.analytics["daily_stats"][main.datetime.now().strftime("%Y-%m-%d")]["messages"] == 3
+
+@pytest.fixture
+def pending_replies(monkeypatch):
+    """Les réponses restent en attente de leur pause "humaine" jusqu'au drain"""
+    monkeypatch.setattr(main, "ARTIFICIAL_DELAYS", True)
+    monkeypatch.setattr(main, "calculate_response_delay", lambda text: 60)
+
+async def say(telegram, text: str, user_id: int = 7):
+    """Envoie un message et attend que son tour ait produit une réponse (programmée)"""
+    await main.handle_message(telegram.update(user_id, text), telegram.context)
+    await main.inbound_scheduler.drain()
+
+def test_pending_groq_reply_is_replaced_by_one_answer_to_both(fake_groq, pending_replies, telegram):
+
+    async def scenario():
+        async with fake_groq() as groq:
+            await say(telegram, "coucou")
+            await main.delayed_replies.drain()
+            await say(telegram, "raconte-moi ta journée")
+            await say(telegram, "et demain tu bosses ?")
+            await main.delayed_replies.drain()
+            return groq.calls
+
+    groq_calls = asyncio.run(scenario())
+    context = main.user_contexts.get(("alicia", 7))
+    assert len(telegram.sent) == 2  # first_reply, puis une seule réponse aux deux messages
+    assert groq_calls == 2
+    assert [exchange["user"] for exchange in context.conversation_history] == [
+        "raconte-moi ta journée\net demain tu bosses ?"]
+    assert context.message_count == 2
+
+def test_sexual_reply_is_not_replayed_by_a_new_message(fake_groq, pending_replies, telegram):
+    profile = main.profile_registry.get("alicia")
+
+    async def scenario():
+        async with fake_groq():
+            await say(telegram, "coucou")
+            await say(telegram, "t'es sexy")
+            await say(telegram, "raconte-moi ta journée")
+            await main.delayed_replies.drain()
+
+    asyncio.run(scenario())
+    context = main.user_contexts.get(("alicia", 7))
+    assert context.sexual_messages_count == 1
+    assert len(telegram.sent) == 3  # Le nouveau message a sa propre réponse
+    assert any(telegram.sent[1] in replies for replies in profile.sexual_replies)
+
+def test_ending_reply_is_sent_once_and_not_replayed(fake_groq, pending_replies, telegram):
+    profile = main.profile_registry.get("alicia")
+
+    async def scenario():
+        async with fake_groq():
+            await say(telegram, "coucou")
+            main.user_contexts.get(("alicia", 7)).message_count = profile.thresholds.end_max_messages
+            await say(telegram, "raconte-moi ta journée")
+            await say(telegram, "attends")
+            await main.delayed_replies.drain()
+
+    asyncio.run(scenario())
+    assert telegram.sent[0] == profile.first_reply
+    assert telegram.sent[1] in profile.ending_messages
+    assert telegram.sent.count(profile.first_reply) == 2  # Nouvelle session après la fin, une seule fois
+    assert main.analytics["session_durations"].count == 1
+
+def test_clear_cancels_every_pending_reply(fake_groq, pending_replies, telegram):
+
+    async def scenario():
+        async with fake_groq():
+            await say(telegram, "coucou")
+            await say(telegram, "t'es sexy")
+            main.delayed_replies.cancel(("alicia", 7))
+            await main.delayed_replies.drain()
+
+    asyncio.run(scenario())
+    assert telegram.sent == []
+    assert len(main.delayed_replies) == 0
+
+def test_turn_resubmitted_after_discard_waits_for_its_fair_slot():
+    order = []
+    release = asyncio.Event()
+
+    async def handler(turn):
+        order.append(turn.key)
+        if turn.key == "x":
+            await release.wait()
+
+    async def scenario():
+        scheduler = main.FairTurnScheduler(handler, 1, 0.005, 0.02, 5, 10, 600)
+        scheduler.submit("x", "occupe la seule place", None, None)
+        await asyncio.sleep(0.03)
+        scheduler.submit("b", "premier message", None, None)
+        await asyncio.sleep(0.03)
+        scheduler.submit("c", "attend son tour", None, None)
+        await asyncio.sleep(0.03)
+        scheduler.discard("b")  # /clear : l'entrée de b reste dans le tas
+        scheduler.submit("b", "après le /clear", None, None)
+        await asyncio.sleep(0.03)
+        release.set()
+        await scheduler.drain()
+
+    asyncio.run(scenario())
+    assert order == ["x", "c", "b"]  # c était prêt avant le nouveau tour de b
+
+async def measure(start_all, settle: float = 0.05) -> tuple:
+    """(secondes pour tout lancer, octets encore alloués une fois la boucle reposée)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    handles = start_all()
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(settle)  # Indicateurs de frappe envoyés, seules les attentes restent
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return elapsed, used, handles
+
+@pytest.mark.benchmark
+def test_bench_10k_pending_replies(telegram, monkeypatch, report):
+    """10 000 réponses en attente : un tas et un timer contre une tâche endormie par réponse"""
+    monkeypatch.setattr(main, "ARTIFICIAL_DELAYS", True)
+    count = 10_000
+    updates = [telegram.update(user_id, "salut") for user_id in range(count)]
+
+    async def sleeping_reply(update):
+        await main.typing_pause(update, telegram.context, 60)
+        await main.send_reply(update, telegram.context, "coucou")
+
+    async def scenario():
+        scheduler = main.DelayedReplyScheduler()
+        heap = await measure(lambda: [scheduler.schedule(("alicia", update.effective_chat.id), 60, update,
+                                                         telegram.context, "coucou") for update in updates])
+        assert len(scheduler) == count
+        for update in updates:
+            scheduler.cancel(("alicia", update.effective_chat.id))
+        await scheduler.drain()
+
+        tasks = await measure(lambda: [asyncio.create_task(sleeping_reply(update)) for update in updates])
+        for task in tasks[2]:
+            task.cancel()
+        await asyncio.gather(*tasks[2], return_exceptions=True)
+        return heap, tasks
+
+    (heap_time, heap_memory, _), (tasks_time, tasks_memory, _) = asyncio.run(scenario())
+    report("DelayedReplyScheduler : programmation", heap_time * 1e3, "ms")
+    report("DelayedReplyScheduler : mémoire en attente", heap_memory / 1e6, "Mo")
+    report("tâches endormies : création", tasks_time * 1e3, "ms")
+    report("tâches endormies : mémoire en attente", tasks_memory / 1e6, "Mo")
+    assert heap_memory < tasks_memory
+
+def zipf_arrivals(users: int, messages: int, rate: float, seed: int = 3) -> list:
+    """(instant d'arrivée, utilisateur) : arrivées poissonniennes, utilisateurs tirés selon Zipf"""
+    rng = random.Random(seed)
+    weights = [1 / rank ** 1.2 for rank in range(1, users + 1)]
+    at, arrivals = 0.0, []
+    for user in rng.choices(range(users), weights=weights, k=messages):
+        at += rng.expovariate(rate)
+        arrivals.append((at, user))
+    return arrivals
+
+def p95(values: list) -> float:
+    values = sorted(values)
+    return values[int(0.95 * (len(values) - 1))]
+
+async def replay_arrivals(arrivals: list, submit) -> None:
+    started = time.perf_counter()
+    for at, user in arrivals:
+        wait = started + at - time.perf_counter()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        submit(user, time.perf_counter())
+
+@pytest.mark.benchmark
+def test_bench_zipf_fairness(report):
+    """Charge au-dessus de la capacité : attente des utilisateurs calmes, file équitable contre FIFO"""
+    arrivals = zipf_arrivals(users=200, messages=1500, rate=500)
+    service, slots, heavy = 0.01, 4, 10  # 400 tours/s au plus ; les 10 premiers rangs sont "bavards"
+
+    async def fifo() -> dict:
+        waits, semaphore, tasks = {}, asyncio.Semaphore(slots), []
+
+        async def handle(user: int, arrived: float):
+            async with semaphore:
+                waits.setdefault(user, []).append(time.perf_counter() - arrived)
+                await asyncio.sleep(service)
+
+        await replay_arrivals(arrivals, lambda user, now: tasks.append(asyncio.create_task(handle(user, now))))
+        await asyncio.gather(*tasks)
+        return waits
+
+    async def fair() -> dict:
+        waits = {}
+
+        async def handler(turn):
+            now = time.perf_counter()
+            waits.setdefault(turn.key, []).extend(now - float(arrived) for arrived in turn.messages)
+            await asyncio.sleep(service)
+
+        scheduler = main.FairTurnScheduler(handler, slots, 0.005, 0.02, 5, 1000, 60_000)
+        await replay_arrivals(arrivals, lambda user, now: scheduler.submit(user, repr(now), None, None))
+        await scheduler.drain()
+        return waits
+
+    def calm_and_chatty(waits: dict) -> tuple:
+        calm = [wait for user, values in waits.items() if user >= heavy for wait in values]
+        chatty = [wait for user, values in waits.items() if user < heavy for wait in values]
+        return p95(calm), p95(chatty)
+
+    fifo_calm, fifo_chatty = calm_and_chatty(asyncio.run(fifo()))
+    fair_calm, fair_chatty = calm_and_chatty(asyncio.run(fair()))
+    report("FIFO : p95 d'attente des utilisateurs calmes", fifo_calm * 1e3, "ms")
+    report(f"FIFO : p95 d'attente des {heavy} plus bavards", fifo_chatty * 1e3, "ms")
+    report("file équitable : p95 d'attente des utilisateurs calmes", fair_calm * 1e3, "ms")
+    report(f"file équitable : p95 d'attente des {heavy} plus bavards", fair_chatty * 1e3, "ms")
+    assert fair_calm < fifo_calm / 2
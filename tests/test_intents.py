@@ -0,0 +1,74 @@
+"""Réponses locales aux intentions : corpus étiqueté (None = Groq doit répondre)"""
+import time
+
+import pytest
+
+import main
+
+CORPUS = [
+    ("salut", "greeting"),
+    ("coucou !", "greeting"),
+    ("bonjour", "greeting"),
+    ("hello toi", "greeting"),
+    ("Salut !!", "greeting"),
+    ("cc", "greeting"),
+    ("bonsoir toi", "greeting"),
+    ("ça va ?", "how_are_you"),
+    ("ca va toi ?", "how_are_you"),
+    ("comment tu vas ?", "how_are_you"),
+    ("tu vas bien ?", "how_are_you"),
+    ("la forme ?", "how_are_you"),
+    ("t'as quel âge ?", "age"),
+    ("tu as quel age", "age"),
+    ("quel âge as-tu", "age"),
+    ("ton âge ?", "age"),
+    ("t'es un robot ?", "robot"),
+    ("tu es une ia ?", "robot"),
+    ("t'es un bot ?", "robot"),
+    ("t'es réelle ?", "robot"),
+    ("bonne nuit", "goodbye"),
+    ("à plus", "goodbye"),
+    ("bye", "goodbye"),
+    ("à demain !", "goodbye"),
+    ("je dois y aller", "goodbye"),
+    # Faux positifs observés en production au seuil de 0.6
+    ("tu as quel âge ta mère", None),
+    ("je dois y aller au travail demain", None),
+    ("salut ça va ?", None),
+    # Proches des exemples sans être la même question
+    ("salut tu fais quoi", None),
+    ("quel âge a ton frère ?", None),
+    ("je vais bien et toi ?", None),
+    ("t'es un robot de cuisine toi", None),
+    ("ça va la journée au boulot ?", None),
+    ("bonne nuit j'ai passé une sale journée au boulot", None),
+    ("t'aimes quoi comme musique ?", None),
+    ("raconte-moi ta journée", None),
+    ("tu habites où ?", None),
+    ("tu fais quoi ce soir ?", None),
+    ("haha t'es drôle", None),
+]
+
+@pytest.fixture(scope="module")
+def profile():
+    return main.profile_registry.get("alicia")
+
+@pytest.mark.parametrize("message, intent", CORPUS)
+def test_labelled_corpus(profile, message, intent):
+    reply = main.match_intent(message, profile)
+    if intent is None:
+        assert reply is None, f"{message!r} -> {reply!r}"
+    else:
+        assert reply in profile.intent_replies[intent]
+
+@pytest.mark.benchmark
+def test_bench_lookup_cost(profile, report):
+    runs = 200
+    started = time.perf_counter()
+    for _ in range(runs):
+        for message, _ in CORPUS:
+            main.match_intent(message, profile)
+    per_lookup = (time.perf_counter() - started) / (runs * len(CORPUS))
+
+    report(f"match_intent, {len(profile.intent_replies)} intentions", per_lookup * 1e6, "µs")
+    assert per_lookup < 200e-6
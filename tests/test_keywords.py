@@ -0,0 +1,64 @@
+"""Détection de contenu sexuel : rappel, précision et coût par message"""
+import time
+
+import pytest
+
+import main
+
+@pytest.fixture
+def profile():
+    return main.profile_registry.get("alicia")
+
+@pytest.mark.parametrize("message, expected", [
+    ("t'es sexy", 1),
+    ("T'ES S3XY", 1),
+    ("envoie des photos nues", 3),
+    ("on va au lit ?", 1),
+    ("je veux te baiser", 3),
+    ("elle est chaude", 1),
+    ("sexe sexe sexe", 3),
+])
+def test_keywords_and_their_inflections_are_detected(profile, message, expected):
+    assert main.detect_sexual_content(message, profile) == expected
+
+@pytest.mark.parametrize("message", [
+    "on parle de politique ce soir ?",
+    "j'ai raté mon calcul mental",
+    "une nuée d'oiseaux au-dessus du port",
+    "les nuées sont basses aujourd'hui",
+    "c'est l'élite du foot marseillais",
+    "tu as lu ce livre ?",
+    "je me suis couché tard",
+])
+def test_innocent_words_do_not_score(profile, message):
+    assert main.detect_sexual_content(message, profile) == 0
+
+@pytest.mark.parametrize("text, normalized", [
+    ("T'ES S3XY", "t'es sexy"),
+    ("envoie des ph0t0s nu3s", "envoie des photos nues"),
+    ("$exe", "sexe"),
+    ("s@lut", "salut"),
+    ("j'ai 21 ans", "j'ai 21 ans"),
+    ("le 1er mai à 14h30", "le 1er mai a 14h30"),
+    ("mon mp3", "mon mp3"),
+    ("ma sœur a le cœur brisé", "ma soeur a le coeur brise"),
+    ("Æther", "aether"),
+])
+def test_normalization_folds_leetspeak_only_inside_words(text, normalized):
+    assert main.normalize_text(text) == normalized
+
+def test_numbers_reach_the_intent_index_intact():
+    assert {" 21", "21 "} <= main.char_ngrams("j'ai 21 ans").keys()
+    assert "oeu" in main.char_ngrams("mon cœur")
+
+@pytest.mark.benchmark
+def test_bench_detection_cost(profile, report):
+    message = "Coucou ! Tu fais quoi ce soir ? On pourrait parler de politique et de calcul mental " * 4
+    runs = 5_000
+    start = time.perf_counter()
+    for _ in range(runs):
+        main.detect_sexual_content(message, profile)
+    per_message = (time.perf_counter() - start) / runs
+
+    report(f"detect_sexual_content, {len(message)} caractères", per_message * 1e6, "µs/message")
+    assert per_message < 200e-6
@@ -0,0 +1,65 @@
+"""Métriques OpenMetrics : format exposé et coût d'enregistrement par message"""
+import time
+
+import pytest
+
+import main
+
+def test_histograms_counters_and_gauges_render_as_openmetrics():
+    registry = main.MetricsRegistry("test")
+    latency = registry.add("stage_seconds", "histogram", "Durée", label="stage", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 3):
+        latency.labels("groq").observe(value)
+    registry.add("sends", "counter", "Envois", label="outcome").inc("sent", 2)
+    registry.add("entries", "gauge", "Contextes", collect=lambda: 7)
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# TYPE test_stage_seconds histogram", "# HELP test_stage_seconds Durée"]
+    assert lines[2:7] == [
+        'test_stage_seconds_bucket{stage="groq",le="0.1"} 1',
+        'test_stage_seconds_bucket{stage="groq",le="1"} 2',  # Buckets cumulés
+        'test_stage_seconds_bucket{stage="groq",le="+Inf"} 3',
+        'test_stage_seconds_count{stage="groq"} 3',
+        'test_stage_seconds_sum{stage="groq"} 3.55',
+    ]
+    assert 'test_sends_total{outcome="sent"} 2' in lines
+    assert "test_entries 7" in lines
+    assert lines[-1] == "# EOF"
+
+def test_bot_registry_renders():
+    text = main.metrics.render()
+    assert "alicia_context_store_entries 0" in text
+    assert text.endswith("# EOF\n")
+
+def record_groq_message():
+    """Enregistrements d'un message répondu par Groq, comme sur le chemin réel"""
+    started = time.perf_counter()
+    main.STAGE_QUEUE_WAIT.observe(time.perf_counter() - started)
+    main.STAGE_SEXUAL_DETECTION.observe(time.perf_counter() - started)
+    main.STAGE_INTENT_MATCH.observe(time.perf_counter() - started)
+    main.intent_lookups.inc("none")
+    main.llm_requests.inc("groq")
+    main.STAGE_GROQ_REQUEST.observe(time.perf_counter() - started)
+    main.groq_responses.inc("200")
+    main.groq_tokens.inc("prompt", 350)
+    main.groq_tokens.inc("completion", 40)
+    main.STAGE_THINKING.observe(0.8)
+    main.STAGE_TYPING.observe(2.5)
+    main.STAGE_TELEGRAM_SEND.observe(time.perf_counter() - started)
+    main.telegram_sends.inc("sent")
+
+@pytest.mark.benchmark
+def test_bench_recording_cost_per_message(report):
+    runs = 100_000
+    started = time.perf_counter()
+    for _ in range(runs):
+        record_groq_message()
+    per_message = (time.perf_counter() - started) / runs
+    started = time.perf_counter()
+    for _ in range(runs):
+        main.STAGE_GROQ_REQUEST.observe(0.3)
+    per_observe = (time.perf_counter() - started) / runs
+
+    report("7 histogrammes et 6 compteurs par message", per_message * 1e6, "µs")
+    report("observe()", per_observe * 1e6, "µs")
+    assert per_message < 50e-6
@@ -0,0 +1,77 @@
+"""Profils : validation au chargement et rechargement à chaud du fichier"""
+import asyncio
+import copy
+import json
+import logging
+import os
+
+import pytest
+
+import main
+
+with open(main.BOT_PROFILES_PATH, encoding="utf-8") as f:
+    CONFIG = json.load(f)
+
+def write_config(path, config, mtime: float):
+    path.write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+    os.utime(path, (mtime, mtime))  # Deux écritures dans la même seconde restent distinctes
+
+def edited(**changes) -> dict:
+    config = copy.deepcopy(CONFIG)
+    config["profiles"]["alicia"].update(changes)
+    return config
+
+@pytest.fixture
+def profiles_file(tmp_path):
+    path = tmp_path / "bot_profiles.json"
+    write_config(path, CONFIG, 1_000_000)
+    return path
+
+def test_fanvue_url_is_substituted_everywhere():
+    profile = main.profile_registry.get("alicia")
+    replies = [*profile.fanvue_teases, *(reply for group in profile.sexual_replies for reply in group),
+               *(reply for group in profile.intent_replies.values() for reply in group)]
+    assert all("{fanvue_url}" not in reply for reply in replies)
+    assert "{fanvue_url}" not in profile.system_message["content"]
+
+@pytest.mark.parametrize("changes, error", [
+    ({"sexual_keywords": {"sexy": 1.5}}, "sexy"),
+    ({"sexual_keywords": {"sexy": 0}}, "sexy"),
+    ({"sexual_keywords": {"sexy": True}}, "sexy"),
+    ({"sexual_replies": [["a"], ["b"], [3]]}, "sexual_replies"),
+    ({"intents": {"greeting": {"examples": ["salut", 42], "replies": ["coucou"]}}}, "examples"),
+    ({"intents": {"greeting": {"examples": ["salut"], "replies": []}}}, "replies"),
+    ({"thresholds": {"end_messages": "20"}}, "end_messages"),
+    ({"thresholds": {"end_messages": 20.5}}, "end_messages"),
+    ({"thresholds": {"hint_probability": 1.5}}, "hint_probability"),
+    ({"thresholds": {"inconnu": 1}}, "seuils"),
+    ({"temperature": "chaud"}, "temperature"),
+    ({"intent_threshold": None}, "intent_threshold"),
+])
+def test_invalid_profiles_are_rejected_at_load(profiles_file, changes, error):
+    write_config(profiles_file, edited(**changes), 1_000_001)
+    with pytest.raises(ValueError, match=error):
+        main.load_profiles(str(profiles_file))
+
+def test_valid_edit_is_picked_up(profiles_file):
+    registry = main.ProfileRegistry(str(profiles_file))
+    assert not asyncio.run(registry.reload_if_changed())
+
+    write_config(profiles_file, edited(first_reply="Coucou, nouvelle version !"), 1_000_001)
+    assert asyncio.run(registry.reload_if_changed())
+    assert registry.get("alicia").first_reply == "Coucou, nouvelle version !"
+
+def test_invalid_edit_keeps_the_previous_profiles(profiles_file, caplog):
+    registry = main.ProfileRegistry(str(profiles_file))
+    before = registry.get("alicia")
+
+    write_config(profiles_file, edited(sexual_keywords={"sexy": 0.5}), 1_000_001)
+    with caplog.at_level(logging.ERROR):
+        assert not asyncio.run(registry.reload_if_changed())
+    assert registry.get("alicia") is before
+    assert "Profils non rechargés" in caplog.text
+
+    profiles_file.write_text("{ pas du json", encoding="utf-8")
+    os.utime(profiles_file, (1_000_002, 1_000_002))
+    assert not asyncio.run(registry.reload_if_changed())
+    assert registry.get("alicia") is before
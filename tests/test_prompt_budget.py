@@ -0,0 +1,74 @@
+"""Construction des prompts : budget de tokens, résumé des échanges oubliés, préfixe pré-sérialisé"""
+import json
+
+import pytest
+
+import main
+
+@pytest.fixture
+def profile():
+    return main.profile_registry.get("alicia")
+
+def history_tokens(messages: list) -> int:
+    return sum(main.estimate_tokens(m["content"]) for m in messages[1:])
+
+def test_recent_history_fills_the_budget_newest_first(profile):
+    context = main.UserContext()
+    for index in range(8):
+        main.record_exchange(context, f"message {index} " + "x" * 300, f"réponse {index} " + "y" * 300)
+
+    messages = main.build_groq_messages("et maintenant ?", context, profile)
+
+    assert messages[0] is profile.system_message
+    assert messages[-1] == {"role": "user", "content": "et maintenant ?"}
+    assert history_tokens(messages) <= main.HISTORY_TOKEN_BUDGET
+    kept = [m["content"] for m in messages[1:-1] if m["role"] == "user"]
+    assert kept and kept[-1].startswith("message 7")  # Le plus récent est gardé
+    assert not any(text.startswith("message 0") for text in kept)
+    # Ordre chronologique rétabli
+    assert kept == sorted(kept, key=lambda text: int(text.split()[1]))
+
+def test_short_history_is_sent_whole(profile):
+    context = main.UserContext()
+    main.record_exchange(context, "salut", "coucou")
+    main.record_exchange(context, "ça va ?", "oui et toi ?")
+
+    messages = main.build_groq_messages("bien", context, profile)
+
+    assert [m["content"] for m in messages[1:]] == ["salut", "coucou", "ça va ?", "oui et toi ?", "bien"]
+
+def test_oversized_message_drops_history_but_is_still_sent(profile):
+    context = main.UserContext()
+    main.record_exchange(context, "salut", "coucou")
+    message = "z" * (main.HISTORY_TOKEN_BUDGET * 4)
+
+    messages = main.build_groq_messages(message, context, profile)
+
+    assert messages == [profile.system_message, {"role": "user", "content": message}]
+
+def test_dropped_exchanges_are_summarized_within_bounds(profile):
+    context = main.UserContext()
+    for index in range(40):
+        main.record_exchange(context, f"sujet numéro {index}", "ok")
+
+    assert len(context.conversation_history) == 8
+    assert "sujet numéro 31" in context.summary
+    assert len(context.summary) <= main.SUMMARY_MAX_CHARS + 2
+
+    messages = main.build_groq_messages("tu te souviens ?", context, profile)
+    assert messages[1]["role"] == "system"
+    assert messages[1]["content"].startswith("Résumé du début de la conversation")
+    assert history_tokens(messages) <= main.HISTORY_TOKEN_BUDGET
+
+def test_prefixed_payload_matches_plain_serialization(profile):
+    context = main.UserContext()
+    main.record_exchange(context, "salut « toi »", "coucou 😘")
+    messages = main.build_groq_messages("ça va ?", context, profile)
+
+    for stream in (False, True):
+        payload = json.loads(main.serialize_groq_payload(messages, profile, stream=stream))
+        expected = {**profile.groq_params, **({"stream": True} if stream else {}), "messages": messages}
+        assert payload == expected
+
+    other = json.loads(main.serialize_groq_payload(messages, profile, model="autre-modele"))
+    assert other["model"] == "autre-modele" and other["messages"] == messages
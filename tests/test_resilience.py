@@ -0,0 +1,152 @@
+"""Appels Groq face aux 429, 5xx et pannes : retries, pause du quota, disjoncteur, bascule"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import main
+
+class ScriptedGroq:
+    """Faux fournisseurs dont chaque réponse est écrite d'avance (par hôte)
+
+    Une entrée est un code HTTP, un (code, en-têtes) ou une exception httpx.
+    Une fois le script épuisé, le fournisseur répond 200.
+    """
+
+    def __init__(self, **scripts):
+        self.scripts = {host: list(script) for host, script in scripts.items()}
+        self.calls = {host: 0 for host in scripts}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.calls[host] += 1
+        step = self.scripts[host].pop(0) if self.scripts[host] else 200
+        if isinstance(step, Exception):
+            raise step
+        status, headers = step if isinstance(step, tuple) else (step, {})
+        if status != 200:
+            return httpx.Response(status, headers=headers, json={"error": {"message": "scripted"}})
+        return httpx.Response(200, headers=headers, json={
+            "choices": [{"message": {"content": f" réponse de {host} "}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        })
+
+@pytest.fixture
+def scripted(monkeypatch):
+    """Installe des fournisseurs scriptés : `scripted(a=[500, 200], b=[])`"""
+    monkeypatch.setattr(main, "backoff_delay", lambda attempt: 0.0)
+    saved = list(main.llm_providers)
+
+    def install(**scripts):
+        stub = ScriptedGroq(**scripts)
+        monkeypatch.setattr(main, "groq_client", httpx.AsyncClient(transport=httpx.MockTransport(stub.handler)))
+        main.llm_providers[:] = [main.LLMProvider(host, f"http://{host}/v1/chat/completions", "gsk_test")
+                                 for host in scripts]
+        return stub
+
+    yield install
+    main.llm_providers[:] = saved
+
+def request(priority: int = main.PRIORITY_BACKGROUND) -> tuple:
+    profile = main.profile_registry.get("alicia")
+    messages = [profile.system_message, {"role": "user", "content": "salut"}]
+    return asyncio.run(main.request_groq_completion(messages, profile, priority))
+
+def test_server_errors_are_retried_until_success(scripted):
+    stub = scripted(groq=[500, 502])
+    status, text, tokens = request()
+
+    assert (status, text, tokens) == (200, "réponse de groq", 15)
+    assert stub.calls["groq"] == 3
+    assert main.llm_providers[0].breaker.failures == 0  # Remis à zéro par le succès
+
+def test_rate_limit_pauses_the_provider_without_tripping_the_breaker(scripted):
+    stub = scripted(groq=[(429, {"retry-after": "0.2"})])
+    started = time.monotonic()
+    status, text, _ = request()
+
+    assert status == 200 and text == "réponse de groq"
+    assert stub.calls["groq"] == 2
+    assert time.monotonic() - started >= 0.2  # Retry-After respecté par le quota
+    assert main.llm_providers[0].breaker.failures == 0
+    assert main.llm_providers[0].health == 1.0
+
+def test_client_errors_are_not_retried(scripted):
+    stub = scripted(groq=[400])
+    assert request()[0] == 400
+    assert stub.calls["groq"] == 1
+
+def test_transport_errors_count_as_failures(scripted):
+    stub = scripted(groq=[httpx.ConnectError("refused")] * (main.GROQ_MAX_RETRIES + 1))
+    status, text, _ = request()
+
+    assert (status, text) == (503, None)
+    assert stub.calls["groq"] == main.GROQ_MAX_RETRIES + 1
+    assert main.llm_providers[0].health < 1.0
+
+def test_breaker_opens_after_repeated_failures_and_stops_calls(scripted):
+    stub = scripted(groq=[500] * main.GROQ_BREAKER_FAILURES)
+    while stub.scripts["groq"]:
+        request()
+    provider = main.llm_providers[0]
+    assert provider.breaker.is_open
+    calls = stub.calls["groq"]
+
+    assert request() == (503, None, 0)
+    assert stub.calls["groq"] == calls  # Coupé : aucun appel pendant le cooldown
+
+def test_breaker_lets_one_trial_through_after_cooldown(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    breaker = main.CircuitBreaker(failure_threshold=2, cooldown=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+
+    now[0] += 30
+    assert breaker.allow()
+    assert not breaker.allow()  # Un seul essai par période de cooldown
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+def test_failing_provider_fails_over_to_the_next(scripted):
+    stub = scripted(primary=[503] * 10, backup=[])
+    status, text, _ = request()
+
+    assert (status, text) == (200, "réponse de backup")
+    assert stub.calls == {"primary": 1, "backup": 1}
+
+def test_provider_health_recovers_without_traffic(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    provider = main.LLMProvider("groq", "http://groq/v1/chat/completions", "gsk_test")
+    for _ in range(5):
+        provider.record(False)
+    assert not provider.healthy
+
+    now[0] += main.LLM_HEALTH_HALF_LIFE
+    assert provider.healthy
+    now[0] += 10 * main.LLM_HEALTH_HALF_LIFE
+    assert provider.health > 0.99
+
+def test_traffic_fails_back_to_the_preferred_provider(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    primary = main.LLMProvider("primary", "http://primary/v1/chat/completions", "gsk_test")
+    backup = main.LLMProvider("backup", "http://backup/v1/chat/completions", "gsk_test")
+    monkeypatch.setattr(main, "llm_providers", [primary, backup])
+    for _ in range(main.GROQ_BREAKER_FAILURES):
+        primary.breaker.record_failure()
+        primary.record(False)
+    assert main.ranked_providers()[0] is backup
+
+    # Panne terminée : plus aucune requête ne lui parvient, mais le temps passe
+    now[0] += max(main.GROQ_BREAKER_COOLDOWN, 2 * main.LLM_HEALTH_HALF_LIFE)
+    assert main.ranked_providers()[0] is primary
+    assert primary.breaker.allow()  # L'essai du disjoncteur part vers lui
+    assert not primary.healthy  # Un seul essai à la fois
+    primary.breaker.record_success()
+    primary.record(True)
+    assert main.ranked_providers()[0] is primary
@@ -0,0 +1,79 @@
+"""Mode shard : analytics échangées en JSON, route protégée par le secret, configuration vérifiée"""
+import asyncio
+import json
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import main
+from test_snapshot import fill_analytics
+
+def test_json_round_trip_gives_the_same_merge():
+    fill_analytics()
+    payload = json.loads(json.dumps(main.encode_analytics(main.analytics)))
+    decoded = main.decode_analytics(payload)
+    assert "seen_users" not in payload
+
+    local = main.decode_analytics(main.encode_analytics(main.analytics))
+    remote = main.decode_analytics(main.encode_analytics(main.analytics))
+    main.merge_analytics(local, decoded)
+    main.merge_analytics(remote, main.analytics)
+    assert main.get_analytics_summary(local) == main.get_analytics_summary(remote)
+    assert main.get_analytics_summary(local)["general"]["total_users"] == 600
+
+@pytest.mark.parametrize("corrupt", [
+    lambda payload: payload.pop("daily_stats"),
+    lambda payload: payload["returning_users"].update(registers="pas du base64 !"),
+    lambda payload: payload["returning_users"].update(registers="AAAA"),
+    lambda payload: payload["session_durations_sketch"].update(buckets=["liste"]),
+    lambda payload: payload.update(total_users="beaucoup"),
+])
+def test_invalid_payload_is_rejected(corrupt):
+    fill_analytics()
+    payload = json.loads(json.dumps(main.encode_analytics(main.analytics)))
+    corrupt(payload)
+    with pytest.raises((ValueError, KeyError, TypeError, AttributeError)):
+        main.decode_analytics(payload)
+
+def test_counters_must_be_numbers():
+    assert main.decode_counters({"cache_hits": 3, "queue": {"depth": 1.5}}) == {"cache_hits": 3, "queue": {"depth": 1.5}}
+    with pytest.raises(TypeError):
+        main.decode_counters({"cache_hits": "__import__('os')"})
+
+@pytest.fixture
+def shard_mode(monkeypatch):
+    monkeypatch.setattr(main, "BOT_MODE", "shard")
+    monkeypatch.setattr(main, "WEBHOOK_SECRET", "shard-secret")
+    return monkeypatch
+
+def test_shard_analytics_route_requires_the_secret(shard_mode):
+    fill_analytics()
+
+    async def scenario():
+        async with TestClient(TestServer(main.create_webhook_server([], lambda: True))) as client:
+            anonymous = await client.get("/shard/analytics")
+            forged = await client.get("/shard/analytics", headers={"X-Telegram-Bot-Api-Secret-Token": "devine"})
+            allowed = await client.get("/shard/analytics",
+                                       headers={"X-Telegram-Bot-Api-Secret-Token": "shard-secret"})
+            return anonymous.status, forged.status, allowed.status, await allowed.json()
+
+    anonymous, forged, allowed, payload = asyncio.run(scenario())
+    assert (anonymous, forged, allowed) == (403, 403, 200)
+    assert main.decode_analytics(payload["analytics"])["total_users"] == 300
+
+def test_shard_mode_requires_a_secret(shard_mode):
+    shard_mode.setattr(main, "WEBHOOK_SECRET", None)
+    assert "WEBHOOK_SECRET" in main.webhook_config_error()
+
+def test_supervisor_fails_before_spawning_workers(monkeypatch):
+    monkeypatch.setattr(main, "BOT_MODE", "webhook")
+    monkeypatch.setattr(main, "WEBHOOK_URL", None)
+    monkeypatch.setattr(main, "WEBHOOK_SECRET", "s3cret_token-OK")
+    supervisor = main.ShardSupervisor([])
+
+    async def spawn(index: int):
+        raise AssertionError("aucun worker ne doit être lancé")
+
+    monkeypatch.setattr(supervisor, "spawn", spawn)
+    with pytest.raises(RuntimeError, match="WEBHOOK_URL"):
+        asyncio.run(supervisor.run())
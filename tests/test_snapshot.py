@@ -0,0 +1,104 @@
+"""Snapshots des analytics : aller-retour disque, fichier corrompu, jours en trop"""
+import asyncio
+import os
+import pickle
+import time
+from datetime import datetime
+
+import pytest
+
+import main
+
+def fill_analytics():
+    for user_id in range(1, 301):
+        main.log_metric("new_user")
+        main.log_metric("session_start")
+        main.log_metric("message", user_id)
+        main.log_metric("session_end", value=30.0 + user_id)
+        main.log_metric("conversation_length", value=user_id % 20 + 1)
+        if user_id % 3 == 0:
+            main.log_metric("returning_user", user_id)
+    main.log_metric("command", command="start")
+
+def empty_analytics(monkeypatch):
+    monkeypatch.setattr(main, "analytics", {
+        **main.analytics,
+        "total_users": 0, "total_messages": 0, "total_sessions": 0, "commands_used": {},
+        "daily_stats": main.OrderedDict(),
+        "conversation_lengths": main.RunningStats(), "conversation_lengths_sketch": main.DDSketch(),
+        "session_durations": main.RunningStats(), "session_durations_sketch": main.DDSketch(),
+        "returning_users": main.HyperLogLog(), "seen_users": main.BloomFilter(10000),
+        "start_time": datetime.now()
+    })
+
+def test_snapshot_round_trip_restores_the_summary(tmp_path, monkeypatch):
+    path = str(tmp_path / "analytics.snapshot")
+    monkeypatch.setattr(main, "ANALYTICS_SNAPSHOT_PATH", path)
+    fill_analytics()
+    main.analytics["seen_users"].add("alicia:1")
+    before = main.get_analytics_summary()
+
+    asyncio.run(main.save_analytics_snapshot())
+    empty_analytics(monkeypatch)
+    assert main.get_analytics_summary()["general"]["total_users"] == 0
+
+    assert main.load_analytics_snapshot(path)
+    after = main.get_analytics_summary()
+    del before["general"]["uptime_hours"], after["general"]["uptime_hours"]
+    for section in ("general", "today", "averages", "popular_commands"):
+        assert after[section] == before[section], section
+    assert before["general"]["total_users"] == 300
+    assert not main.analytics["seen_users"].add("alicia:1")  # Toujours connu après redémarrage
+
+def test_missing_or_corrupt_snapshot_is_ignored(tmp_path):
+    assert not main.load_analytics_snapshot(str(tmp_path / "absent"))
+
+    corrupt = tmp_path / "corrupt"
+    corrupt.write_bytes(main.SNAPSHOT_MAGIC + b"pas du zlib")
+    assert not main.load_analytics_snapshot(str(corrupt))
+    foreign = tmp_path / "foreign"
+    foreign.write_bytes(b"autre chose")
+    assert not main.load_analytics_snapshot(str(foreign))
+    assert main.analytics["total_users"] == 0
+
+def test_snapshot_keeps_only_recent_days(tmp_path, monkeypatch):
+    path = str(tmp_path / "analytics.snapshot")
+    monkeypatch.setattr(main, "ANALYTICS_SNAPSHOT_PATH", path)
+    days = [f"2020-{day // 28 + 1:02d}-{day % 28 + 1:02d}" for day in range(40)]
+    for day in days:
+        main.analytics["daily_stats"][day] = main.new_daily_stats()
+    asyncio.run(main.save_analytics_snapshot())
+
+    monkeypatch.setattr(main, "ANALYTICS_DAYS", 7)
+    empty_analytics(monkeypatch)
+    assert main.load_analytics_snapshot(path)
+    assert len(main.analytics["daily_stats"]) == 7
+    assert list(main.analytics["daily_stats"]) == days[-7:]
+
+@pytest.mark.benchmark
+def test_bench_snapshot_at_1m_users(tmp_path, monkeypatch, report):
+    """Taille et temps de sauvegarde / rechargement après un million d'utilisateurs distincts"""
+    path = str(tmp_path / "analytics.snapshot")
+    monkeypatch.setattr(main, "ANALYTICS_SNAPSHOT_PATH", path)
+    monkeypatch.setitem(main.analytics, "seen_users", main.BloomFilter(main.ANALYTICS_SEEN_CAPACITY))
+    users = 1_000_000
+    for user_id in range(1, users + 1):
+        main.log_metric("new_user")
+        main.log_metric("message", user_id)
+        main.log_metric("conversation_length", value=user_id % 20 + 1)
+        main.log_metric("session_end", value=30.0 + user_id % 600)
+        main.analytics["seen_users"].add(f"alicia:{user_id}")
+
+    started = time.perf_counter()
+    pickle.dumps(main.analytics, protocol=pickle.HIGHEST_PROTOCOL)
+    report("pickle sur la boucle", (time.perf_counter() - started) * 1e3, "ms")
+    started = time.perf_counter()
+    asyncio.run(main.save_analytics_snapshot())
+    report("sauvegarde complète (zlib, fsync)", (time.perf_counter() - started) * 1e3, "ms")
+    report("taille sur disque", os.path.getsize(path) / 1e3, "Ko")
+
+    empty_analytics(monkeypatch)
+    started = time.perf_counter()
+    assert main.load_analytics_snapshot(path)
+    report("rechargement", (time.perf_counter() - started) * 1e3, "ms")
+    assert main.analytics["total_users"] == users
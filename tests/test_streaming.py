@@ -0,0 +1,91 @@
+"""Réponses en streaming : les pauses de frappe ne comptent pas dans le délai Groq"""
+import asyncio
+import json
+import time
+
+import httpx
+
+import main
+
+def test_slow_typing_does_not_cut_the_stream(fake_groq, monkeypatch):
+    monkeypatch.setattr(main, "GROQ_DEADLINE", 0.3)
+    profile = main.profile_registry.get("alicia")
+    messages = [profile.system_message, {"role": "user", "content": "raconte"}]
+    shown = []
+
+    async def on_partial(text: str):
+        shown.append(text)
+        await asyncio.sleep(0.4)  # Frappe plus longue que GROQ_DEADLINE
+
+    async def scenario():
+        async with fake_groq(latency=0.02):
+            requests_before = main.STAGE_GROQ_REQUEST.sum
+            result = await main.stream_groq_completion(messages, profile, main.PRIORITY_CONVERSATION, on_partial)
+            return result, main.STAGE_GROQ_REQUEST.sum - requests_before, main.llm_providers[0]
+
+    (status, text, tokens), request_time, provider = asyncio.run(scenario())
+
+    assert status == 200
+    assert text.endswith("Et toi ça va ?")  # Réponse complète, pas tronquée
+    assert shown and text.startswith(shown[0])
+    assert tokens > 0
+    assert provider.breaker.failures == 0 and provider.health == 1.0
+    assert request_time < 0.3  # Lecture seule, sans les pauses
+
+def test_server_error_is_returned_without_partials(fake_groq):
+    profile = main.profile_registry.get("alicia")
+    messages = [profile.system_message, {"role": "user", "content": "raconte"}]
+
+    async def on_partial(text: str):
+        raise AssertionError("rien ne doit être affiché")
+
+    async def scenario():
+        async with fake_groq(errors=1.0):
+            return await main.stream_groq_completion(messages, profile, main.PRIORITY_CONVERSATION, on_partial), \
+                main.llm_providers[0]
+
+    (status, text, _), provider = asyncio.run(scenario())
+
+    assert (status, text) == (500, None)
+    assert provider.breaker.failures == 1
+
+class CutStream(httpx.AsyncByteStream):
+    """Flux SSE qui se coupe (erreur réseau) au milieu de la deuxième phrase"""
+
+    async def __aiter__(self):
+        for word in ("Première phrase. ", "Deuxième phr"):
+            chunk = {"choices": [{"delta": {"content": word}}]}
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        raise httpx.ReadError("connexion coupée")
+
+def test_cut_stream_keeps_only_shown_sentences_and_is_not_cached(monkeypatch):
+    monkeypatch.setattr(main, "STREAMING_REPLIES", True)
+    monkeypatch.setattr(main, "groq_client", httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, stream=CutStream()))))
+    profile = main.profile_registry.get("alicia")
+    context = main.UserContext()
+
+    async def on_partial(text: str):
+        pass
+
+    reply = asyncio.run(main.get_groq_response("raconte", 1, context, profile, on_partial=on_partial))
+
+    assert reply == "Première phrase."  # Sans le fragment "Deuxième phr"
+    assert context.conversation_history[-1]["alicia"] == "Première phrase."
+    messages = main.build_groq_messages("raconte", main.UserContext(), profile)
+    assert main.response_cache.get(profile.prompt_key, messages) is None  # Ne doit resservir à personne
+
+def test_failure_after_a_shown_sentence_keeps_the_visible_text(monkeypatch, telegram):
+
+    async def failing_response(message, user_id, profile, on_partial=None):
+        await on_partial("Première phrase.")
+        return "J'ai la tête ailleurs ! 😅 Tu disais quoi ?", "groq"  # Exception dans get_groq_response
+
+    monkeypatch.setattr(main, "get_alicia_response", failing_response)
+    update = telegram.update(7, "raconte")
+    now = time.monotonic()
+    turn = main.PendingTurn(("alicia", 7), ["raconte"], update, telegram.context, now - 5, now - 5)
+
+    asyncio.run(main.answer_turn(turn))
+    assert telegram.sent == ["Première phrase."]
+    assert telegram.edits == []
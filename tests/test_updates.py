@@ -0,0 +1,69 @@
+"""Traitement des updates : ordre conservé par chat, chats en parallèle, plafond global"""
+import asyncio
+import random
+from types import SimpleNamespace
+
+import main
+
+def update_from(chat_id: int) -> SimpleNamespace:
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id))
+
+class Handlers:
+    """Faux handlers : notent l'ordre de traitement et la concurrence observée"""
+
+    def __init__(self):
+        self.done = {}
+        self.running = 0
+        self.max_running = 0
+        self.running_per_chat = {}
+        self.max_per_chat = 0
+
+    async def handle(self, chat_id: int, index: int, delay: float):
+        self.running += 1
+        self.running_per_chat[chat_id] = self.running_per_chat.get(chat_id, 0) + 1
+        self.max_running = max(self.max_running, self.running)
+        self.max_per_chat = max(self.max_per_chat, self.running_per_chat[chat_id])
+        await asyncio.sleep(delay)
+        self.running -= 1
+        self.running_per_chat[chat_id] -= 1
+        self.done.setdefault(chat_id, []).append(index)
+
+def run_updates(processor, handlers: Handlers, chats: int, per_chat: int):
+    rng = random.Random(4)
+
+    async def scenario():
+        await asyncio.gather(*(
+            processor.process_update(update_from(chat_id), handlers.handle(chat_id, index, rng.uniform(0, 0.01)))
+            for index in range(per_chat) for chat_id in range(chats)
+        ))
+
+    asyncio.run(scenario())
+
+def test_each_chat_keeps_its_order_while_chats_run_concurrently():
+    processor = main.PerChatUpdateProcessor(max_concurrent_updates=64, max_pending_updates=1000)
+    handlers = Handlers()
+    run_updates(processor, handlers, chats=20, per_chat=10)
+
+    assert all(indexes == list(range(10)) for indexes in handlers.done.values())
+    assert handlers.max_per_chat == 1  # Jamais deux messages d'un même chat à la fois
+    assert handlers.max_running > 1  # Mais plusieurs chats en parallèle
+    assert processor.in_flight == 0
+    assert processor._chat_locks == {}  # Verrous libérés une fois le chat inactif
+
+def test_global_concurrency_cap_holds():
+    processor = main.PerChatUpdateProcessor(max_concurrent_updates=3, max_pending_updates=1000)
+    handlers = Handlers()
+    run_updates(processor, handlers, chats=30, per_chat=2)
+
+    assert handlers.max_running == 3
+    assert sum(len(indexes) for indexes in handlers.done.values()) == 60
+
+def test_updates_without_chat_are_processed_too():
+    processor = main.PerChatUpdateProcessor(max_concurrent_updates=2, max_pending_updates=10)
+    handled = []
+
+    async def handle():
+        handled.append(True)
+
+    asyncio.run(processor.process_update(SimpleNamespace(effective_chat=None), handle()))
+    assert handled == [True]
@@ -0,0 +1,30 @@
+"""Mode webhook : configuration obligatoire avant d'exposer une route publique"""
+import pytest
+
+import main
+
+@pytest.fixture
+def webhook_mode(monkeypatch):
+    monkeypatch.setattr(main, "BOT_MODE", "webhook")
+    monkeypatch.setattr(main, "WEBHOOK_URL", "https://alicia.example.com")
+    monkeypatch.setattr(main, "WEBHOOK_SECRET", "s3cret_token-OK")
+    return monkeypatch
+
+def test_complete_webhook_config_is_accepted(webhook_mode):
+    assert main.webhook_config_error() is None
+
+@pytest.mark.parametrize("secret", [None, "", "avec espace", "x" * 257])
+def test_webhook_mode_requires_a_valid_secret(webhook_mode, secret):
+    webhook_mode.setattr(main, "WEBHOOK_SECRET", secret)
+    assert "WEBHOOK_SECRET" in main.webhook_config_error()
+    with pytest.raises(RuntimeError, match="WEBHOOK_SECRET"):
+        main.create_webhook_server([], lambda: True)
+
+def test_webhook_mode_requires_a_public_url(webhook_mode):
+    webhook_mode.setattr(main, "WEBHOOK_URL", None)
+    assert "WEBHOOK_URL" in main.webhook_config_error()
+
+def test_polling_needs_no_webhook_config(monkeypatch):
+    monkeypatch.setattr(main, "BOT_MODE", "polling")
+    monkeypatch.setattr(main, "WEBHOOK_SECRET", None)
+    assert main.webhook_config_error() is None